@@ -72,7 +72,7 @@
 #             try:
 #                 print(type(img))
 #                 img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-#                 encodings = face_recognition.face_encodings(img)
+#                 encodings = face_encodings(img)
 #                 if encodings:
 #                     encodeList.append(encodings[0])
 #                 else:
@@ -98,88 +98,41 @@
 
 
 
+import logging
 import os
 import cv2
-import face_recognition
-import pickle
-import subprocess
+from enrollment import enroll_folder
+from face_backends import face_encodings
+
+logger = logging.getLogger(__name__)
 
 
 def findEncodings(images):
     encodeList = []
     for img in images:
         try:
-            print(type(img))
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            encodings = face_recognition.face_encodings(img)
+            encodings = face_encodings(img)
             if encodings:
                 encodeList.append(encodings[0])
             else:
-                print("No faces found in image.")
+                logger.warning("No faces found in image.")
         except Exception as e:
-            print(f"Error processing image: {e}")
-    print("Generated encodings:",encodeList)
+            logger.error("Error processing image: %s", e)
+    logger.debug("Generated %d encodings.", len(encodeList))
     return encodeList
 
-def EG(image_path):
-    #print(f"Processing image: {image_path}")
-    # Load existing encodings from file if available
-    encoding_file_path = 'EncodeFile.p'
-
-    if os.path.exists(encoding_file_path):
-        with open(encoding_file_path, 'rb') as file:
-            encodeListKnownWithNames = pickle.load(file)
-        encodeListKnown, empNames = encodeListKnownWithNames
+# Enroll a newly captured image. Only images added or changed since the last
+# run are encoded (see enrollment.enroll_folder); the folder is the one the
+# image was saved into. on_change receives the new encodings for the live gallery;
+# store (e.g. a GalleryRepository) is where they are saved, by default the local store.
+def EG(image_path, on_change=None, store=None):
+    folderPath = os.path.dirname(image_path) or 'Employee_Images'
+    if store is None:
+        report = enroll_folder(folderPath, progress=False, on_change=on_change)
     else:
-        encodeListKnown = []
-        empNames = []
-
-    # Importing Employee Images
-    folderPath = 'Employee_Images'
-    pathlist = os.listdir(folderPath)
-    print(pathlist)
-
-    if not pathlist:
-        # Call the capture_image script using subprocess
-        subprocess.run(['python', 'webcam.py'], check=True)
-        # After capturing images, update the pathlist
-        pathlist = os.listdir(folderPath)
-
-    imgList = []
-    #name_to_encoding = {name: encoding for name, encoding in zip(empNames, encodeListKnown)}
-
-    # Check if the new image is already encoded
-    new_image_name = os.path.splitext(os.path.basename(image_path))[0]
-
-    if new_image_name not in empNames:
-        imgList.append(cv2.imread(image_path))
-        empNames.append(new_image_name)
-
-    # Add existing images from the folder, but skip if already encoded
-    for path in pathlist:
-        emp_name = os.path.splitext(path)[0]
-        if emp_name not in empNames:
-            imgList.append(cv2.imread(os.path.join(folderPath, path)))
-            empNames.append(emp_name)
-
-    # Generate encodings only for new images
-    if imgList:
-        print("Encoding Started..........")
-        try:
-            new_encodings = findEncodings(imgList)
-            encodeListKnown.extend(new_encodings)
-        except Exception as e:
-            print(f"Error during encoding: {e}")
-            pass
-
-        #print("Encodings:", encodeListKnown)
-        print("Encoding Ended............")
-
-        # Save the updated encodings and employee names
-        encodeListKnownWithNames = [encodeListKnown, empNames]
-        with open(encoding_file_path, 'wb') as file:
-            pickle.dump(encodeListKnownWithNames, file)
-        print("File Saved")
+        report = enroll_folder(folderPath, progress=False, on_change=on_change, store=store)
+    logger.info("Enrollment finished: %s", report)
 
 #IPTH = "Employee_Images/Varun_1.jpg"
 #EG(IPTH)
\ No newline at end of file
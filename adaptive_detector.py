@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from face_backends import create_detector
+from metrics import faces_total, stage_seconds
+
+# Face detection settings; camera_config['detection'] overrides them per camera
+detection_config = {
+    'backend': 'hog',          # face_backends detector: hog, res10, yunet, haar or auto (last calibration)
+    'backend_options': {},     # passed to the detector, e.g. {"upsample": 2} or {"confidence": 0.5}
+    'min_scale': 0.25,         # never detect on a smaller image than this
+    'max_scale': 1.0,          # nor on a larger one
+    'scale': 0.25,             # starting scale
+    'target_face_px': 80,      # height the smallest recent face should have on the detection image
+    'budget_ms': 80.0,         # scale is lowered while detections take longer than this
+    'face_window': 30.0,       # seconds of face sizes the scale is based on
+    'rois': [],                # [(x0, y0, x1, y1)] as fractions of the frame; empty = whole frame
+    'motion_gate': True,       # skip detection when nothing in the ROIs moved
+    'motion_threshold': 12,    # per-pixel difference (0-255) that counts as change
+    'motion_min_area': 0.002,  # fraction of ROI pixels that must change
+}
+
+MOTION_WIDTH = 160
+
+
+# Runs the face detector only where and when it is useful: inside the configured
+# regions of interest, only on frames that differ from the previous one, and at
+# a scale that keeps the smallest recently seen face detectable without going
+# over the time budget. Boxes are returned in full-frame pixels.
+class AdaptiveDetector:
+
+    def __init__(self, backend='hog', backend_options=None, min_scale=0.25, max_scale=1.0, scale=0.25,
+                 target_face_px=80, budget_ms=80.0, face_window=30.0, rois=(), motion_gate=True,
+                 motion_threshold=12, motion_min_area=0.002):
+        self.backend = create_detector(backend, **(backend_options or {}))
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale = min(max(scale, min_scale), max_scale)
+        self.target_face_px = target_face_px
+        self.budget = budget_ms / 1000.0
+        self.face_window = face_window
+        self.rois = [tuple(roi) for roi in rois]
+        self.motion_gate = motion_gate
+        self.motion_threshold = motion_threshold
+        self.motion_min_area = motion_min_area
+
+        self.detections = 0
+        self.skipped_no_motion = 0
+        self.faces_found = 0
+        self._previous = None
+        self._mask = None
+        self._faces = deque()                # (timestamp, smallest face height in full-frame pixels)
+        self._costs = deque(maxlen=30)       # (seconds, pixels examined)
+        self._lock = threading.Lock()
+
+    # Pixel rectangles (x0, y0, x1, y1) to run detection on
+    def regions(self, shape):
+        height, width = shape[:2]
+        if not self.rois:
+            return [(0, 0, width, height)]
+        return [(int(x0 * width), int(y0 * height), int(x1 * width), int(y1 * height))
+                for x0, y0, x1, y1 in self.rois]
+
+    # Cheap frame differencing on a thumbnail, limited to the ROIs
+    def has_motion(self, frame):
+        height, width = frame.shape[:2]
+        size = (MOTION_WIDTH, max(1, int(height * MOTION_WIDTH / width)))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        previous, self._previous = self._previous, gray
+        if previous is None or previous.shape != gray.shape:
+            self._mask = None
+            return True
+
+        if self._mask is None:
+            self._mask = np.zeros(gray.shape, dtype=bool)
+            for x0, y0, x1, y1 in self.regions(gray.shape):
+                self._mask[y0:y1, x0:x1] = True
+        changed = (cv2.absdiff(gray, previous) > self.motion_threshold) & self._mask
+        return np.count_nonzero(changed) >= self.motion_min_area * max(np.count_nonzero(self._mask), 1)
+
+    # Boxes (top, right, bottom, left) in full-frame pixels, or None when the
+    # motion gate skipped the frame
+    def detect(self, frame):
+        with self._lock:
+            if self.motion_gate and not self.has_motion(frame):
+                self.skipped_no_motion += 1
+                return None
+            scale = self.scale
+
+        start = time.perf_counter()
+        boxes = []
+        pixels = 0
+        for x0, y0, x1, y1 in self.regions(frame.shape):
+            region = frame[y0:y1, x0:x1]
+            if region.size == 0:
+                continue
+            small = cv2.resize(region, (0, 0), None, scale, scale) if scale != 1.0 else region
+            pixels += small.shape[0] * small.shape[1]
+            for top, right, bottom, left in self.backend.detect(small):
+                boxes.append((int(top / scale) + y0, int(right / scale) + x0,
+                              int(bottom / scale) + y0, int(left / scale) + x0))
+
+        cost = time.perf_counter() - start
+        stage_seconds.observe(cost, stage='detect')
+        faces_total.inc(len(boxes), outcome='detected')
+        with self._lock:
+            self.detections += 1
+            self.faces_found += len(boxes)
+            self._costs.append((cost, pixels))
+            self._adapt(boxes)
+        return boxes
+
+    # Pick the next scale: large enough for the smallest recent face to reach
+    # target_face_px (or the largest allowed while no faces were seen, to find
+    # distant ones), but small enough to stay inside the time budget.
+    def _adapt(self, boxes):
+        now = time.time()
+        if boxes:
+            self._faces.append((now, min(bottom - top for top, right, bottom, left in boxes)))
+        while self._faces and now - self._faces[0][0] > self.face_window:
+            self._faces.popleft()
+
+        if self._faces:
+            smallest = max(min(height for _, height in self._faces), 1)
+            desired = self.target_face_px / smallest
+        else:
+            desired = self.max_scale
+
+        average_cost = sum(cost for cost, _ in self._costs) / len(self._costs)
+        if average_cost > self.budget:
+            # Detection time grows with the pixel count, i.e. with scale squared
+            desired = min(desired, self.scale * (self.budget / average_cost) ** 0.5)
+
+        desired = min(max(desired, self.min_scale), self.max_scale)
+        # Move part of the way and round, so the scale doesn't jitter every frame
+        self.scale = round((self.scale + 0.5 * (desired - self.scale)) * 20) / 20
+        self.scale = min(max(self.scale, self.min_scale), self.max_scale)
+
+    def stats(self):
+        with self._lock:
+            costs = list(self._costs)
+        return {
+            'backend': self.backend.name,
+            'scale': self.scale,
+            'rois': len(self.rois),
+            'detections': self.detections,
+            'skipped_no_motion': self.skipped_no_motion,
+            'faces_found': self.faces_found,
+            'avg_detect_ms': round(1000 * sum(c for c, _ in costs) / len(costs), 2) if costs else 0.0,
+            'max_detect_ms': round(1000 * max(c for c, _ in costs), 2) if costs else 0.0,
+            'avg_pixels': int(sum(p for _, p in costs) / len(costs)) if costs else 0,
+        }
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from datetime import date
+
+from db_connection import get_marked_employees
+from metrics import deduped_total
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the same person is tried again after an attempt that did not mark
+ATTENDANCE_COOLDOWN = 30
+
+
+# In-process record of who is already marked today, so repeat sightings skip the
+# snapshot write and every DB round trip. Entries are keyed by (employee, date)
+# and the set is dropped when the date changes.
+class AttendanceCache:
+
+    def __init__(self, cooldown=ATTENDANCE_COOLDOWN):
+        self.cooldown = cooldown
+        self.hits = 0
+        self.cooldown_skips = 0
+        self.misses = 0
+        self._day = date.today()
+        self._marked = set()
+        self._last_attempt = {}
+        self._lock = threading.Lock()
+
+    def _roll_over(self):
+        today = date.today()
+        if today != self._day:
+            self._day = today
+            self._marked.clear()
+            self._last_attempt.clear()
+
+    # Load today's marks from the database so a restart does not re-mark anyone
+    def warm(self, connection):
+        names = get_marked_employees(connection, date.today())
+        with self._lock:
+            self._roll_over()
+            self._marked.update((name, self._day) for name in names)
+        logger.info("Attendance cache warmed with %d employees.", len(names))
+
+    # True if this sighting should go to the database; records the attempt
+    def should_mark(self, employee_name):
+        now = time.monotonic()
+        with self._lock:
+            self._roll_over()
+            if (employee_name, self._day) in self._marked:
+                self.hits += 1
+                deduped_total.inc(reason='already_marked')
+                return False
+            last = self._last_attempt.get(employee_name)
+            if last is not None and now - last < self.cooldown:
+                self.cooldown_skips += 1
+                deduped_total.inc(reason='cooldown')
+                return False
+            self._last_attempt[employee_name] = now
+            self.misses += 1
+            return True
+
+    def is_marked(self, employee_name):
+        with self._lock:
+            self._roll_over()
+            return (employee_name, self._day) in self._marked
+
+    # Remember the result of an attendance write. 'queued' counts as marked so the
+    # person is not submitted again while the writer works; any other failure
+    # drops the entry and leaves the cooldown running before the next try.
+    # Results for another day (spool replays, backfills) say nothing about today.
+    def record(self, employee_name, result):
+        with self._lock:
+            self._roll_over()
+            capture_datetime = (result or {}).get('capture_datetime')
+            if capture_datetime and str(capture_datetime)[:10] != self._day.isoformat():
+                return
+            if result and result.get('status') in ('marked', 'already_marked', 'queued'):
+                self._marked.add((employee_name, self._day))
+                self._last_attempt.pop(employee_name, None)
+            else:
+                self._marked.discard((employee_name, self._day))
+                self._last_attempt[employee_name] = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'marked_today': len(self._marked),
+                'hits': self.hits,
+                'cooldown_skips': self.cooldown_skips,
+                'misses': self.misses,
+            }
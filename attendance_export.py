@@ -0,0 +1,243 @@
+import argparse
+import csv
+import io
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from db_connection import day_range
+from snapshot_store import store as snapshot_store
+
+# Attendance export that never holds more than one chunk of rows in memory.
+# Rows are streamed from the database (unbuffered cursor, fetchmany), the sheet
+# is written as they arrive and images are either written to a folder by a
+# thread pool or packed into a zip next to the sheet.
+export_config = {
+    'chunk_size': 500,     # rows per fetchmany
+    'image_workers': 4,    # threads reading and writing snapshots
+    'export_folder': 'Attendance_Records',
+}
+
+COLUMNS = ['employee_name', 'emp_id', 'capture_datetime', 'image']
+
+
+# Rows of employee_images between two dates (inclusive), oldest first. employees
+# filters by name; "Varun" also matches the per-image names like "Varun_2".
+def iter_records(connection, start_date, end_date=None, employees=None, with_images=True,
+                 chunk_size=export_config['chunk_size']):
+    day_start, day_end = day_range(start_date, end_date)
+    columns = "employee_name, emp_id, DATE_FORMAT(capture_datetime, '%Y-%m-%d %H:%i:%S') AS capture_datetime"
+    if with_images:
+        columns += ", image_ref, image_blob, employee_image"
+    query = f"SELECT {columns} FROM employee_images WHERE capture_datetime >= %s AND capture_datetime < %s"
+    params = [day_start, day_end]
+    if employees:
+        query += " AND (" + " OR ".join(["employee_name = %s OR employee_name LIKE %s ESCAPE '!'"] * len(employees)) + ")"
+        for name in employees:
+            params += [name, name.replace('!', '!!').replace('%', '!%').replace('_', '!_') + '!_%']
+    query += " ORDER BY capture_datetime, id"
+
+    # Unbuffered: MySQL sends rows as they are fetched instead of all at once
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    finished = False
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                finished = True
+                return
+            yield rows
+    finally:
+        if not finished and hasattr(connection, 'consume_results'):
+            # Abandoned half way: drain the result so the connection is reusable
+            connection.consume_results()
+        cursor.close()
+
+
+def image_filename(record):
+    moment = datetime.strptime(record['capture_datetime'], '%Y-%m-%d %H:%M:%S')
+    return f"{record['employee_name']}_{moment.strftime('%Y-%m-%d_%H-%M-%S')}.jpg"
+
+
+def export_name(start_date, end_date=None):
+    return f"attendance_report_{start_date}" + (f"_to_{end_date}" if end_date and end_date != start_date else '')
+
+
+# Spreadsheet written row by row: csv to any binary stream, xlsx through
+# openpyxl's write-only mode (rows go to a temp file, not into memory)
+class SheetWriter:
+
+    def __init__(self, fmt, stream=None, path=None):
+        self.fmt = fmt
+        self.path = path
+        if fmt == 'csv':
+            self._text = io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+            self._csv = csv.writer(self._text)
+            self._csv.writerow(COLUMNS)
+        elif fmt == 'xlsx':
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet('Attendance')
+            self._sheet.append(COLUMNS)
+        else:
+            raise ValueError(f"Unknown export format {fmt}")
+
+    def write(self, record, image=None):
+        row = [record['employee_name'], record['emp_id'], record['capture_datetime'], image or '']
+        if self.fmt == 'csv':
+            self._csv.writerow(row)
+        else:
+            self._sheet.append(row)
+
+    def close(self):
+        if self.fmt == 'csv':
+            self._text.detach()
+        else:
+            self._workbook.save(self.path)
+
+
+# File-like sink for zipfile/csv whose content is drained chunk by chunk for a
+# streamed HTTP response. No tell(), so zipfile writes in streaming mode.
+class _ChunkBuffer(io.RawIOBase):
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def _file_chunks(path, size=64 * 1024):
+    with open(path, 'rb') as export_file:
+        while True:
+            data = export_file.read(size)
+            if not data:
+                return
+            yield data
+
+
+# Snapshot bytes for every record of a chunk, read in parallel
+def _read_images(executor, records):
+    return list(executor.map(snapshot_store.read, records))
+
+
+# Bytes of an export, produced as the rows come in. With images the result is a
+# zip holding the sheet and an images/ folder; without, it is the bare sheet.
+def stream_export(connection, start_date, end_date=None, employees=None, fmt='csv', images=False,
+                  chunk_size=export_config['chunk_size'], image_workers=export_config['image_workers']):
+    buffer = _ChunkBuffer()
+    name = export_name(start_date, end_date)
+    records = iter_records(connection, start_date, end_date, employees, images, chunk_size)
+
+    if not images and fmt == 'csv':
+        sheet = SheetWriter('csv', buffer)
+        for chunk in records:
+            for record in chunk:
+                sheet.write(record)
+            yield buffer.drain()
+        sheet.close()
+        return
+
+    fd, sheet_path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(fd)
+    try:
+        if not images:
+            sheet = SheetWriter('xlsx', path=sheet_path)
+            for chunk in records:
+                for record in chunk:
+                    sheet.write(record)
+            sheet.close()
+            yield from _file_chunks(sheet_path)
+            return
+
+        with open(sheet_path, 'wb') as sheet_file, ThreadPoolExecutor(image_workers) as executor, \
+                zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            sheet = SheetWriter(fmt, sheet_file, sheet_path)
+            for chunk in records:
+                for record, image_data in zip(chunk, _read_images(executor, chunk)):
+                    filename = None
+                    if image_data:
+                        filename = 'images/' + image_filename(record)
+                        # JPEGs don't compress further; store them as they are
+                        archive.writestr(filename, image_data)
+                    sheet.write(record, filename)
+                yield buffer.drain()
+            sheet.close()
+            archive.write(sheet_path, f"{name}.{fmt}", zipfile.ZIP_DEFLATED)
+        yield buffer.drain()
+    finally:
+        os.remove(sheet_path)
+
+
+# Export to disk: the sheet in export_folder and each snapshot as its own JPEG
+# in image_folder, written by a thread pool. Returns a small report.
+def export_to_folder(connection, start_date, end_date=None, employees=None, fmt='xlsx',
+                     export_folder=export_config['export_folder'], image_folder=None,
+                     chunk_size=export_config['chunk_size'], image_workers=export_config['image_workers']):
+    os.makedirs(export_folder, exist_ok=True)
+    if image_folder:
+        os.makedirs(image_folder, exist_ok=True)
+    export_path = os.path.join(export_folder, f"{export_name(start_date, end_date)}.{fmt}")
+    report = {'path': export_path, 'rows': 0, 'images': 0}
+
+    def save_image(record):
+        image_data = snapshot_store.read(record)
+        if not image_data:
+            return None
+        filename = image_filename(record)
+        with open(os.path.join(image_folder, filename), 'wb') as image_file:
+            image_file.write(image_data)
+        return filename
+
+    with open(export_path, 'wb') as export_file, ThreadPoolExecutor(image_workers) as executor:
+        sheet = SheetWriter(fmt, export_file, export_path)
+        for chunk in iter_records(connection, start_date, end_date, employees, bool(image_folder), chunk_size):
+            filenames = executor.map(save_image, chunk) if image_folder else [None] * len(chunk)
+            for record, filename in zip(chunk, filenames):
+                sheet.write(record, filename)
+                report['rows'] += 1
+                report['images'] += filename is not None
+        sheet.close()
+    return report
+
+
+if __name__ == "__main__":
+    from db_connection import create_pool
+
+    parser = argparse.ArgumentParser(description="Export attendance records without loading them all into memory")
+    parser.add_argument('start', help="first day, yyyy-mm-dd")
+    parser.add_argument('end', nargs='?', default=None, help="last day, yyyy-mm-dd (default: same as start)")
+    parser.add_argument('--employee', action='append', default=[], help="only this employee (repeatable)")
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='xlsx')
+    parser.add_argument('--images', default=None, help="write snapshots into this folder")
+    parser.add_argument('--zip', default=None, help="write sheet and snapshots into this zip file instead")
+    parser.add_argument('--folder', default=export_config['export_folder'], help="where the sheet is written")
+    parser.add_argument('--chunk-size', type=int, default=export_config['chunk_size'])
+    parser.add_argument('--workers', type=int, default=export_config['image_workers'], help="image writer threads")
+    args = parser.parse_args()
+
+    pool = create_pool()
+    try:
+        with pool.connection() as connection:
+            if args.zip:
+                with open(args.zip, 'wb') as zip_file:
+                    for data in stream_export(connection, args.start, args.end, args.employee, args.format,
+                                              True, args.chunk_size, args.workers):
+                        zip_file.write(data)
+                print(f"Attendance records exported to {args.zip}")
+            else:
+                print(export_to_folder(connection, args.start, args.end, args.employee, args.format,
+                                       args.folder, args.images, args.chunk_size, args.workers))
+    finally:
+        pool.close()
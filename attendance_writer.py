@@ -0,0 +1,247 @@
+import base64
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import mysql.connector
+
+from db_connection import insert_attendance_batch
+from metrics import attendance_total, db_errors_total, queue_depth, stage_seconds
+from snapshot_store import store
+
+logger = logging.getLogger(__name__)
+
+spool_path = "attendance_spool.jsonl"
+dead_letter_path = "attendance_dead_letter.jsonl"
+
+# Lock wait timeout and deadlock: the transaction is worth retrying as it is
+_retry_errnos = (1205, 1213)
+
+
+# Whether a failed write may succeed later: the database or the network is
+# down or busy. Anything else (bad data, constraint violations) fails the same
+# way every time it is retried.
+def is_transient(err):
+    return isinstance(err, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError,
+                            mysql.connector.errors.PoolError)) or getattr(err, 'errno', None) in _retry_errnos
+
+
+# Drains attendance events on a background thread so the frame loop never waits
+# on MySQL. Events are written in batches with one transaction each, on a
+# connection checked out from the pool per flush; when the
+# database is unreachable they are appended to a local spool file and replayed,
+# oldest first, once a connection succeeds again. Replays are safe to repeat
+# because insert_attendance_batch skips people already marked that day. Only
+# transient errors spool; an event that fails for good is logged and moved to a
+# dead-letter file, so it cannot block the events after it.
+# on_result(employee_name, {'status', 'capture_datetime'}) gets every outcome
+# ('failed' for dead letters); replayed and backfilled events carry the day they
+# were captured.
+class AttendanceWriter(threading.Thread):
+
+    def __init__(self, pool, spool_path=spool_path, batch_size=50,
+                 max_wait=1.0, min_backoff=1.0, max_backoff=60.0, on_result=None, snapshot_store=store,
+                 employee_ids=None, dead_letter_path=dead_letter_path):
+        super().__init__(name='attendance-writer', daemon=True)
+        self.pool = pool
+        self.snapshot_store = snapshot_store
+        self.spool_path = spool_path
+        self.dead_letter_path = dead_letter_path
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_result = on_result
+        # Callable returning name -> emp_id, so batches skip the employee lookup
+        self.employee_ids = employee_ids
+        self.running = True
+
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dead_letters = 0
+
+        self._queue = queue.Queue()
+        queue_depth.set_function(self._queue.qsize, queue='attendance_writer')
+        self._backoff = min_backoff
+        self._next_attempt = 0.0
+        self._spool_lock = threading.Lock()
+
+    # Queue an attendance event with its JPEG snapshot bytes; never blocks
+    def submit(self, employee_name, snapshot, capture_datetime=None):
+        if capture_datetime is None:
+            capture_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._queue.put({
+            'employee_name': employee_name,
+            'snapshot': snapshot,
+            'capture_datetime': capture_datetime,
+        })
+
+    # Write the snapshot to the store (off the frame loop) and keep only the
+    # column values the insert needs
+    def _persist_snapshot(self, event):
+        if 'snapshot' in event:
+            event = dict(event)
+            event.update(self.snapshot_store.persist(event.pop('snapshot')))
+        return event
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while self.running or not self._queue.empty():
+            batch = [self._persist_snapshot(event) for event in self._next_batch()]
+            if not batch and not self.has_spool():
+                continue
+            if time.monotonic() < self._next_attempt:
+                # Still backing off: keep new events safe on disk meanwhile
+                self._spool(batch)
+                continue
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            with self.pool.connection() as connection:
+                self._replay(connection)
+                self._write(connection, batch)
+            self._backoff = self.min_backoff
+            self._next_attempt = 0.0
+        except Exception as e:
+            self.errors += 1
+            db_errors_total.inc(operation='attendance_batch')
+            if not is_transient(e):
+                logger.exception("Attendance writer failed on a batch")
+                self._dead_letter(batch, e)
+                return
+            logger.warning("Attendance writer error, retrying in %.0fs: %s", self._backoff, e)
+            self._spool(batch)
+            self._next_attempt = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _write(self, connection, events):
+        for start in range(0, len(events), self.batch_size):
+            self._write_batch(connection, events[start:start + self.batch_size])
+
+    def _write_batch(self, connection, events):
+        try:
+            with stage_seconds.time(stage='db_write'):
+                results = insert_attendance_batch(connection, events,
+                                                  self.employee_ids() if self.employee_ids else None)
+        except Exception as e:
+            if is_transient(e):
+                raise
+            connection.rollback()
+            if len(events) == 1:
+                self._dead_letter(events, e)
+            else:
+                # One bad event fails its whole batch: write them one by one to find it
+                for event in events:
+                    self._write_batch(connection, [event])
+            return
+        self.batches += 1
+        for _, status in results:
+            attendance_total.inc(result=status)
+        self.written += sum(1 for _, status in results if status == 'marked')
+        if self.on_result:
+            for event, status in results:
+                self.on_result(event['employee_name'],
+                               {'status': status, 'capture_datetime': event['capture_datetime']})
+
+    # Append events as JSON lines and fsync so they survive a crash
+    def _append_events(self, path, events, error=None):
+        with open(path, 'a', encoding='utf-8') as spool:
+            for event in events:
+                if event.get('image_blob') is not None:
+                    event = dict(event, image_blob=base64.b64encode(event['image_blob']).decode('ascii'))
+                if error is not None:
+                    event = dict(event, error=str(error))
+                spool.write(json.dumps(event) + '\n')
+            spool.flush()
+            os.fsync(spool.fileno())
+
+    def _spool(self, events):
+        if not events:
+            return
+        with self._spool_lock:
+            self._append_events(self.spool_path, events)
+        self.spooled += len(events)
+
+    # Events that can never be written, kept with the error for someone to look at
+    def _dead_letter(self, events, error):
+        if not events:
+            return
+        for event in events:
+            logger.error("Dropping attendance event for %s at %s to %s: %s", event['employee_name'],
+                         event['capture_datetime'], self.dead_letter_path, error)
+            attendance_total.inc(result='failed')
+        with self._spool_lock:
+            self._append_events(self.dead_letter_path, events, error)
+        self.dead_letters += len(events)
+        if self.on_result:
+            for event in events:
+                self.on_result(event['employee_name'],
+                               {'status': 'failed', 'capture_datetime': event['capture_datetime']})
+
+    # Write spooled events back to the database, then drop the spool file.
+    # The file is renamed first so events spooled during the replay are kept.
+    def _replay(self, connection):
+        replay_path = self.spool_path + '.replay'
+        with self._spool_lock:
+            # A replay file left over from an interrupted replay goes first
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return
+                os.replace(self.spool_path, replay_path)
+        events = []
+        with open(replay_path, encoding='utf-8') as spool:
+            for line in spool:
+                line = line.strip()
+                if line:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        logger.warning("Skipping unreadable spooled attendance event.")
+                        continue
+                    if event.get('image_blob') is not None:
+                        event['image_blob'] = base64.b64decode(event['image_blob'])
+                    events.append(event)
+        self._write(connection, events)
+        os.remove(replay_path)
+        self.replayed += len(events)
+        logger.info("Replayed %d spooled attendance events.", len(events))
+
+    def has_spool(self):
+        return os.path.exists(self.spool_path) or os.path.exists(self.spool_path + '.replay')
+
+    def stop(self, timeout=10.0):
+        self.running = False
+        self.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'dead_letters': self.dead_letters,
+            'spool_pending': self.has_spool(),
+        }
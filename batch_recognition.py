@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import face_recognition
+import numpy as np
+
+from enrollment import image_extensions, pool_context, zip_images
+from face_backends import face_encodings
+
+# Offline recognition of many still images (CCTV stills, badge photos): faces
+# are detected and encoded in a process pool, separate from the camera
+# processes, and matched against a gallery snapshot in the calling process.
+batch_config = {
+    'workers': None,           # worker processes (default: CPU count)
+    'in_flight_per_worker': 4, # images queued per worker; bounds memory for large batches
+    'upsample': 1,             # face_locations upsampling; 2 finds smaller faces, 4x slower
+}
+
+
+# Image sources as (name, path or bytes): files, folders (recursively) and zips
+def iter_images(sources):
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for filename in sorted(files):
+                    if filename.lower().endswith(image_extensions):
+                        path = os.path.join(root, filename)
+                        yield os.path.relpath(path, source), path
+        elif zipfile.is_zipfile(source):
+            yield from zip_images(source)
+        else:
+            yield os.path.basename(source), source
+
+
+# Detect and encode every face of one image; runs in the worker processes.
+# Returns (name, [box], [encoding], error message or None)
+def encode_faces_in_image(item, upsample=1):
+    name, source = item
+    try:
+        if isinstance(source, bytes):
+            img = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+        else:
+            img = cv2.imread(source)
+        if img is None:
+            return name, [], [], "unreadable image"
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        boxes = face_recognition.face_locations(img, number_of_times_to_upsample=upsample)
+        return name, boxes, face_encodings(img, boxes), None
+    except Exception as e:
+        return name, [], [], str(e)
+
+
+# Apply func to items in a process pool with a bounded number in flight,
+# yielding results as they complete (not in input order)
+def parallel_map(func, items, workers=None, in_flight_per_worker=4, **kwargs):
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context) as executor:
+        limit = workers * in_flight_per_worker
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(func, item, **kwargs))
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# One result dict per image: its faces with box, employee (or None) and distance
+def recognize_images(items, gallery, workers=batch_config['workers'],
+                     in_flight_per_worker=batch_config['in_flight_per_worker'], upsample=batch_config['upsample']):
+    for name, boxes, encodings, error in parallel_map(encode_faces_in_image, items, workers,
+                                                      in_flight_per_worker, upsample=upsample):
+        snapshot = gallery.snapshot
+        faces = []
+        for box, (index, distance) in zip(boxes, snapshot.match(encodings)):
+            faces.append({
+                'box': [int(v) for v in box],
+                'employee_name': snapshot.names[index] if index is not None else None,
+                'distance': round(distance, 4) if np.isfinite(distance) else None,
+            })
+        result = {'image': name, 'faces': faces}
+        if error:
+            result['error'] = error
+        yield result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recognize faces in image files, folders or zips; prints JSON lines")
+    parser.add_argument('sources', nargs='+')
+    parser.add_argument('--workers', type=int, default=batch_config['workers'], help="worker processes")
+    parser.add_argument('--upsample', type=int, default=batch_config['upsample'])
+    parser.add_argument('--local-only', action='store_true', help="use the local encoding store, not the database")
+    args = parser.parse_args()
+
+    from gallery_manager import GalleryManager
+
+    if args.local_only:
+        gallery = GalleryManager()
+    else:
+        from db_connection import create_pool
+        from gallery_repository import GalleryRepository
+        gallery = GalleryManager(encoding_store=GalleryRepository(create_pool()))
+
+    counts = {'images': 0, 'faces': 0, 'matched': 0, 'errors': 0}
+    for result in recognize_images(iter_images(args.sources), gallery, args.workers, upsample=args.upsample):
+        counts['images'] += 1
+        counts['faces'] += len(result['faces'])
+        counts['matched'] += sum(1 for face in result['faces'] if face['employee_name'])
+        counts['errors'] += 'error' in result
+        print(json.dumps(result), flush=True)
+    print(json.dumps({'summary': counts}))
@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from db_connection import create_pool, create_table, db_config, day_range
+from schema_migrations import apply_migrations
+
+# Seeds a year of synthetic attendance and times the attendance lookups before
+# and after the schema migrations. Runs against a throwaway SQLite file by
+# default; --backend mysql uses db_config with the --database override, which
+# must be an empty scratch database.
+
+
+def seed(connection, employees, days):
+    cursor = connection.cursor()
+    cursor.executemany("INSERT INTO employee (employee_name) VALUES (%s)",
+                       [(f"Employee{i}_1",) for i in range(employees)])
+    connection.commit()
+    cursor.execute("SELECT id, employee_name FROM employee")
+    staff = cursor.fetchall()
+
+    rng = random.Random(0)
+    first_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    total = 0
+    for day in range(days):
+        moment = first_day + timedelta(days=day)
+        rows = []
+        for emp_id, name in staff:
+            # Most people show up most days, somewhere between 8 and 10am
+            if rng.random() < 0.9:
+                capture = moment + timedelta(seconds=rng.randint(8 * 3600, 10 * 3600))
+                rows.append((emp_id, name, '%064x' % rng.getrandbits(256), capture.strftime("%Y-%m-%d %H:%M:%S")))
+        cursor.executemany("""
+            INSERT INTO employee_images (emp_id, employee_name, image_ref, capture_datetime)
+            VALUES (%s, %s, %s, %s)
+        """, rows)
+        total += len(rows)
+    connection.commit()
+    cursor.close()
+    return [name for _, name in staff], first_day, total
+
+
+def time_query(connection, query, make_params, repeats):
+    cursor = connection.cursor()
+    timings = []
+    for _ in range(repeats):
+        params = make_params()
+        start = time.perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    cursor.close()
+    return 1000 * statistics.median(timings)
+
+
+def run_queries(connection, names, first_day, days, repeats, migrated):
+    rng = random.Random(1)
+
+    def random_day():
+        return (first_day + timedelta(days=rng.randrange(days))).strftime("%Y-%m-%d")
+
+    queries = {
+        'image_exists (DATE_FORMAT)': (
+            "SELECT COUNT(*) FROM employee_images "
+            "WHERE employee_name = %s AND DATE_FORMAT(capture_datetime,'%Y-%m-%d') = %s",
+            lambda: (rng.choice(names), random_day())),
+        'image_exists (range)': (
+            "SELECT COUNT(*) FROM employee_images "
+            "WHERE employee_name = %s AND capture_datetime >= %s AND capture_datetime < %s",
+            lambda: (rng.choice(names),) + day_range(random_day())),
+        'export day (DATE)': (
+            "SELECT employee_name, capture_datetime FROM employee_images WHERE DATE(capture_datetime) = %s",
+            lambda: (random_day(),)),
+        'export day (range)': (
+            "SELECT employee_name, capture_datetime FROM employee_images "
+            "WHERE capture_datetime >= %s AND capture_datetime < %s",
+            lambda: day_range(random_day())),
+    }
+    if migrated:
+        queries['attendance_summary lookup'] = (
+            "SELECT emp_id FROM attendance_summary WHERE emp_id = %s AND attendance_date = %s",
+            lambda: (rng.randint(1, len(names)), random_day()))
+    return {label: time_query(connection, query, params, repeats) for label, (query, params) in queries.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark attendance queries before/after schema migrations")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--database', default='Employee_Details_bench', help="scratch MySQL database")
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    if args.backend == 'mysql':
+        db_config['database'] = args.database
+    pool = create_pool(backend=args.backend, sqlite_path=os.path.join(tmp_dir, 'bench.sqlite3'), pool_size=1)
+
+    with pool.connection() as connection:
+        create_table(connection, migrate=False)
+        apply_migrations(connection, target=1)
+
+        start = time.perf_counter()
+        names, first_day, total = seed(connection, args.employees, args.days)
+        print(f"Seeded {total} attendance rows for {args.employees} employees "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        before = run_queries(connection, names, first_day, args.days, args.repeats, migrated=False)
+        start = time.perf_counter()
+        apply_migrations(connection)
+        print(f"Migrations took {time.perf_counter() - start:.1f}s")
+        after = run_queries(connection, names, first_day, args.days, args.repeats, migrated=True)
+
+    print(f"\n{'query':<30}{'before ms':>12}{'after ms':>12}")
+    for label, after_ms in after.items():
+        before_ms = before.get(label)
+        before_text = f"{before_ms:12.3f}" if before_ms is not None else f"{'-':>12}"
+        print(f"{label:<30}{before_text}{after_ms:12.3f}")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
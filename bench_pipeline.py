@@ -0,0 +1,378 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from adaptive_detector import AdaptiveDetector, detection_config
+from attendance_cache import AttendanceCache
+from attendance_writer import AttendanceWriter
+from db_connection import create_pool, create_table
+from encoding_store import EncodingStore
+from enrollment import encode_image_file, image_extensions
+from face_backends import face_encodings
+from face_quality import QualityGate, quality_config
+from face_tracker import FaceTracker, tracking_config
+from gallery_index import GalleryIndex
+from gallery_manager import GallerySnapshot
+from identities import build_identities, identity_config, identity_name
+from recognition_service import encode_faces
+from recognizer import FrameRecognizer, LocalMatcher
+from snapshot_store import SnapshotStore
+
+# Replays a video file or a folder of images through the same detection ->
+# encoding -> matching -> attendance path the cameras use, with attendance
+# written to a throwaway SQLite database, and reports per-stage latency
+# percentiles, throughput, memory and (with --truth) precision/recall.
+#
+# Ground truth is a CSV with a header row "frame,name": one row per known person
+# visible in a frame, where frame is the frame number (from 0) for a video or
+# the file name for an image folder. Names are compared by identity
+# (identities.identity_name drops a trailing photo counter, so "Mary_Ann_2"
+# counts as "Mary_Ann"), like the labels on the video feed.
+#
+# --json writes the report; --baseline compares against an earlier report and
+# exits with status 1 when throughput, latency or accuracy got worse by more
+# than --tolerance, so the script can guard a CI job.
+
+
+# Wall-clock samples for one stage
+class StageTimer:
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def summary(self):
+        if not self.samples:
+            return {'count': 0}
+        ms = 1000 * np.asarray(self.samples)
+        return {
+            'count': len(ms),
+            'total_s': round(float(ms.sum()) / 1000, 3),
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p90_ms': round(float(np.percentile(ms, 90)), 3),
+            'p99_ms': round(float(np.percentile(ms, 99)), 3),
+            'max_ms': round(float(ms.max()), 3),
+        }
+
+
+class TimedDetector(AdaptiveDetector):
+
+    def __init__(self, timer, **settings):
+        super().__init__(**settings)
+        self.timer = timer
+
+    def detect(self, frame):
+        start = time.perf_counter()
+        boxes = super().detect(frame)
+        if boxes is not None:
+            self.timer.add(time.perf_counter() - start)
+        return boxes
+
+
+# LocalMatcher with encoding and matching timed separately
+class TimedMatcher(LocalMatcher):
+
+    def __init__(self, gallery, encode_timer, match_timer):
+        super().__init__(gallery)
+        self.encode_timer = encode_timer
+        self.match_timer = match_timer
+        self.faces = 0
+
+    def identify(self, frame, boxes):
+        if not boxes:
+            return []
+        start = time.perf_counter()
+        return self._timed_match(face_encodings(frame, boxes), start)
+
+    def identify_crops(self, items):
+        if not items:
+            return []
+        start = time.perf_counter()
+        return self._timed_match(encode_faces(items), start)
+
+    def _timed_match(self, encodings, encode_start):
+        self.encode_timer.add(time.perf_counter() - encode_start)
+        self.faces += len(encodings)
+
+        start = time.perf_counter()
+        results = self._match(encodings)
+        self.match_timer.add(time.perf_counter() - start)
+        return results
+
+
+# (key, frame) pairs: frame numbers for a video, file names for a folder
+def read_frames(source, limit=None):
+    if os.path.isdir(source):
+        files = sorted(f for f in os.listdir(source) if f.lower().endswith(image_extensions))
+        for filename in files[:limit]:
+            frame = cv2.imread(os.path.join(source, filename))
+            if frame is not None:
+                yield filename, frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {source}")
+    index = 0
+    try:
+        while limit is None or index < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield str(index), frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def load_truth(path):
+    truth = {}
+    with open(path, newline='', encoding='utf-8') as truth_file:
+        for row in csv.DictReader(truth_file):
+            truth.setdefault(row['frame'].strip(), set()).add(identity_name(row['name'].strip()))
+    return truth
+
+
+# Gallery from an image folder (timed like findEncodings) or an encoding store
+def load_gallery(args, timer):
+    if args.enroll:
+        encodings, names = [], []
+        for filename in sorted(os.listdir(args.enroll)):
+            if not filename.lower().endswith(image_extensions):
+                continue
+            start = time.perf_counter()
+            _, encoding, error = encode_image_file(os.path.join(args.enroll, filename))
+            timer.add(time.perf_counter() - start)
+            if encoding is not None:
+                encodings.append(encoding)
+                names.append(os.path.splitext(filename)[0])
+            else:
+                print(f"Skipping {filename}: {error}")
+    else:
+        encodings, names = EncodingStore(args.gallery).load()
+
+    start = time.perf_counter()
+    templates, template_names, report = build_identities(encodings, names, **identity_config)
+    index = GalleryIndex(templates, template_names)
+    print(f"Gallery: {report['identities']} identities from {report['samples']} samples "
+          f"({len(index)} rows), built in {1000 * (time.perf_counter() - start):.1f} ms")
+    return SimpleNamespace(snapshot=GallerySnapshot(index, 1))
+
+
+def precision_recall(true_positives, false_positives, false_negatives):
+    predicted = true_positives + false_positives
+    actual = true_positives + false_negatives
+    return {
+        'true_positives': true_positives,
+        'false_positives': false_positives,
+        'false_negatives': false_negatives,
+        'precision': round(true_positives / predicted, 4) if predicted else None,
+        'recall': round(true_positives / actual, 4) if actual else None,
+    }
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run(args):
+    timers = {stage: StageTimer() for stage in ('decode', 'enroll', 'detect', 'encode', 'match', 'frame', 'attendance')}
+    gallery = load_gallery(args, timers['enroll'])
+    is_folder = os.path.isdir(args.source)
+    truth = load_truth(args.truth) if args.truth else None
+
+    # Stub database: the real attendance writer against a temporary SQLite file
+    tmp_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    pool = create_pool(backend='sqlite', sqlite_path=os.path.join(tmp_dir, 'bench.sqlite3'), pool_size=2)
+    with pool.connection() as connection:
+        create_table(connection)
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO employee (employee_name) VALUES (%s)",
+                           [(name,) for name in gallery.snapshot.identities])
+        connection.commit()
+        cursor.close()
+
+    cache = AttendanceCache()
+    submitted = {}
+    marked = set()
+
+    def on_result(employee_name, result):
+        cache.record(employee_name, result)
+        if employee_name in submitted:
+            timers['attendance'].add(time.perf_counter() - submitted.pop(employee_name))
+        if result.get('status') == 'marked':
+            marked.add(identity_name(employee_name))
+
+    writer = AttendanceWriter(pool, spool_path=os.path.join(tmp_dir, 'spool.jsonl'), max_wait=0.05,
+                              on_result=on_result, snapshot_store=SnapshotStore(root=os.path.join(tmp_dir, 'Snapshots')),
+                              dead_letter_path=os.path.join(tmp_dir, 'dead_letter.jsonl'))
+    writer.start()
+    snapshots = writer.snapshot_store
+
+    def on_identified(employee_name, frame, distance):
+        if cache.should_mark(employee_name):
+            submitted[employee_name] = time.perf_counter()
+            writer.submit(employee_name, snapshots.encode(frame))
+
+    detection = dict(detection_config, motion_gate=args.motion_gate and not is_folder)
+    if args.backend:
+        detection.update(backend=args.backend)
+    if args.scale:
+        detection.update(scale=args.scale, min_scale=args.scale, max_scale=args.scale)
+    matcher = TimedMatcher(gallery, timers['encode'], timers['match'])
+    tracker = FaceTracker(**dict(tracking_config, enabled=args.tracking and not is_folder))
+    quality = QualityGate(**quality_config) if args.quality else None
+    recognizer = FrameRecognizer(matcher, on_identified, tracker, detector=TimedDetector(timers['detect'], **detection),
+                                 quality=quality)
+
+    counts = {'tp': 0, 'fp': 0, 'fn': 0}
+    seen = set()
+    frames = 0
+    started = time.perf_counter()
+    decode_start = time.perf_counter()
+    for key, frame in read_frames(args.source, args.frames):
+        timers['decode'].add(time.perf_counter() - decode_start)
+        start = time.perf_counter()
+        annotations = recognizer(frame)
+        timers['frame'].add(time.perf_counter() - start)
+        frames += 1
+
+        if truth is not None:
+            predicted = {label for label, _ in annotations}
+            expected = truth.get(key, set())
+            seen |= expected
+            counts['tp'] += len(predicted & expected)
+            counts['fp'] += len(predicted - expected)
+            counts['fn'] += len(expected - predicted)
+        decode_start = time.perf_counter()
+    elapsed = time.perf_counter() - started
+
+    writer.stop()
+    pool.close()
+
+    processing = sum(timers['frame'].samples)
+    report = {
+        'source': args.source,
+        'frames': frames,
+        'faces_encoded': matcher.faces,
+        'gallery_size': len(gallery.snapshot),
+        'wall_s': round(elapsed, 3),
+        'frames_per_sec': round(frames / processing, 2) if processing else None,
+        'faces_per_sec': round(matcher.faces / processing, 2) if processing else None,
+        'max_rss_mb': max_rss_mb(),
+        'stages': {stage: timer.summary() for stage, timer in timers.items()},
+        'detection': recognizer.detector.stats(),
+        'tracking': tracker.stats(),
+        'quality': quality.stats() if quality else None,
+        'attendance': dict(writer.stats(), marked=sorted(marked)),
+    }
+    if truth is not None:
+        report['accuracy'] = {
+            'frames': precision_recall(counts['tp'], counts['fp'], counts['fn']),
+            'attendance': precision_recall(len(marked & seen), len(marked - seen), len(seen - marked)),
+        }
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['frames']} frames, {report['faces_encoded']} faces encoded in {report['wall_s']}s "
+          f"({report['frames_per_sec']} frames/s, {report['faces_per_sec']} faces/s), "
+          f"max RSS {report['max_rss_mb']} MB")
+    print(f"\n{'stage':<12}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, summary in report['stages'].items():
+        if summary['count']:
+            print(f"{stage:<12}{summary['count']:>8}{summary['p50_ms']:>10.2f}{summary['p90_ms']:>10.2f}"
+                  f"{summary['p99_ms']:>10.2f}{summary['max_ms']:>10.2f}")
+    detection = report['detection']
+    print(f"\ndetection: {detection['backend']} at scale {detection['scale']}, {detection['detections']} runs, "
+          f"{detection['skipped_no_motion']} skipped (no motion), {detection['faces_found']} faces")
+    quality = report.get('quality')
+    if quality:
+        print(f"quality: {quality['accepted']} of {quality['assessed']} faces accepted, {quality['deferred']} "
+              f"deferred, {quality['encoded']} encoded; rejected {quality['rejected']}")
+    for level, scores in report.get('accuracy', {}).items():
+        print(f"{level} precision {scores['precision']} recall {scores['recall']} "
+              f"(tp {scores['true_positives']}, fp {scores['false_positives']}, fn {scores['false_negatives']})")
+
+
+# Regressions beyond tolerance (a fraction) relative to a baseline report
+def compare(report, baseline, tolerance):
+    problems = []
+
+    def worse(label, current, previous, higher_is_better=True):
+        if current is None or previous is None or previous == 0:
+            return
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            problems.append(f"{label}: {previous} -> {current}")
+
+    worse('frames_per_sec', report['frames_per_sec'], baseline.get('frames_per_sec'))
+    worse('faces_per_sec', report['faces_per_sec'], baseline.get('faces_per_sec'))
+    for stage in ('frame', 'detect', 'encode', 'match'):
+        current = report['stages'][stage].get('p90_ms')
+        previous = baseline.get('stages', {}).get(stage, {}).get('p90_ms')
+        worse(f'{stage} p90_ms', current, previous, higher_is_better=False)
+    for level, scores in report.get('accuracy', {}).items():
+        previous = baseline.get('accuracy', {}).get(level, {})
+        for metric in ('precision', 'recall'):
+            # Accuracy is compared in absolute points, not relative change
+            if scores[metric] is not None and previous.get(metric) is not None \
+                    and previous[metric] - scores[metric] > tolerance / 10:
+                problems.append(f"{level} {metric}: {previous[metric]} -> {scores[metric]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recognition pipeline on recorded video or images")
+    parser.add_argument('source', help="video file or folder of images")
+    parser.add_argument('--gallery', default='Encodings', help="encoding store folder (default: Encodings)")
+    parser.add_argument('--enroll', help="build the gallery from this image folder instead")
+    parser.add_argument('--truth', help="ground truth CSV with frame,name rows")
+    parser.add_argument('--frames', type=int, default=None, help="stop after this many frames")
+    parser.add_argument('--scale', type=float, default=None, help="fixed detection scale instead of adaptive")
+    parser.add_argument('--backend', default=None, help="detector backend (hog, res10, yunet, haar, auto)")
+    parser.add_argument('--no-tracking', dest='tracking', action='store_false', help="detect on every frame")
+    parser.add_argument('--quality', action='store_true', help="skip poor faces and encode the best one per track")
+    parser.add_argument('--no-motion-gate', dest='motion_gate', action='store_false')
+    parser.add_argument('--json', help="write the report to this file")
+    parser.add_argument('--baseline', help="earlier --json report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as out:
+            json.dump(report, out, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            problems = compare(report, json.load(baseline_file), args.tolerance)
+        if problems:
+            print("\nRegressions against baseline:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import itertools
+import threading
+
+
+# One producer publishes each encoded frame once; any number of subscribers read
+# it. Publishing never waits on subscribers: a slow client just jumps to the
+# newest frame and the frames it missed are counted as skipped.
+class BroadcastHub:
+
+    def __init__(self):
+        self.published = 0
+        self._payload = None
+        self._seq = 0
+        self._closed = False
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def publish(self, payload):
+        with self._cond:
+            self._payload = payload
+            self._seq += 1
+            self.published += 1
+            self._cond.notify_all()
+
+    def has_subscribers(self):
+        with self._cond:
+            return bool(self._subscribers)
+
+    # Generator of payloads for one client; unregisters itself when the client goes away
+    def subscribe(self, timeout=1.0):
+        with self._cond:
+            sub_id = next(self._ids)
+            state = self._subscribers[sub_id] = {'sent': 0, 'skipped': 0}
+            seq = self._seq - 1 if self._payload is not None else self._seq
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq > seq or self._closed, timeout)
+                    if self._closed:
+                        return
+                    if self._seq == seq:
+                        continue
+                    state['skipped'] += self._seq - seq - 1
+                    seq, payload = self._seq, self._payload
+                state['sent'] += 1
+                yield payload
+        finally:
+            with self._cond:
+                self._subscribers.pop(sub_id, None)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'published': self.published,
+                'subscribers': len(self._subscribers),
+                'clients': {str(sub_id): dict(state) for sub_id, state in self._subscribers.items()},
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
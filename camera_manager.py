@@ -0,0 +1,445 @@
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import cv2
+
+from adaptive_detector import AdaptiveDetector, detection_config
+from broadcast import BroadcastHub
+from face_quality import QualityGate, quality_config
+from face_tracker import FaceTracker, tracking_config
+from metrics import registry
+from pipeline import FramePipeline
+from recognition_service import BatchClient, batching_config, recognition_service
+from recognizer import FrameRecognizer, LocalMatcher
+from shared_gallery import SharedGalleryReader, SharedGalleryWriter
+from snapshot_store import store as snapshot_store
+from stream_encoder import StreamEncoder, stream_config
+
+logger = logging.getLogger(__name__)
+
+# Cameras served by webcam8. sources is a comma separated list of device
+# indices, RTSP/HTTP URLs or video files, each optionally named as id=source
+# (e.g. "front=0,lobby=rtsp://cam2/stream,test=clips/entrance.mp4").
+# Unnamed sources get their position as id. detection holds per-camera overrides
+# of adaptive_detector.detection_config, e.g. ATTENDANCE_DETECTION=
+# '{"front": {"rois": [[0.25, 0.1, 0.75, 1.0]], "max_scale": 0.5}, "kiosk": {"backend": "haar"}}'.
+# quality does the same for face_quality.quality_config, e.g. ATTENDANCE_QUALITY=
+# '{"lobby": {"min_face_px": 32, "check_pose": false}}'.
+camera_config = {
+    'sources': os.environ.get('ATTENDANCE_CAMERAS', '0'),
+    'detection': json.loads(os.environ.get('ATTENDANCE_DETECTION', '{}')),
+    'quality': json.loads(os.environ.get('ATTENDANCE_QUALITY', '{}')),
+    'loop_files': True,       # replay video files when they end
+    'workers': 2,             # recognition threads per camera process
+    'max_queue': 2,           # frames waiting for recognition per camera
+    'max_age': 0.5,           # skip frames older than this (seconds)
+    'stats_interval': 1.0,    # how often a camera process reports its counters (seconds)
+    'restart_delay': 5.0,     # wait before restarting a camera process that died
+}
+
+# Workers are started by a forkserver where possible, never forked from the web
+# process: it starts them from request and supervisor threads while other
+# threads may hold locks (logging, the DB pool, the writer), which a forked
+# child would inherit locked. Both forkserver and spawn import the main script
+# again in every child, so webcam8 keeps its setup out of __mp_main__.
+_mp = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                                  else 'spawn')
+
+
+def parse_sources(spec):
+    sources = []
+    for item in (part.strip() for part in spec.split(',')):
+        if not item:
+            continue
+        named = re.match(r'^(\w+)=(.+)$', item)
+        camera_id, source = (named.group(1), named.group(2)) if named else (str(len(sources)), item)
+        if any(camera_id == existing for existing, _ in sources):
+            raise ValueError(f"Duplicate camera id {camera_id!r} in {spec!r}")
+        sources.append((camera_id, int(source) if source.isdigit() else source))
+    return sources
+
+
+# Source for stats and logs, without credentials embedded in the URL
+def redact(source):
+    if isinstance(source, int):
+        return source
+    parts = urlsplit(source)
+    if parts.password is None:
+        return source
+    return parts._replace(netloc=f"{parts.username}:***@{parts.hostname}"
+                                 + (f":{parts.port}" if parts.port else '')).geturl()
+
+
+# cv2.VideoCapture wrapper that plays video files at their own frame rate (and
+# optionally loops them), so a file behaves like a live camera
+class VideoSource:
+
+    def __init__(self, source, loop=True):
+        self.loop = loop
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.cap = cv2.VideoCapture(source)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        self.interval = (1.0 / fps if 0 < fps < 1000 else 1.0 / 25) if self.is_file else 0.0
+        self._next = 0.0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        if self.interval:
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._next = max(self._next, time.perf_counter() - self.interval) + self.interval
+        ret, frame = self.cap.read()
+        if not ret and self.is_file and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+# Forward stream chunks to the parent while someone there is watching
+def _forward_stream(pipeline, chunks, watching, stopping):
+    while not stopping.is_set() and pipeline.running:
+        if not watching.value:
+            time.sleep(0.1)
+            continue
+        stream = pipeline.frames()
+        try:
+            for chunk in stream:
+                try:
+                    chunks.put_nowait(chunk)
+                except queue.Full:
+                    pass
+                if not watching.value or stopping.is_set():
+                    break
+        finally:
+            stream.close()
+
+
+# Body of one camera process: capture, tracking, recognition against the shared
+# gallery and stream encoding. Detections, stats and requested frames go back to
+# the parent on the events queue; attendance is written only by the parent.
+# With batching enabled, faces are encoded by the shared recognition service.
+def camera_worker(camera_id, source, descriptor, options, control, events, chunks, watching, requests, replies):
+    registry.reset(f'camera-{camera_id}')
+    gallery = SharedGalleryReader()
+    gallery.attach(descriptor)
+    cap = VideoSource(source, loop=options['loop_files'])
+    if not cap.isOpened():
+        events.put(('error', camera_id, f"Could not open camera source {redact(source)}"))
+        gallery.close()
+        return
+
+    def on_identified(employee_name, frame, distance):
+        capture_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        events.put(('detection', camera_id, employee_name, capture_datetime, snapshot_store.encode(frame)))
+
+    batching = options['batching']
+    if batching['enabled']:
+        matcher = BatchClient(camera_id, requests, replies, batching['margin'], batching['timeout'],
+                              batching['max_crop'])
+    else:
+        matcher = LocalMatcher(gallery)
+    recognizer = FrameRecognizer(matcher, on_identified, FaceTracker(**options['tracking']),
+                                 detector=AdaptiveDetector(**options['detection']),
+                                 quality=QualityGate(**options['quality']))
+    pipeline = FramePipeline(cap, recognizer, options['workers'], options['max_queue'], options['max_age'],
+                             encoder=StreamEncoder(**options['stream']))
+    pipeline.start()
+    stopping = threading.Event()
+    threading.Thread(target=_forward_stream, args=(pipeline, chunks, watching, stopping),
+                     name='stream-forwarder', daemon=True).start()
+
+    interval = options['stats_interval']
+    last_report, last_counts = time.perf_counter(), (0, 0)
+    try:
+        while not stopping.is_set() and pipeline.grabber.running:
+            try:
+                message = control.get(timeout=interval)
+            except queue.Empty:
+                message = None
+
+            if message is None:
+                pass
+            elif message[0] == 'gallery':
+                try:
+                    gallery.attach(message[1])
+                except FileNotFoundError:
+                    # Already replaced by a newer snapshot further down the queue
+                    pass
+            elif message[0] == 'frame':
+                events.put(('frame', camera_id, pipeline.latest_frame()))
+            elif message[0] == 'stop':
+                stopping.set()
+
+            now = time.perf_counter()
+            if now - last_report >= interval:
+                stats = pipeline.stats()
+                stats['tracking'] = recognizer.stats()
+                stats['gallery_version'] = gallery.snapshot.version
+                counts = (stats['capture']['processed'], stats['recognition']['processed'])
+                stats['capture_fps'] = round((counts[0] - last_counts[0]) / (now - last_report), 2)
+                stats['recognition_fps'] = round((counts[1] - last_counts[1]) / (now - last_report), 2)
+                events.put(('stats', camera_id, stats))
+                events.put(('metrics', camera_id, registry.collect()))
+                last_report, last_counts = now, counts
+
+        if not stopping.is_set() and cap.is_file:
+            # The file ran out (loop_files is off); a camera that stops is restarted instead
+            events.put(('ended', camera_id))
+    finally:
+        stopping.set()
+        pipeline.stop()
+        cap.release()
+        gallery.close()
+
+
+class Camera:
+
+    def __init__(self, camera_id, source):
+        self.camera_id = camera_id
+        self.source = source
+        self.hub = BroadcastHub()
+        self.watching = _mp.Value('b', 0, lock=False)
+        self.frame_replies = queue.Queue()
+        self.replies = _mp.Queue()
+        self.process = None
+        self.control = None
+        self.chunks = None
+        self.stats = {}
+        self.restarts = 0
+        self.restart_at = 0.0
+        self.ended = False
+        self.error = None
+
+
+# Runs every camera in its own process. The gallery lives once in shared memory
+# and is republished whenever the GalleryManager swaps its snapshot; detections
+# come back to on_detection(camera_id, employee_name, capture_datetime, snapshot)
+# in this process, so there is still one attendance writer and one DB pool.
+class CameraManager:
+
+    def __init__(self, sources, gallery, on_detection, detection=None, quality=None, loop_files=True, workers=2,
+                 max_queue=2, max_age=0.5, stats_interval=1.0, restart_delay=5.0):
+        if isinstance(sources, str):
+            sources = parse_sources(sources)
+        if not sources:
+            raise ValueError("No camera sources configured")
+        self.cameras = {camera_id: Camera(camera_id, source) for camera_id, source in sources}
+        detection = detection or {}
+        unknown = set(detection) - set(self.cameras)
+        if unknown:
+            raise ValueError(f"Detection settings for unknown cameras: {', '.join(sorted(unknown))}")
+        self.detection = {camera_id: dict(detection_config, **detection.get(camera_id, {}))
+                          for camera_id in self.cameras}
+        quality = quality or {}
+        unknown = set(quality) - set(self.cameras)
+        if unknown:
+            raise ValueError(f"Quality settings for unknown cameras: {', '.join(sorted(unknown))}")
+        self.quality = {camera_id: dict(quality_config, **quality.get(camera_id, {}))
+                        for camera_id in self.cameras}
+        self.gallery = gallery
+        self.on_detection = on_detection
+        self.restart_delay = restart_delay
+        self.options = {
+            'loop_files': loop_files,
+            'workers': workers,
+            'max_queue': max_queue,
+            'max_age': max_age,
+            'stats_interval': stats_interval,
+            'tracking': dict(tracking_config),
+            'stream': dict(stream_config),
+            'batching': dict(batching_config),
+        }
+        self.events = _mp.Queue()
+        self.requests = _mp.Queue()
+        self.service = None
+        self.service_control = None
+        self.service_restarts = 0
+        self.service_stats = {}
+        self.remote_metrics = {}
+        self.shared = SharedGalleryWriter()
+        self.running = False
+        self._descriptor = None
+        self._lock = threading.Lock()
+
+    def default_camera(self):
+        return next(iter(self.cameras))
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._descriptor = self.shared.publish(self.gallery.snapshot)
+            if self.options['batching']['enabled']:
+                self._spawn_service()
+            for camera in self.cameras.values():
+                self._spawn(camera)
+        self.gallery.add_listener(self.publish_gallery)
+        threading.Thread(target=self._dispatch_events, name='camera-events', daemon=True).start()
+        for camera in self.cameras.values():
+            threading.Thread(target=self._relay, args=(camera,), name=f'camera-relay-{camera.camera_id}',
+                             daemon=True).start()
+
+    def _spawn(self, camera):
+        camera.control = _mp.Queue()
+        camera.chunks = _mp.Queue(maxsize=2)
+        options = dict(self.options, detection=self.detection[camera.camera_id],
+                       quality=self.quality[camera.camera_id])
+        camera.process = _mp.Process(
+            target=camera_worker, name=f'camera-{camera.camera_id}', daemon=True,
+            args=(camera.camera_id, camera.source, self._descriptor, options,
+                  camera.control, self.events, camera.chunks, camera.watching,
+                  self.requests, camera.replies))
+        camera.process.start()
+
+    def _spawn_service(self):
+        self.service_control = _mp.Queue()
+        self.service = _mp.Process(
+            target=recognition_service, name='recognition-service', daemon=True,
+            args=(self._descriptor, self.options['batching'], self.requests, self.service_control,
+                  {camera_id: camera.replies for camera_id, camera in self.cameras.items()},
+                  self.events, self.options['stats_interval']))
+        self.service.start()
+
+    def publish_gallery(self, snapshot):
+        with self._lock:
+            if not self.running:
+                return
+            self._descriptor = self.shared.publish(snapshot)
+            for camera in self.cameras.values():
+                camera.control.put(('gallery', self._descriptor))
+            if self.service is not None:
+                self.service_control.put(('gallery', self._descriptor))
+
+    def _dispatch_events(self):
+        while self.running:
+            self._supervise_service()
+            try:
+                message = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            kind, camera = message[0], self.cameras.get(message[1])
+            if kind == 'service':
+                self.service_stats = message[2]
+            elif kind == 'metrics':
+                self.remote_metrics[message[1]] = message[2]
+            elif kind == 'detection':
+                _, camera_id, employee_name, capture_datetime, snapshot = message
+                try:
+                    self.on_detection(camera_id, employee_name, capture_datetime, snapshot)
+                except Exception:
+                    logger.exception("Error handling detection from camera %s", camera_id)
+            elif kind == 'stats':
+                camera.stats = message[2]
+                camera.error = None
+            elif kind == 'frame':
+                camera.frame_replies.put(message[2])
+            elif kind == 'ended':
+                camera.ended = True
+            elif kind == 'error':
+                camera.error = message[2]
+                logger.error(message[2])
+
+    # Move one camera's stream chunks into its hub, tell the worker whether
+    # anyone is watching, and restart the worker if it died
+    def _relay(self, camera):
+        while self.running:
+            camera.watching.value = camera.hub.has_subscribers()
+            try:
+                chunk = camera.chunks.get(timeout=0.2)
+            except queue.Empty:
+                self._supervise(camera)
+                continue
+            camera.hub.publish(chunk)
+
+    def _supervise(self, camera):
+        if camera.process.is_alive() or camera.ended or not self.running:
+            return
+        now = time.time()
+        if not camera.restart_at:
+            camera.restart_at = now + self.restart_delay
+            logger.warning("Camera %s stopped (exit code %s); restarting in %ss",
+                           camera.camera_id, camera.process.exitcode, self.restart_delay)
+        elif now >= camera.restart_at:
+            camera.restart_at = 0.0
+            camera.restarts += 1
+            with self._lock:
+                if self.running:
+                    self._spawn(camera)
+
+    # The batching service has no state worth waiting for; restart it right away
+    def _supervise_service(self):
+        with self._lock:
+            if self.running and self.service is not None and not self.service.is_alive():
+                logger.warning("Recognition service stopped (exit code %s); restarting", self.service.exitcode)
+                self.service_restarts += 1
+                self._spawn_service()
+
+    # Multipart stream chunks of one camera for one client
+    def frames(self, camera_id):
+        camera = self.cameras[camera_id]
+        self.start()
+        return camera.hub.subscribe()
+
+    # Full-resolution latest frame of a camera (for enrollment), or None
+    def latest_frame(self, camera_id=None, timeout=5.0):
+        camera = self.cameras[camera_id or self.default_camera()]
+        self.start()
+        while not camera.frame_replies.empty():
+            camera.frame_replies.get_nowait()
+        camera.control.put(('frame',))
+        try:
+            return camera.frame_replies.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def batching_stats(self):
+        if self.service is None:
+            return {'enabled': False}
+        return dict(self.service_stats, enabled=True, alive=self.service.is_alive(),
+                    restarts=self.service_restarts)
+
+    def stats(self):
+        return {
+            camera_id: dict(camera.stats,
+                            source=redact(camera.source),
+                            alive=bool(camera.process and camera.process.is_alive()),
+                            pid=camera.process.pid if camera.process else None,
+                            restarts=camera.restarts,
+                            ended=camera.ended,
+                            error=camera.error,
+                            viewers=camera.hub.stats()['subscribers'])
+            for camera_id, camera in self.cameras.items()
+        }
+
+    def stop(self):
+        with self._lock:
+            self.running = False
+        for camera in self.cameras.values():
+            if camera.process is None:
+                continue
+            camera.control.put(('stop',))
+            camera.process.join(timeout=2.0)
+            if camera.process.is_alive():
+                camera.process.terminate()
+            camera.hub.close()
+        if self.service is not None:
+            self.service_control.put(('stop',))
+            self.service.join(timeout=2.0)
+            if self.service.is_alive():
+                self.service.terminate()
+        self.shared.close()
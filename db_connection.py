@@ -1,10 +1,21 @@
-import pickle
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 import mysql.connector
-from datetime import datetime
+import mysql.connector.pooling
+from datetime import datetime, timedelta
 import os
 import base64
-import pandas as pd
 import numpy as np
+from gallery_repository import encoding_from_bytes, encoding_to_bytes
+from identities import identity_name
+from metrics import db_errors_total
+from snapshot_store import store as snapshot_store
+from schema_migrations import apply_migrations
+
+logger = logging.getLogger(__name__)
 
 image_folder = "Employee_Images"
 download_folder = "Downloaded_Images"
@@ -18,6 +29,15 @@ db_config = {
     'database': 'Employee_Details'
 }
 
+# Connection pool settings; backend 'sqlite' runs against a local file instead of MySQL
+pool_config = {
+    'backend': os.environ.get('ATTENDANCE_DB_BACKEND', 'mysql'),
+    'pool_name': 'attendance',
+    'pool_size': 5,
+    'checkout_timeout': 10,
+    'sqlite_path': 'Employee_Details.sqlite3',
+}
+
 # Establishing MySQL connection
 def connect_to_database():
     try:
@@ -28,8 +48,156 @@ def connect_to_database():
         print(f"Error: {err}")
         return None
 
-# Creating a table for employee images if not exists
-def create_table(connection):
+# Thread-safe pool of database connections. Every caller checks a connection out
+# for the duration of one request or batch:
+#
+#     with db_pool.connection() as connection:
+#         ...
+#
+# Connections are health checked (and reconnected if needed) on checkout and
+# returned to the pool afterwards; at most pool_size are handed out at once.
+class ConnectionPool:
+
+    def __init__(self, backend='mysql', pool_name='attendance', pool_size=5, checkout_timeout=10,
+                 sqlite_path='Employee_Details.sqlite3'):
+        self.backend = backend
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.sqlite_path = sqlite_path
+
+        self.checkouts = 0
+        self.in_use = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.errors = 0
+        self._wait_time = 0.0
+
+        self._mysql_pool = None
+        self._sqlite_idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+
+    # The MySQL pool opens its connections eagerly, so it is created on first use
+    # and retried on the next checkout if the server was down
+    def _open(self):
+        if self.backend == 'sqlite':
+            from sqlite_backend import SQLiteConnection
+            try:
+                return self._sqlite_idle.get_nowait()
+            except queue.Empty:
+                return SQLiteConnection(self.sqlite_path)
+
+        with self._lock:
+            if self._mysql_pool is None:
+                self._mysql_pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name=self.pool_name, pool_size=self.pool_size, **db_config)
+                logger.info("Connected to MySQL database")
+        return self._mysql_pool.get_connection()
+
+    def _release(self, connection):
+        if self.backend == 'sqlite':
+            # Drop anything the caller left uncommitted before reuse
+            connection.rollback()
+            self._sqlite_idle.put(connection)
+        else:
+            # Returns a pooled MySQL connection to the pool
+            connection.close()
+
+    def _health_check(self, connection):
+        if not connection.is_connected():
+            connection.ping(reconnect=True, attempts=3, delay=1)
+            with self._lock:
+                self.reconnects += 1
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.checkout_timeout):
+                with self._lock:
+                    self.timeouts += 1
+                db_errors_total.inc(operation='checkout_timeout')
+                raise mysql.connector.errors.PoolError(msg="Timed out waiting for a database connection")
+
+        connection = None
+        try:
+            try:
+                connection = self._open()
+                self._health_check(connection)
+            except mysql.connector.Error:
+                with self._lock:
+                    self.errors += 1
+                db_errors_total.inc(operation='connect')
+                raise
+            with self._lock:
+                self.checkouts += 1
+                self.in_use += 1
+                self._wait_time += time.perf_counter() - start
+            try:
+                yield connection
+            except mysql.connector.Error:
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+        finally:
+            if connection is not None:
+                try:
+                    self._release(connection)
+                except mysql.connector.Error:
+                    pass
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'pool_size': self.pool_size,
+                'in_use': self.in_use,
+                'utilisation': round(self.in_use / self.pool_size, 2),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects,
+                'errors': self.errors,
+                'avg_checkout_ms': round(1000 * self._wait_time / self.checkouts, 2) if self.checkouts else 0.0,
+            }
+
+    def close(self):
+        while True:
+            try:
+                self._sqlite_idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+# Pool built from pool_config
+def create_pool(**overrides):
+    config = dict(pool_config)
+    config.update(overrides)
+    return ConnectionPool(**config)
+
+# Cursor that reuses a server-side prepared statement for hot single-row queries
+def prepared_cursor(connection):
+    return connection.cursor(prepared=True)
+
+# IN lists padded (with their last value) to a power of two, so a prepared
+# lookup has a handful of distinct statement texts instead of one per length
+def padded_in(values):
+    values = list(values)
+    size = 4
+    while size < len(values):
+        size *= 2
+    return values + values[-1:] * (size - len(values)), ', '.join(['%s'] * size)
+
+# Creating a table for employee images if not exists, then bringing the schema
+# up to date with schema_migrations
+def create_table(connection, migrate=True):
     try:
         cursor = connection.cursor()
         cursor.execute("""
@@ -42,7 +210,7 @@ def create_table(connection):
                 faceEncoding BLOB
             );
         """)
-        print("Table 'employee' created successfully.")
+        logger.debug("Table 'employee' created successfully.")
 
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS employee_images  
@@ -51,33 +219,78 @@ def create_table(connection):
                 emp_id INT NOT NULL,
                 employee_name VARCHAR(100) NOT NULL,
                 employee_image LONGTEXT,
+                image_ref CHAR(64),
+                image_blob MEDIUMBLOB,
                 capture_datetime DATETIME NOT NULL
             )
         """)
         connection.commit()
-        print("Table 'employee_images' created successfully.")
+        cursor.close()
+        logger.debug("Table 'employee_images' created successfully.")
+        if migrate:
+            apply_migrations(connection)
 
     except mysql.connector.Error as err:
-        print(f"Error: {err}")
+        db_errors_total.inc(operation='create_table')
+        logger.error("Error creating tables: %s", err)
+
+# Start and end of a day ('%Y-%m-%d' string or date), for range predicates on
+# capture_datetime that can use its index instead of wrapping it in DATE()
+def day_range(capture_date, last_date=None):
+    if isinstance(capture_date, str):
+        capture_date = datetime.strptime(capture_date, "%Y-%m-%d")
+    if isinstance(last_date, str):
+        last_date = datetime.strptime(last_date, "%Y-%m-%d")
+    last_date = last_date or capture_date
+    day_start = datetime(capture_date.year, capture_date.month, capture_date.day)
+    day_end = datetime(last_date.year, last_date.month, last_date.day) + timedelta(days=1)
+    return day_start, day_end
 
 def image_exists(cursor, employee_name, capture_date):
+    day_start, day_end = day_range(capture_date)
     cursor.execute("""
         SELECT COUNT(*) FROM employee_images
-        WHERE employee_name = %s AND DATE_FORMAT(capture_datetime,'%Y-%m-%d') = %s
-    """, (employee_name, capture_date))
+        WHERE employee_name = %s AND capture_datetime >= %s AND capture_datetime < %s
+    """, (employee_name, day_start, day_end))
     return cursor.fetchone()[0] > 0
 
-def employee_exists(cursor, employee_name,faceEncoding):
-    try:
-        serialized_encoding = pickle.dumps(faceEncoding)
+# Record the employee's day in attendance_summary; a repeat for the same day is ignored
+def record_attendance_days(cursor, rows):
+    cursor.executemany("""
+        INSERT IGNORE INTO attendance_summary (emp_id, attendance_date, first_capture)
+        VALUES (%s, %s, %s)
+    """, rows)
 
+# Names of everyone with an attendance record on the given date
+def get_marked_employees(connection, capture_date):
+    try:
+        day_start, day_end = day_range(capture_date)
+        cursor = prepared_cursor(connection)
         cursor.execute("""
-        SELECT COUNT(*) FROM employee WHERE employee_name = %s AND faceEncoding = %s
-        """, (employee_name,serialized_encoding))
-
-        return cursor.fetchone()[0] > 0
+            SELECT DISTINCT employee_name FROM employee_images
+            WHERE capture_datetime >= %s AND capture_datetime < %s
+        """, (day_start, day_end))
+        names = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return names
     except mysql.connector.Error as err:
-        print(f"Error: {err}")
+        db_errors_total.inc(operation='marked_employees')
+        logger.error("Error fetching marked employees: %s", err)
+        return []
+
+# Id of the employee with this name, or None
+def get_employee_id(cursor, employee_name):
+    cursor.execute("SELECT id FROM employee WHERE employee_name = %s", (employee_name,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+# faceEncoding is accepted for older callers; employees are identified by name
+def employee_exists(cursor, employee_name, faceEncoding=None):
+    try:
+        return get_employee_id(cursor, employee_name) is not None
+    except mysql.connector.Error as err:
+        db_errors_total.inc(operation='employee_exists')
+        logger.error("Error looking up employee: %s", err)
         return False
 
 # Encoding image to Base64
@@ -88,57 +301,48 @@ def encode_image_to_base64(realtime_image_path):
 
 # Inserting captured image data into MySQL database
 def insert_image_data(connection, employee_name, realtime_image_path, face_detected): #,imgModeList,imgBackground):
+    cursor = None
     try:
         if face_detected:
-            cursor = connection.cursor()
+            cursor = prepared_cursor(connection)
             capture_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             capture_date = datetime.now().strftime("%Y-%m-%d")
 
             # Check if the attendance is already marked
             if image_exists(cursor, employee_name, capture_date):
-                print("Attendance Already Marked.")
+                logger.info("Attendance already marked for %s.", employee_name)
                 return {'status': 'already_marked'}
                 # imgBackground[44:44 + 633, 808:808 + 414] = imgModeList[3]
                 # cv2.imshow('FaceAttendance', imgBackground)
                 # return imgModeList[3]
                 # return
 
-            # Fetch the employee face encoding from the database
-            faceEncoding = get_encoding_from_db(connection, employee_name)
-            if faceEncoding is None:
-                print(f"No encoding found for {employee_name}. Cannot mark attendance.")
-                return
-
-            # Fetch the employee ID if the employee exists with the provided encoding
-            if employee_exists(cursor, employee_name,faceEncoding):
-                cursor.execute("""
-                           SELECT id FROM employee WHERE employee_name = %s
-                       """, (employee_name,))
-                result = cursor.fetchone()
-                emp_id = result[0]
-                print(f"Employee ID for {employee_name} found: {emp_id}")
-            else:
-                print(f"Employee {employee_name} with the provided encoding not found.")
+            # One indexed lookup instead of re-fetching and comparing the encoding
+            emp_id = get_employee_id(cursor, employee_name)
+            if emp_id is None:
+                logger.warning("Employee %s not found.", employee_name)
                 return
 
-            # Convert the image to base64
-            image_data_base64 = encode_image_to_base64(realtime_image_path)
-            if image_data_base64:
+            # Store the snapshot as a file reference or BLOB instead of base64
+            with open(realtime_image_path, 'rb') as image_file:
+                snapshot = snapshot_store.persist(image_file.read())
+            if snapshot['image_ref'] or snapshot['image_blob']:
                 # Insert the employee image record
                 cursor.execute("""
-                    INSERT INTO employee_images (employee_name, emp_id, employee_image, capture_datetime)
-                    VALUES (%s, %s, %s, %s)
-                """, (employee_name,emp_id,image_data_base64, capture_datetime))
+                    INSERT INTO employee_images (employee_name, emp_id, image_ref, image_blob, capture_datetime)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (employee_name, emp_id, snapshot['image_ref'], snapshot['image_blob'], capture_datetime))
+                record_attendance_days(cursor, [(emp_id, capture_date, capture_datetime)])
                 connection.commit()
 
-                print("Attendance Marked. Image Data Inserted Into Database.")
+                logger.info("Attendance marked for %s.", employee_name)
                 return {'status': 'marked'}
                 # imgBackground[44:44 + 633, 808:808 + 414] = imgModeList[2]
                 # cv2.imshow('FaceAttendance', imgBackground)
                 # return imgModeList[2]
 
             else:
-                print("No Valid Image Files Found In The Folder.")
+                logger.warning("No valid image data for %s.", employee_name)
 
             # cursor.execute("""
             # UPDATE employee_images e
@@ -165,51 +369,134 @@ def insert_image_data(connection, employee_name, realtime_image_path, face_detec
             # connection.commit()
 
     except mysql.connector.Error as err:
-        print(f"Error: {err}")
-
+        db_errors_total.inc(operation='insert_image')
+        logger.error("Error inserting attendance image: %s", err)
+    finally:
+        if cursor is not None:
+            cursor.close()
+
+# Inserting a batch of attendance events in one transaction.
+# Each event is a dict with employee_name, capture_datetime ('%Y-%m-%d %H:%M:%S')
+# and the snapshot columns image_ref / image_blob; returns a list of (event, status). Errors are raised
+# so the caller can retry the whole batch. known_ids (name -> emp_id, e.g. from
+# GalleryRepository.employee_ids) saves the employee lookup for those names.
+def insert_attendance_batch(connection, events, known_ids=None):
+    if not events:
+        return []
+    # Lookups are prepared statements; the insert stays on a plain cursor, whose
+    # executemany sends all rows as one multi-row INSERT
+    lookup = prepared_cursor(connection)
+    cursor = connection.cursor()
+    try:
+        names = sorted({event['employee_name'] for event in events})
+        known_ids = known_ids or {}
+        emp_ids = {name: known_ids[name] for name in names if name in known_ids}
+        missing = [name for name in names if name not in emp_ids]
+        if missing:
+            params, placeholders = padded_in(missing)
+            lookup.execute(f"""
+                SELECT employee_name, id FROM employee WHERE employee_name IN ({placeholders})
+            """, params)
+            emp_ids.update({str(name): emp_id for name, emp_id in lookup.fetchall()})
+
+        # Already-marked days come from the attendance_summary primary key
+        marked = set()
+        if emp_ids:
+            days = sorted(event['capture_datetime'][:10] for event in events)
+            params, placeholders = padded_in(sorted(emp_ids.values()))
+            lookup.execute(f"""
+                SELECT emp_id, attendance_date FROM attendance_summary
+                WHERE emp_id IN ({placeholders})
+                AND attendance_date >= %s AND attendance_date <= %s
+            """, params + [days[0], days[-1]])
+            marked = {(emp_id, str(day)) for emp_id, day in lookup.fetchall()}
+
+        rows = []
+        days = []
+        results = []
+        for event in events:
+            name = event['employee_name']
+            if name not in emp_ids:
+                results.append((event, 'unknown_employee'))
+                continue
+            key = (emp_ids[name], event['capture_datetime'][:10])
+            if key in marked:
+                results.append((event, 'already_marked'))
+            else:
+                marked.add(key)
+                rows.append((name, emp_ids[name], event.get('image_ref'), event.get('image_blob'),
+                             event['capture_datetime']))
+                days.append(key + (event['capture_datetime'],))
+                results.append((event, 'marked'))
+
+        if rows:
+            cursor.executemany("""
+                INSERT INTO employee_images (employee_name, emp_id, image_ref, image_blob, capture_datetime)
+                VALUES (%s, %s, %s, %s, %s)
+            """, rows)
+            record_attendance_days(cursor, days)
+        connection.commit()
+        return results
+    except mysql.connector.Error:
+        connection.rollback()
+        raise
+    finally:
+        lookup.close()
+        cursor.close()
+
+# Store one enrollment sample as raw float32 bytes, creating the employee (named
+# after the identity, e.g. "Varun" for "Varun_2") if needed. GalleryRepository
+# does the same for whole enrollments.
 def insert_encoding_to_db(connection,employee_name, faceEncoding):
     try:
         cursor = connection.cursor()
-        if not employee_exists(cursor, employee_name,faceEncoding):
-            serialized_encoding =pickle.dumps(faceEncoding)
-            #print(f"Serialized encoding size: {len(serialized_encoding)} bytes")
-            query = "INSERT INTO employee (employee_name, faceEncoding) VALUES (%s, %s)"
-            cursor.execute(query, (employee_name, serialized_encoding))  # Store encoding as binary data
-            connection.commit()
-            print(f"Encoding for {employee_name} inserted into database.")
-        else:
-            print(f"Encoding for {employee_name} already exists in the database.")
+        identity = identity_name(employee_name)
+        emp_id = get_employee_id(cursor, identity)
+        if emp_id is None:
+            cursor.execute("INSERT INTO employee (employee_name) VALUES (%s)", (identity,))
+            emp_id = cursor.lastrowid
+        cursor.execute("DELETE FROM employee_encoding WHERE sample_name = %s", (employee_name,))
+        cursor.execute("""
+            INSERT INTO employee_encoding (sample_name, emp_id, encoding, updated_at) VALUES (%s, %s, %s, %s)
+        """, (employee_name, emp_id, encoding_to_bytes(faceEncoding), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        cursor.execute("UPDATE gallery_revision SET revision = revision + 1 WHERE id = 1")
+        connection.commit()
+        cursor.close()
+        logger.info("Encoding for %s inserted into database.", employee_name)
 
     except Exception as e:
-        print(f"Failed to insert encoding into database: {e}")
+        db_errors_total.inc(operation='insert_encoding')
+        logger.error("Failed to insert encoding into database: %s", e)
 
+# Encoding of a sample ("Varun_2") or the first one of an employee ("Varun")
 def get_encoding_from_db(connection, employee_name):
     try:
-        cursor = connection.cursor()
-        query = "SELECT faceEncoding FROM employee WHERE employee_name = %s"
-        cursor.execute(query, (employee_name,))
+        cursor = prepared_cursor(connection)
+        query = """
+            SELECT s.encoding FROM employee_encoding s JOIN employee e ON e.id = s.emp_id
+            WHERE s.sample_name = %s OR e.employee_name = %s
+            ORDER BY s.sample_name
+        """
+        cursor.execute(query, (employee_name, employee_name))
         result = cursor.fetchone()
+        cursor.fetchall()
+        cursor.close()
 
         if result:
-            # Deserialize the face encoding using pickle
-            serialized_encoding = result[0]
-            #print(f"Retrieved raw binary data: {serialized_encoding[:100]}...")  # Print first 100 bytes for debugging
-            face_encoding = pickle.loads(serialized_encoding)
-            #print(f"Encoding for {employee_name} retrieved from database.")
-            return face_encoding
+            return encoding_from_bytes(result[0])
         else:
-            print(f"No encoding found for {employee_name}.")
+            logger.warning("No encoding found for %s.", employee_name)
             return None
 
     except Exception as e:
-        print(f"Failed to fetch encoding from database: {e}")
+        db_errors_total.inc(operation='get_encoding')
+        logger.error("Failed to fetch encoding from database: %s", e)
         return None
 
-def download_image(connection, employee_name, capture_datetime_str, download_folder, image_data_base64):
+def download_image(connection, employee_name, capture_datetime_str, download_folder, image_data):
     try:
         capture_datetime = datetime.strptime(capture_datetime_str,'%Y-%m-%d %H:%M:%S')
-        image_data = base64.b64decode(image_data_base64)
-        image_filename = f"{employee_name}_{capture_datetime.strftime('%Y-%m-%d_%H-%M-%S%p')}.png"
+        image_filename = f"{employee_name}_{capture_datetime.strftime('%Y-%m-%d_%H-%M-%S%p')}.jpg"
 
         if not os.path.exists(download_folder):
             os.makedirs(download_folder)
@@ -222,37 +509,15 @@ def download_image(connection, employee_name, capture_datetime_str, download_fol
     except mysql.connector.Error as err:
         print(f"Error: {err}")
 
-# Fetch attendance records and export to Excel
+# Fetch attendance records and export to Excel. Rows are streamed in chunks and
+# the images written in parallel; see attendance_export for ranges and filters.
 def export_attendance_to_excel(connection, capture_date, export_folder,download_folder):
+    from attendance_export import export_to_folder
     try:
-        cursor = connection.cursor(dictionary=True)
-        #cursor = connection.cursor()
-        query = """
-            #SELECT employee_name,capture_datetime
-            SELECT employee_name,employee_image,DATE_FORMAT(capture_datetime, '%Y-%m-%d %H:%i:%S') AS capture_datetime
-            FROM employee_images
-            WHERE DATE(capture_datetime) = %s
-        """
-        cursor.execute(query, (capture_date,))
-        records = cursor.fetchall()
-        #print(f"Debug: fetched records = {records}")
-
-        if records:
-            df = pd.DataFrame(records, columns=['employee_name','capture_datetime'])
-            #df = pd.DataFrame(records)
-            # Debugging: Print DataFrame to verify its content
-            print(f"Debug: DataFrame = {df}")
-            if not os.path.exists(export_folder):
-                os.makedirs(export_folder)
-            export_path = os.path.join(export_folder, f"attendance_report_{capture_date}.xlsx")
-            df.to_excel(export_path, index=False)
-            print(f"Attendance records exported to {export_path}")
-            for record in records:
-                employee_name = record['employee_name']
-                capture_datetime = record['capture_datetime']
-                image_data_base64 = record['employee_image']
-                download_image(connection,employee_name, capture_datetime,download_folder,image_data_base64)
-            print(f"Employee Images Downloaded and saved to {download_folder}")
+        report = export_to_folder(connection, capture_date, export_folder=export_folder, image_folder=download_folder)
+        if report['rows']:
+            print(f"Attendance records exported to {report['path']}")
+            print(f"{report['images']} Employee Images Downloaded and saved to {download_folder}")
         else:
             print("No attendance records found for the specified date.")
 
@@ -0,0 +1,277 @@
+import json
+import logging
+import os
+import pickle
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows: writers are only serialized within one process
+    fcntl = None
+
+# Binary face gallery replacing EncodeFile.p.
+#
+# A generation of the store is two files in the store folder:
+#   encodings.<gen>.f32   16-byte header + N x 128 float32 rows, append-only
+#   names.<gen>.jsonl     one {"row": i, "name": ...} or {"delete": name} per line
+# and CURRENT names the live generation. Appends go to the end of both files
+# (matrix row first, then its name), so a crash can at worst leave a trailing
+# row without a name or a torn last line, both of which load() ignores.
+# Compaction writes a new generation and switches CURRENT with an atomic rename.
+# Writers (several threads, or e.g. the enrollment CLI next to the web app) take
+# an exclusive lock on the folder's LOCK file; readers need no lock.
+
+MAGIC = b'FENC'
+FORMAT_VERSION = 1
+DIMENSIONS = 128
+HEADER = struct.Struct('<4sIII')   # magic, format version, dimensions, reserved
+
+logger = logging.getLogger(__name__)
+
+store_path = 'Encodings'
+
+
+def _fsync_write(path, data, mode='wb'):
+    with open(path, mode) as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+
+
+class EncodingStore:
+
+    def __init__(self, root=store_path, compact_ratio=0.5):
+        self.root = root
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+    # Exclusive write access to the store folder across processes; reentrant,
+    # since append() may replace_all() or compact()
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._lock_depth == 0:
+                os.makedirs(self.root, exist_ok=True)
+                self._lock_file = open(os.path.join(self.root, 'LOCK'), 'a+b')
+                if fcntl:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    if fcntl:
+                        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _current_path(self):
+        return os.path.join(self.root, 'CURRENT')
+
+    def _paths(self, generation):
+        return (os.path.join(self.root, f'encodings.{generation}.f32'),
+                os.path.join(self.root, f'names.{generation}.jsonl'))
+
+    def generation(self):
+        try:
+            with open(self._current_path(), encoding='utf-8') as current:
+                return int(current.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def exists(self):
+        return self.generation() is not None
+
+    # Changes whenever the store is appended to or compacted; cheap to poll
+    def signature(self):
+        generation = self.generation()
+        if generation is None:
+            return None
+        matrix_path, names_path = self._paths(generation)
+        try:
+            return generation, os.path.getsize(matrix_path), os.path.getsize(names_path)
+        except OSError:
+            return None
+
+    def _read_names(self, names_path, row_count):
+        names_by_row = {}
+        row_by_name = {}
+        with open(names_path, encoding='utf-8') as names_file:
+            for line in names_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from an interrupted append
+                    continue
+                if 'delete' in record:
+                    row = row_by_name.pop(record['delete'], None)
+                    names_by_row.pop(row, None)
+                    continue
+                if 'name' not in record or record.get('row', row_count) >= row_count:
+                    continue
+                previous = row_by_name.get(record['name'])
+                names_by_row.pop(previous, None)
+                row_by_name[record['name']] = record['row']
+                names_by_row[record['row']] = record['name']
+        return names_by_row
+
+    def _open_matrix(self, matrix_path):
+        size = os.path.getsize(matrix_path)
+        with open(matrix_path, 'rb') as matrix_file:
+            magic, version, dimensions, _ = HEADER.unpack(matrix_file.read(HEADER.size))
+        if magic != MAGIC or version != FORMAT_VERSION or dimensions != DIMENSIONS:
+            raise ValueError(f"{matrix_path} is not a version {FORMAT_VERSION} encoding store")
+        rows = (size - HEADER.size) // (4 * DIMENSIONS)
+        if rows == 0:
+            return np.empty((0, DIMENSIONS), dtype=np.float32)
+        return np.memmap(matrix_path, dtype=np.float32, mode='r', offset=HEADER.size, shape=(rows, DIMENSIONS))
+
+    # (matrix, names) of live entries. When nothing was replaced or deleted the
+    # matrix is the memory map itself, so loading does not read the rows.
+    def load(self):
+        generation = self.generation()
+        if generation is None:
+            return np.empty((0, DIMENSIONS), dtype=np.float32), []
+        matrix_path, names_path = self._paths(generation)
+        matrix = self._open_matrix(matrix_path)
+        names_by_row = self._read_names(names_path, len(matrix))
+        rows = sorted(names_by_row)
+        names = [names_by_row[row] for row in rows]
+        if rows == list(range(len(matrix))):
+            return matrix, names
+        return np.ascontiguousarray(matrix[rows]), names
+
+    def _stats(self, generation):
+        matrix_path, names_path = self._paths(generation)
+        total = len(self._open_matrix(matrix_path))
+        live = len(self._read_names(names_path, total))
+        return total, live
+
+    # Write a whole new generation and make it current atomically
+    def replace_all(self, encodings, names):
+        with self._locked():
+            self._replace_all(encodings, names)
+
+    def _replace_all(self, encodings, names):
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSIONS)
+        names = list(names)
+        if len(matrix) != len(names):
+            raise ValueError(f"Got {len(matrix)} encodings for {len(names)} names")
+
+        generation = (self.generation() or 0) + 1
+        matrix_path, names_path = self._paths(generation)
+        _fsync_write(matrix_path, HEADER.pack(MAGIC, FORMAT_VERSION, DIMENSIONS, 0) + matrix.tobytes())
+        _fsync_write(names_path, ''.join(json.dumps({'row': row, 'name': name}) + '\n'
+                                         for row, name in enumerate(names)).encode('utf-8'))
+
+        old_generation = self.generation()
+        tmp_current = self._current_path() + '.tmp'
+        _fsync_write(tmp_current, str(generation).encode('ascii'))
+        os.replace(tmp_current, self._current_path())
+
+        if old_generation is not None:
+            for path in self._paths(old_generation):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # Append name records, first ending any torn line a crash left behind
+    def _append_names(self, names_path, records):
+        text = ''.join(json.dumps(record) + '\n' for record in records)
+        with open(names_path, 'rb') as names_file:
+            names_file.seek(0, os.SEEK_END)
+            if names_file.tell():
+                names_file.seek(-1, os.SEEK_END)
+                if names_file.read(1) != b'\n':
+                    text = '\n' + text
+        _fsync_write(names_path, text.encode('utf-8'), mode='ab')
+
+    # Add encodings; a name that is already present is replaced
+    def append(self, encodings, names):
+        names = list(names)
+        if not names:
+            return
+        with self._locked():
+            self._append(encodings, names)
+
+    def _append(self, encodings, names):
+        if not self.exists():
+            self.replace_all(encodings, names)
+            return
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSIONS)
+        if len(matrix) != len(names):
+            raise ValueError(f"Got {len(matrix)} encodings for {len(names)} names")
+
+        matrix_path, names_path = self._paths(self.generation())
+        start = len(self._open_matrix(matrix_path))
+        # Drop any torn partial row before appending so rows stay aligned
+        with open(matrix_path, 'r+b') as matrix_file:
+            matrix_file.truncate(HEADER.size + start * 4 * DIMENSIONS)
+        _fsync_write(matrix_path, matrix.tobytes(), mode='ab')
+        self._append_names(names_path, [{'row': start + i, 'name': name} for i, name in enumerate(names)])
+        self._maybe_compact()
+
+    def remove(self, names):
+        names = list(names)
+        if not names:
+            return
+        with self._locked():
+            if not self.exists():
+                return
+            _, names_path = self._paths(self.generation())
+            self._append_names(names_path, [{'delete': name} for name in names])
+            self._maybe_compact()
+
+    # Apply an enrollment: updates maps name -> encoding, deletions lists names to drop
+    def sync(self, updates, deletions=()):
+        with self._locked():
+            self.remove(sorted(set(deletions) - set(updates)))
+            self.append(list(updates.values()), list(updates))
+
+    # Rewrite without replaced/deleted rows
+    def compact(self):
+        with self._locked():
+            matrix, names = self.load()
+            self.replace_all(np.array(matrix), names)
+
+    def _maybe_compact(self):
+        total, live = self._stats(self.generation())
+        if total and (total - live) / total > self.compact_ratio:
+            self.compact()
+
+    # One-time import of the old pickled [encodings, names] gallery
+    def migrate_from_pickle(self, pickle_path='EncodeFile.p'):
+        if self.exists() or not os.path.exists(pickle_path):
+            return False
+        with self._locked():
+            return self._migrate_from_pickle(pickle_path)
+
+    def _migrate_from_pickle(self, pickle_path):
+        if self.exists():
+            return False
+        with open(pickle_path, 'rb') as file:
+            encodeListKnown, empNames = pickle.load(file)
+        if len(encodeListKnown) != len(empNames):
+            logger.warning("%s has %d encodings for %d names; re-run enrollment to rebuild it.",
+                           pickle_path, len(encodeListKnown), len(empNames))
+            return False
+        self.replace_all(encodeListKnown, empNames)
+        logger.info("Migrated %d encodings from %s.", len(empNames), pickle_path)
+        return True
+
+
+store = EncodingStore()
+
+
+# Load the live gallery, importing EncodeFile.p the first time
+def load_encodings():
+    store.migrate_from_pickle()
+    return store.load()
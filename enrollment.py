@@ -0,0 +1,263 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from encoding_store import store
+from face_backends import face_encodings
+
+logger = logging.getLogger(__name__)
+
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp')
+# Every image folder keeps its own manifest of what it enrolled, so enrolling
+# one folder never touches the samples of another
+manifest_name = '.enrollment_manifest.json'
+# Where the single manifest of earlier versions was kept
+legacy_manifest_path = 'enrollment_manifest.json'
+
+# One enrollment at a time per process: they share the manifests and the store
+_enroll_lock = threading.Lock()
+
+# Pool workers come from a forkserver, not forked from a process whose other
+# threads (the web app's writer, gallery watcher, ...) may hold locks
+pool_context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                                           else 'spawn')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as image_file:
+        for chunk in iter(lambda: image_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Encode one image file; runs in the worker processes.
+# Returns (path, encoding or None, error message or None)
+def encode_image_file(path):
+    try:
+        img = cv2.imread(path)
+        if img is None:
+            return path, None, "unreadable image"
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        encodings = face_encodings(img)
+        if not encodings:
+            return path, None, "no face found"
+        return path, encodings[0], None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def manifest_path(folder):
+    return os.path.join(folder, manifest_name)
+
+
+# The folder's manifest; a folder without one starts from the entries of the
+# legacy manifest for photos it holds
+def load_manifest(folder):
+    for path in (manifest_path(folder), legacy_manifest_path):
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+            if path == legacy_manifest_path:
+                manifest = {filename: entry for filename, entry in manifest.items()
+                            if os.path.exists(os.path.join(folder, filename))}
+            return manifest
+    return {}
+
+
+def _atomic_write(path, data, mode='wb'):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, mode) as tmp:
+        tmp.write(data)
+    os.replace(tmp_path, path)
+
+
+# Files whose size/mtime changed since the last run and whose content hash differs
+def changed_files(folder, manifest):
+    changed = []
+    seen = set()
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith(image_extensions):
+            continue
+        path = os.path.join(folder, filename)
+        stat = os.stat(path)
+        seen.add(filename)
+        entry = manifest.get(filename)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            continue
+        digest = file_hash(path)
+        if entry and entry['sha256'] == digest:
+            # Touched but not modified: just refresh the stat info
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            continue
+        changed.append((filename, path, stat, digest))
+    removed = [filename for filename in manifest if filename not in seen]
+    return changed, removed
+
+
+# Photo file name safe to write into the image folder: no directories, no
+# hidden files. Spaces are kept since the name is the employee's.
+def safe_image_name(filename):
+    name = re.sub(r'[\x00-\x1f/\\:]', '_', os.path.basename(filename.replace('\\', '/'))).lstrip('.')
+    if not name or not name.lower().endswith(image_extensions):
+        return None
+    return name
+
+
+# Write uploaded photos (name, bytes) into the image folder for enroll_folder.
+# Returns the file names written; other files are skipped.
+def save_images(items, folder='Employee_Images'):
+    os.makedirs(folder, exist_ok=True)
+    saved = []
+    for filename, data in items:
+        name = safe_image_name(filename)
+        if name is None:
+            continue
+        _atomic_write(os.path.join(folder, name), data)
+        saved.append(name)
+    return saved
+
+
+# (name, bytes) for every photo in a zip archive (a path or file object)
+def zip_images(archive):
+    with zipfile.ZipFile(archive) as bundle:
+        for member in bundle.infolist():
+            if not member.is_dir() and member.filename.lower().endswith(image_extensions):
+                yield member.filename, bundle.read(member)
+
+
+# Bring the encoding store in line with the image folder, encoding only new or
+# changed images across a process pool. Names and encodings are kept strictly
+# paired: an image without a usable face is recorded in the manifest but never
+# added. Enrollment is additive: only samples the folder's own manifest
+# enrolled are ever deleted, and only the differences are synced to the store
+# (the local EncodingStore or a GalleryRepository, which writes the shared
+# database too). on_change(updates, deletions) is called with them afterwards.
+# on_result(filename, status, error) is called as each image is done.
+def enroll_folder(folder='Employee_Images', workers=None, progress=True, on_change=None, store=store,
+                  on_result=None):
+    with _enroll_lock:
+        return _enroll_folder(folder, workers, progress, on_change, store, on_result)
+
+
+def _enroll_folder(folder, workers, progress, on_change, store, on_result):
+    store.migrate_from_pickle()
+    manifest = load_manifest(folder)
+    _, empNames = store.load()
+    known = set(empNames)
+    # Photos enrolled from here whose samples are gone from the store (a wiped
+    # cache, a fresh database) are encoded again
+    missing = [filename for filename, entry in manifest.items()
+               if entry['status'] == 'encoded' and os.path.splitext(filename)[0] not in known]
+    if missing:
+        logger.warning("Re-enrolling %d photos missing from the gallery.", len(missing))
+        for filename in missing:
+            manifest.pop(filename)
+
+    enrolled = {os.path.splitext(filename)[0] for filename, entry in manifest.items() if entry['status'] == 'encoded'}
+    updates = {}
+    deletions = set()
+    changed, removed = changed_files(folder, manifest)
+    for filename in removed:
+        deletions.add(os.path.splitext(filename)[0])
+        manifest.pop(filename)
+
+    total = len([f for f in os.listdir(folder) if f.lower().endswith(image_extensions)])
+    report = {'encoded': 0, 'no_face': 0, 'errors': 0, 'removed': 0, 'unchanged': total - len(changed)}
+    start = time.perf_counter()
+
+    def record(filename, stat, digest, encoding, error):
+        name = os.path.splitext(filename)[0]
+        if encoding is not None:
+            updates[name] = encoding
+            deletions.discard(name)
+            status = 'encoded'
+            report['encoded'] += 1
+        else:
+            updates.pop(name, None)
+            deletions.add(name)
+            status = 'no_face' if error in ("no face found", "unreadable image") else 'error'
+            report['no_face' if status == 'no_face' else 'errors'] += 1
+        manifest[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest, 'status': status}
+        return status
+
+    by_path = {path: (filename, stat, digest) for filename, path, stat, digest in changed}
+    done = 0
+
+    def handle(result):
+        nonlocal done
+        path, encoding, error = result
+        filename, stat, digest = by_path[path]
+        status = record(filename, stat, digest, encoding, error)
+        done += 1
+        if on_result:
+            on_result(filename, status, error)
+        if progress:
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed else 0.0
+            print(f"[{done}/{len(changed)}] {filename}: {error or status} ({rate:.1f} images/s)")
+
+    if len(changed) <= 1:
+        # Not worth starting a pool for the single photo capture_image adds
+        for path in by_path:
+            handle(encode_image_file(path))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context) as executor:
+            futures = [executor.submit(encode_image_file, path) for path in by_path]
+            for future in as_completed(futures):
+                handle(future.result())
+
+    dropped = sorted((deletions & enrolled & known) - set(updates))
+    store.sync(updates, dropped)
+    _atomic_write(manifest_path(folder), json.dumps(manifest, indent=1), mode='w')
+    if on_change and (updates or dropped):
+        on_change(updates, dropped)
+
+    report['removed'] = len(dropped)
+    report['gallery_size'] = len((known - set(dropped)) | set(updates))
+    report['seconds'] = round(time.perf_counter() - start, 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally enroll a folder of employee photos")
+    parser.add_argument('folder', nargs='?', default='Employee_Images')
+    parser.add_argument('--zip', default=None, help="first unpack the photos of this zip archive into the folder")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--quiet', action='store_true', help="only print the final report")
+    parser.add_argument('--jsonl', action='store_true', help="print one JSON line per image and for the report")
+    parser.add_argument('--local-only', action='store_true', help="update the local encoding store but not the database")
+    args = parser.parse_args()
+
+    if args.zip:
+        unpacked = save_images(zip_images(args.zip), args.folder)
+        if not args.jsonl:
+            print(f"Unpacked {len(unpacked)} photos into {args.folder}")
+
+    options = {'workers': args.workers, 'progress': not (args.quiet or args.jsonl)}
+    if args.jsonl:
+        options['on_result'] = lambda filename, status, error: print(
+            json.dumps({'image': filename, 'status': status, 'error': error}), flush=True)
+    if args.local_only:
+        report = enroll_folder(args.folder, **options)
+    else:
+        from db_connection import create_pool
+        from gallery_repository import GalleryRepository
+
+        pool = create_pool()
+        try:
+            report = enroll_folder(args.folder, store=GalleryRepository(pool), **options)
+        finally:
+            pool.close()
+    print(json.dumps({'report': report}) if args.jsonl else report)
@@ -0,0 +1,61 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+
+# Fan-out of small JSON-able events (attendance marked, already marked, ...) to
+# any number of listeners, e.g. the /events Server-Sent Events stream. Unlike
+# BroadcastHub, which only keeps the newest frame, every event is delivered:
+# recent events are kept in a ring so a client that reconnects with its last
+# event id catches up on what it missed.
+class EventBus:
+
+    def __init__(self, history=256):
+        self.published = 0
+        self._events = deque(maxlen=history)   # (event id, kind, data)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._subscribers = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def publish(self, kind, data):
+        with self._cond:
+            self._last_id = next(self._ids)
+            self._events.append((self._last_id, kind, dict(data, time=time.strftime("%Y-%m-%d %H:%M:%S"))))
+            self.published += 1
+            self._cond.notify_all()
+
+    # Generator of (event id, kind, data) for one listener, starting after
+    # last_id (or with the next event). Yields None after `timeout` seconds
+    # without events so the caller can send a keepalive and notice gone clients.
+    def subscribe(self, last_id=None, timeout=15.0):
+        with self._cond:
+            self._subscribers += 1
+            seen = self._last_id if last_id is None else min(last_id, self._last_id)
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._last_id > seen or self._closed, timeout)
+                    if self._closed:
+                        return
+                    pending = [event for event in self._events if event[0] > seen]
+                if not pending:
+                    yield None
+                    continue
+                for event in pending:
+                    yield event
+                seen = pending[-1][0]
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {'published': self.published, 'subscribers': self._subscribers, 'last_id': self._last_id}
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
@@ -0,0 +1,323 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# CPU-only face detectors behind one interface. The OpenCV DNN models are not
+# shipped; download them into models_dir (or point the paths elsewhere):
+#   res10:  deploy.prototxt + res10_300x300_ssd_iter_140000.caffemodel (opencv/samples/dnn)
+#   yunet:  face_detection_yunet_2023mar.onnx (opencv_zoo)
+# Haar cascades come with opencv-python, HOG with face_recognition.
+backend_config = {
+    'models_dir': os.environ.get('ATTENDANCE_MODELS', 'models'),
+    'res10_prototxt': 'deploy.prototxt',
+    'res10_weights': 'res10_300x300_ssd_iter_140000.caffemodel',
+    'yunet_model': 'face_detection_yunet_2023mar.onnx',
+    'haar_cascade': 'haarcascade_frontalface_default.xml',
+    'confidence': 0.6,                  # DNN detectors: minimum face score
+    'calibration_file': 'detector_calibration.json',
+    'recall_floor': 0.9,                # calibration: lowest acceptable recall vs the reference
+}
+
+# Encoder settings, shared by enrollment and live recognition so that gallery
+# and live encodings are comparable. num_jitters re-samples each face that many
+# times (N jitters cost about N times as much); 'large' aligns faces on 68
+# landmarks instead of 5. ATTENDANCE_ENCODER='{"num_jitters": 2}' overrides.
+encoder_config = dict({
+    'num_jitters': 1,
+    'model': 'small',
+}, **json.loads(os.environ.get('ATTENDANCE_ENCODER', '{}')))
+
+
+def _model_path(key):
+    path = backend_config[key]
+    return path if os.path.isabs(path) else os.path.join(backend_config['models_dir'], path)
+
+
+def _require(*paths):
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Detector model not found: {', '.join(missing)} "
+                                f"(set face_backends.backend_config or ATTENDANCE_MODELS)")
+
+
+def _clip(boxes, shape):
+    height, width = shape[:2]
+    clipped = []
+    for top, right, bottom, left in boxes:
+        top, left = max(int(top), 0), max(int(left), 0)
+        bottom, right = min(int(bottom), height), min(int(right), width)
+        if bottom > top and right > left:
+            clipped.append((top, right, bottom, left))
+    return clipped
+
+
+# Every detector takes a BGR image and returns boxes (top, right, bottom, left)
+# in its pixels, like face_recognition.face_locations
+
+# dlib's HOG detector: the original detector, accurate on frontal faces
+class HogDetector:
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def detect(self, bgr):
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        return _clip(face_recognition.face_locations(rgb, self.upsample), bgr.shape)
+
+
+# OpenCV's res10 SSD (Caffe): finds profile and small faces HOG misses
+class Res10Detector:
+    name = 'res10'
+
+    def __init__(self, confidence=None, input_size=300):
+        prototxt, weights = _model_path('res10_prototxt'), _model_path('res10_weights')
+        _require(prototxt, weights)
+        if not hasattr(cv2.dnn, 'readNetFromCaffe'):
+            raise RuntimeError("This OpenCV build cannot read Caffe models (removed in OpenCV 5); use yunet")
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.confidence = backend_config['confidence'] if confidence is None else confidence
+        self.input_size = input_size
+        self._lock = threading.Lock()   # a Net must not run two forward passes at once
+
+    def detect(self, bgr):
+        height, width = bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (self.input_size, self.input_size)), 1.0,
+                                     (self.input_size, self.input_size), (104.0, 177.0, 123.0))
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()[0, 0]
+        boxes = []
+        for detection in detections[detections[:, 2] >= self.confidence]:
+            x0, y0, x1, y1 = detection[3:7] * (width, height, width, height)
+            boxes.append((y0, x1, y1, x0))
+        return _clip(boxes, bgr.shape)
+
+
+# OpenCV's YuNet (ONNX): small and fast, the best choice on most CPUs
+class YuNetDetector:
+    name = 'yunet'
+
+    def __init__(self, confidence=None, nms_threshold=0.3):
+        model = _model_path('yunet_model')
+        _require(model)
+        confidence = backend_config['confidence'] if confidence is None else confidence
+        self.net = cv2.FaceDetectorYN.create(model, '', (320, 320), confidence, nms_threshold, 5000,
+                                             cv2.dnn.DNN_BACKEND_OPENCV, cv2.dnn.DNN_TARGET_CPU)
+        self._lock = threading.Lock()
+
+    def detect(self, bgr):
+        height, width = bgr.shape[:2]
+        with self._lock:
+            self.net.setInputSize((width, height))
+            _, faces = self.net.detect(bgr)
+        if faces is None:
+            return []
+        return _clip([(y, x + w, y + h, x) for x, y, w, h in faces[:, :4]], bgr.shape)
+
+
+# Viola-Jones Haar cascade: the cheapest, for low-end kiosks with close-up faces
+class HaarDetector:
+    name = 'haar'
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_size=24):
+        if not hasattr(cv2, 'CascadeClassifier'):
+            raise RuntimeError("This OpenCV build has no Haar cascades (OpenCV 5 moved them to opencv-contrib)")
+        path = backend_config['haar_cascade']
+        if not os.path.exists(path):
+            path = os.path.join(cv2.data.haarcascades, path)
+        self.cascade = cv2.CascadeClassifier(path)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade {path}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, bgr):
+        gray = cv2.equalizeHist(cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY))
+        faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors,
+                                              minSize=(self.min_size, self.min_size))
+        return _clip([(y, x + w, y + h, x) for x, y, w, h in faces], bgr.shape)
+
+
+DETECTORS = {
+    'hog': HogDetector,
+    'res10': Res10Detector,
+    'yunet': YuNetDetector,
+    'haar': HaarDetector,
+}
+
+
+# The backend 'auto' stands for: the one picked by the last saved calibration
+# run, or HOG when there is none
+def resolve_backend(name):
+    if name != 'auto':
+        return name
+    path = backend_config['calibration_file']
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as calibration_file:
+            chosen = json.load(calibration_file).get('chosen')
+        if chosen in DETECTORS:
+            return chosen
+    return 'hog'
+
+
+def create_detector(name='hog', **options):
+    name = resolve_backend(name)
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector backend {name}; choose from {', '.join(DETECTORS)} or auto")
+    return DETECTORS[name](**options)
+
+
+# face_recognition.face_encodings with the configured encoder settings
+def face_encodings(rgb, boxes=None, num_jitters=None, model=None):
+    return face_recognition.face_encodings(
+        rgb, boxes,
+        num_jitters=encoder_config['num_jitters'] if num_jitters is None else num_jitters,
+        model=encoder_config['model'] if model is None else model)
+
+
+def _area(box):
+    return (box[2] - box[0]) * (box[1] - box[3])
+
+
+def iou(a, b):
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    overlap = (bottom - top) * (right - left)
+    return overlap / float(_area(a) + _area(b) - overlap)
+
+
+# (reference boxes found, extra boxes) with greedy one-to-one IoU matching
+def _match_boxes(expected, found, min_iou=0.3):
+    unmatched = list(found)
+    hits = 0
+    for box in expected:
+        overlaps = [iou(box, other) for other in unmatched]
+        if overlaps and max(overlaps) >= min_iou:
+            unmatched.pop(int(np.argmax(overlaps)))
+            hits += 1
+    return hits, len(unmatched)
+
+
+# Run every backend over the same frames and measure latency and recall.
+# Recall is measured against truth ({frame index: [boxes]}) when given, or else
+# against what the reference detector (HOG upsampled twice: slow but sensitive)
+# finds. The chosen backend is the fastest one whose recall reaches the floor,
+# or the one with the best recall when none does. Frames without any reference
+# face say nothing about recall, so then none is chosen.
+def calibrate(frames, backends=None, recall_floor=None, truth=None, reference=None, min_iou=0.3):
+    recall_floor = backend_config['recall_floor'] if recall_floor is None else recall_floor
+    frames = list(frames)
+    if truth is None:
+        reference = reference or HogDetector(upsample=2)
+        truth = {index: reference.detect(frame) for index, frame in enumerate(frames)}
+    expected = sum(len(truth.get(index, ())) for index in range(len(frames)))
+
+    results = {}
+    for name in backends or list(DETECTORS):
+        try:
+            detector = create_detector(name)
+        except (FileNotFoundError, RuntimeError, cv2.error) as e:
+            results[name] = {'error': str(e)}
+            continue
+        detector.detect(frames[0])   # warm-up: model loading and first allocations
+        latencies, hits, extra = [], 0, 0
+        for index, frame in enumerate(frames):
+            start = time.perf_counter()
+            boxes = detector.detect(frame)
+            latencies.append(time.perf_counter() - start)
+            frame_hits, frame_extra = _match_boxes(truth.get(index, ()), boxes, min_iou)
+            hits += frame_hits
+            extra += frame_extra
+        results[name] = {
+            'median_ms': round(1000 * float(np.median(latencies)), 2),
+            'p95_ms': round(1000 * float(np.percentile(latencies, 95)), 2),
+            'recall': round(hits / expected, 3) if expected else None,
+            'extra_boxes': extra,
+        }
+
+    # Without reference faces every backend would look perfect
+    measured = {name: result for name, result in results.items() if 'error' not in result} if expected else {}
+    passing = [name for name, result in measured.items() if result['recall'] >= recall_floor]
+    if passing:
+        chosen = min(passing, key=lambda name: measured[name]['median_ms'])
+    elif measured:
+        chosen = max(measured, key=lambda name: (measured[name]['recall'], -measured[name]['median_ms']))
+    else:
+        chosen = None
+    return {'frames': len(frames), 'reference_faces': expected, 'recall_floor': recall_floor,
+            'chosen': chosen, 'meets_floor': bool(passing), 'backends': results}
+
+
+def save_calibration(report, path=None):
+    with open(path or backend_config['calibration_file'], 'w', encoding='utf-8') as calibration_file:
+        json.dump(report, calibration_file, indent=2)
+
+
+if __name__ == "__main__":
+    from bench_pipeline import read_frames
+
+    parser = argparse.ArgumentParser(description="Pick the fastest face detector that finds enough faces")
+    parser.add_argument('source', help="sample footage: a video file or a folder of images")
+    parser.add_argument('--frames', type=int, default=100, help="frames to use")
+    parser.add_argument('--every', type=int, default=5, help="use every n-th frame of a video")
+    parser.add_argument('--scale', type=float, default=0.5, help="detection scale the frames are resized to")
+    parser.add_argument('--backends', default=','.join(DETECTORS), help="comma separated")
+    parser.add_argument('--floor', type=float, default=backend_config['recall_floor'], help="minimum recall")
+    parser.add_argument('--truth', default=None,
+                        help="JSON {frame index: [[top, right, bottom, left], ...]} in full-frame pixels")
+    parser.add_argument('--save', action='store_true',
+                        help=f"write the result to {backend_config['calibration_file']} for backend 'auto'")
+    args = parser.parse_args()
+
+    frames, indices = [], []
+    for index, (_, frame) in enumerate(read_frames(args.source)):
+        if index % args.every == 0:
+            indices.append(index)
+            frames.append(cv2.resize(frame, (0, 0), None, args.scale, args.scale) if args.scale != 1.0 else frame)
+        if len(frames) >= args.frames:
+            break
+    if not frames:
+        raise SystemExit(f"No frames read from {args.source}")
+
+    truth = None
+    if args.truth:
+        with open(args.truth, encoding='utf-8') as truth_file:
+            boxes = {int(index): frame_boxes for index, frame_boxes in json.load(truth_file).items()}
+        # Keyed by position in frames, in the scaled pixels the detectors see
+        truth = {position: [tuple(int(v * args.scale) for v in box) for box in boxes.get(index, ())]
+                 for position, index in enumerate(indices)}
+
+    report = calibrate(frames, args.backends.split(','), args.floor, truth)
+    report['scale'] = args.scale
+    for name, result in report['backends'].items():
+        if 'error' in result:
+            print(f"{name:6} unavailable: {result['error']}")
+        else:
+            recall = 'n/a' if result['recall'] is None else f"{result['recall']:.3f}"
+            print(f"{name:6} median {result['median_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                  f"recall {recall}  extra boxes {result['extra_boxes']}")
+    if not report['reference_faces']:
+        raise SystemExit("No faces in the sample frames to measure recall against; use footage with faces or --truth")
+    if report['chosen'] is None:
+        raise SystemExit("No detector could be run")
+    if not report['meets_floor']:
+        print(f"No detector reached recall {args.floor}; best available is {report['chosen']}")
+    print(f"Recommended: ATTENDANCE_DETECTION='{{\"<camera id>\": {{\"backend\": \"{report['chosen']}\"}}}}'")
+    if args.save:
+        save_calibration(report)
+        print(f"Saved to {backend_config['calibration_file']}; cameras with backend 'auto' use {report['chosen']}")
@@ -0,0 +1,19 @@
+import cv2
+import numpy as np
+
+
+# Face crop with some context, and the box translated into the crop. Large
+# crops are downscaled: the encoder works on a 150 pixel face chip anyway.
+def crop_face(frame, box, margin=0.3, max_crop=300):
+    top, right, bottom, left = box
+    height, width = frame.shape[:2]
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    y0, x0 = max(top - pad_y, 0), max(left - pad_x, 0)
+    y1, x1 = min(bottom + pad_y, height), min(right + pad_x, width)
+    crop = np.ascontiguousarray(frame[y0:y1, x0:x1])
+    box = (top - y0, right - x0, bottom - y0, left - x0)
+    factor = max_crop / max(crop.shape[:2]) if max_crop and crop.size else 1.0
+    if factor < 1.0:
+        crop = cv2.resize(crop, (0, 0), None, factor, factor, interpolation=cv2.INTER_AREA)
+        box = tuple(int(v * factor) for v in box)
+    return crop, box
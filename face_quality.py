@@ -0,0 +1,156 @@
+import math
+import threading
+from collections import deque
+
+import cv2
+import face_recognition
+import numpy as np
+
+from metrics import faces_rejected_total
+from face_crops import crop_face
+
+# Pre-encoding face quality checks; camera_config['quality'] overrides them per
+# camera. Checks run cheapest first and stop at the first failure.
+quality_config = {
+    'enabled': True,
+    'min_face_px': 48,         # face box height in full-frame pixels
+    'min_brightness': 40,      # mean gray level (0-255) of the face
+    'max_brightness': 220,
+    'min_sharpness': 40.0,     # variance of the Laplacian of the face at 64x64
+    'check_pose': True,        # estimate head pose from the 5 landmarks
+    'max_yaw': 0.3,            # nose offset from the eye midpoint, in eye distances (0 = frontal)
+    'max_roll': 25.0,          # degrees the eye line may be tilted
+    'encode_score': 0.8,       # faces scoring this (0-1) are encoded at once...
+    'best_of': 3,              # ...others wait this many detection rounds for a better frame
+    'margin': 0.3,             # context kept around a face held for later
+    'max_crop': 300,
+}
+
+QUALITY_SIZE = 64
+
+
+# Head pose from 5-point landmarks: yaw as the sideways offset of the nose
+# from the middle of the eyes (in eye distances), roll as the eye line angle
+def estimate_pose(landmarks):
+    left = np.mean(landmarks['left_eye'], axis=0)
+    right = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.asarray(landmarks['nose_tip'][0], dtype=float)
+    axis = right - left
+    eye_distance = float(np.hypot(*axis))
+    if eye_distance == 0:
+        return float('inf'), 0.0
+    yaw = float(np.dot(nose - (left + right) / 2, axis)) / eye_distance ** 2
+    roll = math.degrees(math.atan2(axis[1], axis[0]))
+    return yaw, roll
+
+
+# Decides which detected faces are worth encoding. Faces failing a check are
+# dropped (counted per reason); acceptable ones are held on their track, and
+# only the best of up to best_of detection rounds is encoded, unless one is
+# good enough (encode_score) to encode straight away.
+class QualityGate:
+
+    def __init__(self, enabled=True, min_face_px=48, min_brightness=40, max_brightness=220, min_sharpness=40.0,
+                 check_pose=True, max_yaw=0.3, max_roll=25.0, encode_score=0.8, best_of=3, margin=0.3,
+                 max_crop=300):
+        self.enabled = enabled
+        self.min_face_px = min_face_px
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_sharpness = min_sharpness
+        self.check_pose = check_pose
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.encode_score = encode_score
+        self.best_of = max(1, int(best_of))
+        self.margin = margin
+        self.max_crop = max_crop
+
+        self.assessed = 0
+        self.accepted = 0
+        self.deferred = 0
+        self.encoded = 0
+        self.rejected = {}
+        self._scores = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    # (score between 0 and 1, None) for a usable face, (None, reason) otherwise
+    def assess(self, frame, box):
+        top, right, bottom, left = box
+        height = bottom - top
+        if height < self.min_face_px:
+            return None, 'small'
+
+        face = frame[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+        if face.size == 0:
+            return None, 'small'
+        gray = cv2.cvtColor(cv2.resize(face, (QUALITY_SIZE, QUALITY_SIZE), interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_RGB2GRAY)
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness:
+            return None, 'dark'
+        if brightness > self.max_brightness:
+            return None, 'bright'
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        if sharpness < self.min_sharpness:
+            return None, 'blurry'
+
+        frontal = 1.0
+        if self.check_pose:
+            landmarks = face_recognition.face_landmarks(frame, [box], model='small')
+            if not landmarks:
+                return None, 'pose'
+            yaw, roll = estimate_pose(landmarks[0])
+            if abs(yaw) > self.max_yaw or abs(roll) > self.max_roll:
+                return None, 'pose'
+            frontal = 1.0 - 0.5 * abs(yaw) / self.max_yaw if self.max_yaw else 1.0
+
+        # Twice the minimum sharpness and size count as fully sharp and large
+        score = (min(sharpness / (2 * self.min_sharpness), 1.0) if self.min_sharpness else 1.0) \
+            * min(height / (2.0 * self.min_face_px), 1.0) * frontal
+        return score, None
+
+    # Faces to encode now, as [(track, (crop, box in crop))], from the
+    # (track, full-frame box, score, reason) of each face of a detection round
+    # on an RGB frame, as assessed by assess(). Updates the tracks, so callers
+    # sharing a tracker between threads hold its lock.
+    def select(self, frame, assessed):
+        ready = []
+        for track, box, score, reason in assessed:
+            with self._lock:
+                self.assessed += 1
+                if reason:
+                    self.rejected[reason] = self.rejected.get(reason, 0) + 1
+                else:
+                    self.accepted += 1
+                    self._scores.append(score)
+            if reason:
+                faces_rejected_total.inc(reason=reason)
+
+            track.quality_rounds += 1
+            if score is not None and (track.best_face is None or score > track.best_face[0]):
+                track.best_face = (score, crop_face(frame, box, self.margin, self.max_crop))
+            if track.best_face is None:
+                continue
+            if track.best_face[0] >= self.encode_score or track.quality_rounds >= self.best_of:
+                ready.append((track, track.best_face[1]))
+                track.best_face = None
+                track.quality_rounds = 0
+            else:
+                with self._lock:
+                    self.deferred += 1
+        with self._lock:
+            self.encoded += len(ready)
+        return ready
+
+    def stats(self):
+        with self._lock:
+            scores = list(self._scores)
+            return {
+                'assessed': self.assessed,
+                'accepted': self.accepted,
+                'deferred': self.deferred,
+                'encoded': self.encoded,
+                'rejected': dict(self.rejected),
+                'avg_score': round(sum(scores) / len(scores), 3) if scores else 0.0,
+            }
@@ -0,0 +1,181 @@
+import itertools
+
+import cv2
+
+# Tracking between detections
+tracking_config = {
+    'enabled': True,
+    'detect_interval': 10,   # run full detection every N frames
+    'iou_threshold': 0.3,    # overlap needed to tie a detection to an existing track
+    'min_score': 0.5,        # template match score below which a track counts as lost
+    'max_missed': 2,         # detection rounds a track survives without being re-detected
+    'reverify_rounds': 3,    # identified tracks are encoded and matched again every N detection rounds
+}
+
+
+# Boxes are (top, right, bottom, left) like face_recognition.face_locations
+def box_iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+
+    def __init__(self, track_id, box, patch):
+        self.track_id = track_id
+        self.box = box
+        self.patch = patch
+        self.identity = None
+        self.distance = None
+        self.missed = 0
+        self.best_face = None      # (quality score, (crop, box)) held back for encoding
+        self.quality_rounds = 0    # detection rounds assessed since the last encoding
+        self.unverified_rounds = 0  # detection rounds since the identity was last confirmed
+
+
+# Runs detection only every detect_interval frames (or as soon as a track is
+# lost) and moves the boxes in between with template matching on the small
+# grayscale frame. Identities stay on their track, so faces that are already
+# recognized are not encoded on every detection round; they are checked again
+# every reverify_rounds rounds, since the box may have slid onto someone else
+# who stepped into the same spot.
+class FaceTracker:
+
+    def __init__(self, enabled=True, detect_interval=10, iou_threshold=0.3, min_score=0.5, max_missed=2,
+                 reverify_rounds=3):
+        self.enabled = enabled
+        self.detect_interval = max(1, int(detect_interval))
+        self.iou_threshold = iou_threshold
+        self.min_score = min_score
+        self.max_missed = max_missed
+        self.reverify_rounds = max(1, int(reverify_rounds))
+        self.tracks = []
+        self.frames_since_detection = 0
+        self.lost = False
+        self.detections = 0
+        self.propagations = 0
+        self.lost_tracks = 0
+        self.encodings_skipped = 0
+        self.reverifications = 0
+        self.identities_cleared = 0
+        self._ids = itertools.count(1)
+
+    def should_detect(self):
+        return (not self.enabled or self.lost or not self.tracks
+                or self.frames_since_detection >= self.detect_interval - 1)
+
+    @staticmethod
+    def _gray(frame):
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.ndim == 3 else frame
+
+    @staticmethod
+    def _crop(gray, box):
+        top, right, bottom, left = box
+        return gray[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+
+    # Move every track to its best template match near its last position
+    def propagate(self, frame):
+        self.frames_since_detection += 1
+        self.propagations += 1
+        gray = self._gray(frame)
+        height, width = gray.shape
+        kept = []
+        for track in self.tracks:
+            top, right, bottom, left = track.box
+            ph, pw = track.patch.shape
+            margin_y, margin_x = max(ph // 2, 4), max(pw // 2, 4)
+            y0, x0 = max(top - margin_y, 0), max(left - margin_x, 0)
+            y1, x1 = min(bottom + margin_y, height), min(right + margin_x, width)
+            window = gray[y0:y1, x0:x1]
+            if ph == 0 or pw == 0 or window.shape[0] < ph or window.shape[1] < pw:
+                self.lost = True
+                self.lost_tracks += 1
+                continue
+
+            scores = cv2.matchTemplate(window, track.patch, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if score < self.min_score:
+                self.lost = True
+                self.lost_tracks += 1
+                continue
+            track.box = (y0 + dy, x0 + dx + pw, y0 + dy + ph, x0 + dx)
+            kept.append(track)
+        self.tracks = kept
+
+    # Reconcile a detection round with the current tracks. Returns the tracks
+    # that need encoding and matching: new or not yet identified faces, and
+    # identified ones due to be verified again.
+    def update(self, frame, boxes):
+        self.detections += 1
+        self.frames_since_detection = 0
+        self.lost = False
+        gray = self._gray(frame)
+
+        unmatched = list(self.tracks)
+        updated = []
+        for box in boxes:
+            best, best_iou = None, self.iou_threshold
+            for track in unmatched:
+                overlap = box_iou(box, track.box)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is None:
+                best = Track(next(self._ids), box, None)
+            else:
+                unmatched.remove(best)
+            best.box = box
+            best.patch = self._crop(gray, box)
+            best.missed = 0
+            updated.append(best)
+
+        for track in unmatched:
+            track.missed += 1
+            if track.missed <= self.max_missed:
+                updated.append(track)
+        self.tracks = updated
+
+        detected = [track for track in updated if track.missed == 0]
+        if not self.enabled:
+            return detected
+        pending = []
+        for track in detected:
+            if track.identity is not None:
+                track.unverified_rounds += 1
+                if track.unverified_rounds < self.reverify_rounds:
+                    continue
+                self.reverifications += 1
+            pending.append(track)
+        self.encodings_skipped += len(detected) - len(pending)
+        return pending
+
+    # Record the gallery match (employee name, or None when the face matched
+    # nobody) for a track; True when it is identified as someone new. A track
+    # that no longer matches its identity loses it.
+    def identify(self, track, identity, distance):
+        newly_identified = identity is not None and track.identity != identity
+        if track.identity is not None and track.identity != identity:
+            self.identities_cleared += 1
+        track.identity = identity
+        track.distance = distance
+        track.unverified_rounds = 0
+        return newly_identified
+
+    def identified(self):
+        return [track for track in self.tracks if track.identity is not None]
+
+    def stats(self):
+        return {
+            'tracks': len(self.tracks),
+            'detections': self.detections,
+            'propagations': self.propagations,
+            'lost_tracks': self.lost_tracks,
+            'encodings_skipped': self.encodings_skipped,
+            'reverifications': self.reverifications,
+            'identities_cleared': self.identities_cleared,
+        }
@@ -0,0 +1,128 @@
+import numpy as np
+
+# Same strict threshold process_frame() has always used for a known face
+MATCH_THRESHOLD = 0.5
+
+# Above this many encodings the index switches to partitioned (approximate) search
+PARTITION_THRESHOLD = 20000
+
+
+# Holds every known encoding in one contiguous float32 matrix so that all faces
+# of a frame can be matched with a single matrix product instead of calling
+# compare_faces/face_distance once per face
+class GalleryIndex:
+
+    def __init__(self, encodings=(), names=(), partition_threshold=PARTITION_THRESHOLD, n_probe=8):
+        self.partition_threshold = partition_threshold
+        self.n_probe = n_probe
+        self.names = []
+        self.matrix = np.empty((0, 128), dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.centroids = None
+        self.partitions = None
+        self.add(encodings, names)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Append encodings (and their names) to the gallery and refresh the norms
+    def add(self, encodings, names):
+        names = list(names)
+        if len(names) == 0:
+            return
+        rows = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        if rows.shape[0] != len(names):
+            raise ValueError(f"Got {rows.shape[0]} encodings for {len(names)} names")
+
+        if len(self.names) == 0:
+            # A contiguous float32 matrix (e.g. the memory-mapped store) is used as is
+            self.matrix = np.ascontiguousarray(rows)
+        else:
+            self.matrix = np.ascontiguousarray(np.vstack([self.matrix, rows]))
+        self.norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.names.extend(names)
+
+        if len(self.names) >= self.partition_threshold:
+            self._build_partitions()
+        else:
+            self.centroids = None
+            self.partitions = None
+
+    # Coarse k-means over the gallery; search only probes the closest partitions
+    def _build_partitions(self, iterations=10):
+        n = self.matrix.shape[0]
+        n_partitions = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = self.matrix[rng.choice(n, n_partitions, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = self._nearest_rows(self.matrix, self.norms, centroids)
+            for c in range(n_partitions):
+                members = self.matrix[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+
+        assignment = self._nearest_rows(self.matrix, self.norms, centroids)
+        self.centroids = centroids
+        self.partitions = [np.flatnonzero(assignment == c) for c in range(n_partitions)]
+
+    @staticmethod
+    def _squared_distances(queries, query_norms, rows, row_norms):
+        d2 = query_norms[:, None] + row_norms[None, :] - 2.0 * (queries @ rows.T)
+        return np.maximum(d2, 0.0)
+
+    def _nearest_rows(self, rows, row_norms, centroids):
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        d2 = self._squared_distances(rows, row_norms, centroids, centroid_norms)
+        return np.argmin(d2, axis=1)
+
+    # Top-k gallery indices and euclidean distances for every query encoding.
+    # Returns two (M, k) arrays; missing neighbours are -1 / inf.
+    def search(self, queries, k=1):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, 128)
+        m = queries.shape[0]
+        indices = np.full((m, k), -1, dtype=np.int64)
+        distances = np.full((m, k), np.inf, dtype=np.float32)
+        if m == 0 or len(self) == 0:
+            return indices, distances
+
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+
+        if self.centroids is None:
+            d2 = self._squared_distances(queries, query_norms, self.matrix, self.norms)
+            self._top_k(d2, np.arange(len(self)), indices, distances, slice(None))
+            return indices, distances
+
+        # Partitioned search: each query scans only its n_probe nearest partitions
+        centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        cd2 = self._squared_distances(queries, query_norms, self.centroids, centroid_norms)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(cd2, n_probe - 1, axis=1)[:, :n_probe]
+        for q in range(m):
+            candidates = np.concatenate([self.partitions[c] for c in probes[q]])
+            if len(candidates) == 0:
+                continue
+            d2 = self._squared_distances(queries[q:q + 1], query_norms[q:q + 1],
+                                         self.matrix[candidates], self.norms[candidates])
+            self._top_k(d2, candidates, indices, distances, slice(q, q + 1))
+        return indices, distances
+
+    @staticmethod
+    def _top_k(d2, candidates, indices, distances, rows):
+        k = min(indices.shape[1], d2.shape[1])
+        part = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        part_d2 = np.take_along_axis(d2, part, axis=1)
+        order = np.argsort(part_d2, axis=1)
+        indices[rows, :k] = candidates[np.take_along_axis(part, order, axis=1)]
+        distances[rows, :k] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+
+    # Best match for each query: list of (gallery index or None, distance)
+    def match(self, queries, threshold=MATCH_THRESHOLD):
+        indices, distances = self.search(queries, k=1)
+        results = []
+        for index, distance in zip(indices[:, 0], distances[:, 0]):
+            if index >= 0 and distance <= threshold:
+                results.append((int(index), float(distance)))
+            else:
+                results.append((None, float(distance)))
+        return results
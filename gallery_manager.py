@@ -0,0 +1,128 @@
+import logging
+import threading
+
+import numpy as np
+
+from encoding_store import store
+from gallery_index import GalleryIndex
+from identities import build_identities, identity_config
+from metrics import gallery_size
+
+logger = logging.getLogger(__name__)
+
+
+# Immutable view of the gallery. Readers grab gallery.snapshot once per frame
+# and use it throughout, so a swap in the middle of a frame is harmless.
+# names holds the identity of every index row; an identity has several rows
+# (its template and kept samples), identities lists each one once.
+class GallerySnapshot:
+
+    def __init__(self, index, version):
+        self.index = index
+        self.names = tuple(index.names)
+        self.identities = tuple(dict.fromkeys(self.names))
+        self.version = version
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, encodings):
+        return self.index.match(encodings)
+
+
+# Owns the in-memory encodings. Enrollments are applied as copy-on-write updates
+# and published by swapping the snapshot reference, so the frame loop never
+# takes a lock. A watcher thread reloads the snapshot when another process
+# changes the encoding store. The store and apply_changes work on per-photo
+# samples; the published snapshot holds the identity templates built from them.
+class GalleryManager:
+
+    def __init__(self, encoding_store=store, poll_interval=2.0, identities=None):
+        self.store = encoding_store
+        self.poll_interval = poll_interval
+        self.identity_options = dict(identity_config, **(identities or {}))
+        self.reloads = 0
+        self.updates = 0
+        self.identity_report = {}
+        self._samples = (np.empty((0, 128), dtype=np.float32), [])
+        self._version = 0
+        self._signature = None
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._listeners = []
+        self.snapshot = GallerySnapshot(GalleryIndex(), 0)
+        self.reload()
+
+    def _publish(self, matrix, names):
+        self._samples = (matrix, list(names))
+        templates, template_names, self.identity_report = build_identities(matrix, names, **self.identity_options)
+        self._version += 1
+        self.snapshot = GallerySnapshot(GalleryIndex(templates, template_names), self._version)
+        gallery_size.set(len(self.snapshot.identities))
+        for callback in self._listeners:
+            try:
+                callback(self.snapshot)
+            except Exception:
+                logger.exception("Gallery listener error")
+
+    # callback(snapshot) runs after every swap, e.g. to republish it to other processes
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def reload(self):
+        with self._write_lock:
+            self.store.migrate_from_pickle()
+            signature = self.store.signature()
+            matrix, names = self.store.load()
+            self._publish(matrix, names)
+            self._signature = signature
+            self.reloads += 1
+        logger.info("Gallery loaded: %d identities from %d samples (%d pruned).",
+                    self.identity_report['identities'], self.identity_report['samples'],
+                    self.identity_report['pruned'])
+
+    # Apply an enrollment in memory: updates maps sample name -> encoding (new or
+    # replaced), deletions is an iterable of sample names to drop
+    def apply_changes(self, updates, deletions=()):
+        with self._write_lock:
+            current_matrix, current_names = self._samples
+            drop = set(deletions) | set(updates)
+            keep = [i for i, name in enumerate(current_names) if name not in drop]
+            names = [current_names[i] for i in keep] + list(updates)
+            rows = [np.asarray(current_matrix[keep], dtype=np.float32)] if keep else []
+            if updates:
+                rows.append(np.asarray(list(updates.values()), dtype=np.float32).reshape(-1, 128))
+            matrix = np.vstack(rows) if rows else np.empty((0, 128), dtype=np.float32)
+            self._publish(matrix, names)
+            # The store was written by the same enrollment; don't reload it again
+            self._signature = self.store.signature()
+            self.updates += 1
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                signature = self.store.signature()
+                if signature != self._signature:
+                    self.reload()
+            except Exception:
+                logger.exception("Gallery watcher error")
+
+    def start_watching(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name='gallery-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'size': len(self.snapshot),
+            'identities': len(self.snapshot.identities),
+            'samples': self.identity_report.get('samples', 0),
+            'pruned_samples': self.identity_report.get('pruned', 0),
+            'version': self.snapshot.version,
+            'reloads': self.reloads,
+            'updates': self.updates,
+        }
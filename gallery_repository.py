@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+import mysql.connector
+import numpy as np
+
+from encoding_store import DIMENSIONS, store
+from identities import identity_name
+from metrics import db_errors_total
+
+logger = logging.getLogger(__name__)
+
+
+# Encodings are stored as 128 little-endian float32 values (512 bytes), not pickles
+def encoding_to_bytes(encoding):
+    return np.asarray(encoding, dtype='<f4').reshape(DIMENSIONS).tobytes()
+
+
+def encoding_from_bytes(data):
+    return np.frombuffer(bytes(data), dtype='<f4').reshape(DIMENSIONS)
+
+
+# The database is the source of truth for the face gallery: one
+# employee_encoding row per enrollment photo, linked to its employee. The
+# local encoding store is a cache of it, used to start (and recognise) while
+# the database is unreachable. The repository has the interface of an
+# EncodingStore, so GalleryManager and enroll_folder use it unchanged; every
+# write goes to the database in one transaction first and then to the cache.
+# The cache folder also records which samples the database has held
+# (db_samples.json): a cached sample the database never saw, e.g. from the
+# EncodeFile.p gallery or an enrollment made while it was down, is copied up
+# rather than dropped; one it saw and no longer has was removed elsewhere.
+class GalleryRepository:
+
+    def __init__(self, pool, cache=store):
+        self.pool = pool
+        self.cache = cache
+        self.db_loads = 0
+        self.cache_loads = 0
+        self._emp_ids = {}
+        self._lock = threading.Lock()
+
+    # name -> emp_id of every employee, as of the last load or sync
+    def employee_ids(self):
+        with self._lock:
+            return dict(self._emp_ids)
+
+    def _load_employees(self, cursor):
+        cursor.execute("SELECT id, employee_name FROM employee")
+        emp_ids = {name: emp_id for emp_id, name in cursor.fetchall()}
+        with self._lock:
+            self._emp_ids = emp_ids
+        return emp_ids
+
+    def _seen_path(self):
+        return os.path.join(self.cache.root, 'db_samples.json')
+
+    def _seen_samples(self):
+        try:
+            with open(self._seen_path(), encoding='utf-8') as seen_file:
+                return set(json.load(seen_file))
+        except (OSError, ValueError):
+            return set()
+
+    def _remember_samples(self, names):
+        os.makedirs(self.cache.root, exist_ok=True)
+        tmp_path = self._seen_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as seen_file:
+            json.dump(sorted(names), seen_file)
+        os.replace(tmp_path, self._seen_path())
+
+    # Copy cached samples the database has never held into it. Returns the
+    # number copied.
+    def _upload_unseen(self, db_names):
+        cached_matrix, cached_names = self.cache.load()
+        known = set(db_names) | self._seen_samples()
+        rows = [row for row, name in enumerate(cached_names) if name not in known]
+        if not rows:
+            return 0
+        self._write(np.array(cached_matrix)[rows], [cached_names[row] for row in rows])
+        logger.info("Copied %d cached encodings into the database.", len(rows))
+        return len(rows)
+
+    # (matrix, sample names) read in one pass, then mirrored into the cache
+    def _load_from_db(self):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            self._load_employees(cursor)
+            cursor.execute("SELECT sample_name, encoding FROM employee_encoding ORDER BY sample_name")
+            rows = cursor.fetchall()
+            cursor.close()
+        names, blobs = [], []
+        for sample_name, encoding in rows:
+            if encoding is None or len(encoding) != 4 * DIMENSIONS:
+                logger.warning("Skipping malformed encoding for %s", sample_name)
+                continue
+            names.append(sample_name)
+            blobs.append(bytes(encoding))
+        matrix = np.frombuffer(b''.join(blobs), dtype='<f4').reshape(-1, DIMENSIONS).astype(np.float32)
+        return matrix, names
+
+    def load(self):
+        try:
+            matrix, names = self._load_from_db()
+            if self._upload_unseen(names):
+                matrix, names = self._load_from_db()
+        except mysql.connector.Error as err:
+            db_errors_total.inc(operation='gallery_load')
+            logger.warning("Gallery database unavailable, using the local cache: %s", err)
+            self.cache_loads += 1
+            return self.cache.load()
+        self.db_loads += 1
+        self._remember_samples(names)
+        cached_matrix, cached_names = self.cache.load()
+        if cached_names != names or not np.array_equal(cached_matrix, matrix):
+            self.cache.replace_all(matrix, names)
+        return matrix, names
+
+    # Changes whenever any process enrolls or removes a photo (every write bumps
+    # gallery_revision); falls back to the cache's signature while the database
+    # is down
+    def signature(self):
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT revision FROM gallery_revision WHERE id = 1")
+                row = cursor.fetchone()
+                cursor.close()
+            return 'db', row[0] if row else 0
+        except mysql.connector.Error:
+            return 'cache', self.cache.signature()
+
+    # Employee ids for the identities of these sample names, creating employees
+    # that are enrolled for the first time
+    def _ensure_employees(self, cursor, sample_names):
+        emp_ids = self._load_employees(cursor)
+        for identity in sorted({identity_name(name) for name in sample_names}):
+            if identity not in emp_ids:
+                cursor.execute("INSERT INTO employee (employee_name) VALUES (%s)", (identity,))
+                emp_ids[identity] = cursor.lastrowid
+        with self._lock:
+            self._emp_ids = dict(emp_ids)
+        return emp_ids
+
+    def _write(self, encodings, names, deletions=(), replace=False):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, DIMENSIONS)
+        names = list(names)
+        if len(encodings) != len(names):
+            raise ValueError(f"Got {len(encodings)} encodings for {len(names)} names")
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                emp_ids = self._ensure_employees(cursor, names)
+                if replace:
+                    cursor.execute("DELETE FROM employee_encoding")
+                # Replaced samples are deleted and inserted again; portable across backends
+                stale = sorted(set(deletions) | set(names))
+                for start in range(0, len(stale), 500):
+                    chunk = stale[start:start + 500]
+                    cursor.execute(f"DELETE FROM employee_encoding WHERE sample_name IN ({', '.join(['%s'] * len(chunk))})",
+                                   chunk)
+                cursor.executemany("""
+                    INSERT INTO employee_encoding (sample_name, emp_id, encoding, updated_at)
+                    VALUES (%s, %s, %s, %s)
+                """, [(name, emp_ids[identity_name(name)], encoding_to_bytes(encoding), now)
+                      for name, encoding in zip(names, encodings)])
+                cursor.execute("UPDATE gallery_revision SET revision = revision + 1 WHERE id = 1")
+                connection.commit()
+            except mysql.connector.Error:
+                connection.rollback()
+                db_errors_total.inc(operation='gallery_sync')
+                raise
+            finally:
+                cursor.close()
+
+    # EncodingStore interface: database first, then the local cache
+    def append(self, encodings, names):
+        names = list(names)
+        if not names:
+            return
+        self._write(encodings, names)
+        self.cache.append(encodings, names)
+
+    def remove(self, names):
+        names = list(names)
+        if not names:
+            return
+        self._write([], [], deletions=names)
+        self.cache.remove(names)
+
+    def replace_all(self, encodings, names):
+        self._write(encodings, names, replace=True)
+        self.cache.replace_all(encodings, names)
+
+    # Enrollment changes in one database transaction: updates maps sample
+    # name -> encoding, deletions lists sample names to drop
+    def sync(self, updates, deletions=()):
+        self._write(list(updates.values()), list(updates), deletions=deletions)
+        self.cache.sync(updates, deletions)
+
+    # Import EncodeFile.p into the cache, then copy every cached sample the
+    # database has never held into it, so an existing gallery carries over even
+    # when migration 5 already brought legacy employee encodings along
+    def migrate_from_pickle(self, pickle_path='EncodeFile.p'):
+        migrated = self.cache.migrate_from_pickle(pickle_path)
+        try:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT sample_name FROM employee_encoding")
+                db_names = [name for name, in cursor.fetchall()]
+                cursor.close()
+            if self._upload_unseen(db_names):
+                return True
+        except mysql.connector.Error as err:
+            logger.warning("Could not check the gallery database: %s", err)
+        return migrated
+
+    def stats(self):
+        with self._lock:
+            employees = len(self._emp_ids)
+        return {'employees': employees, 'db_loads': self.db_loads, 'cache_loads': self.cache_loads}
@@ -0,0 +1,84 @@
+import re
+
+import numpy as np
+
+# Enrollment photos are stored as one sample per photo ("Varun_1", "Varun_2",
+# ...). The live gallery matches against identities instead: every employee is
+# represented by one aggregated template plus a few of their own samples, so
+# its size follows headcount rather than the number of photos taken.
+identity_config = {
+    'template': 'mean',         # 'mean' or 'medoid' of the employee's samples
+    'max_samples': 4,           # samples kept next to the template, chosen to be far apart
+    'outlier_distance': 0.6,    # samples this far from the medoid are pruned...
+    'min_samples_to_prune': 3,  # ...but only when there are enough to tell which one is off
+}
+
+_sample_suffix = re.compile(r'^(.+)_\d+$')
+
+
+# "Varun_2" -> "Varun"; names without a photo counter are their own identity
+def identity_name(sample_name):
+    match = _sample_suffix.match(sample_name)
+    return match.group(1) if match else sample_name
+
+
+def _distances(rows, point):
+    return np.linalg.norm(rows - point, axis=1)
+
+
+def _center(samples, template):
+    if template == 'medoid' and len(samples) > 2:
+        pairwise = np.linalg.norm(samples[:, None, :] - samples[None, :, :], axis=2)
+        return samples[np.argmin(pairwise.sum(axis=1))]
+    return samples.mean(axis=0)
+
+
+# Greedy farthest-point pick: starts at the sample nearest the template and keeps
+# adding the one farthest from everything picked, so near-duplicate photos are
+# skipped in favour of other poses and lighting
+def _spread(samples, center, count):
+    if len(samples) <= count:
+        return np.arange(len(samples))
+    picked = [int(np.argmin(_distances(samples, center)))]
+    nearest = _distances(samples, samples[picked[0]])
+    while len(picked) < count:
+        picked.append(int(np.argmax(nearest)))
+        nearest = np.minimum(nearest, _distances(samples, samples[picked[-1]]))
+    return np.array(sorted(picked))
+
+
+# Aggregate per-photo samples into identity templates. Returns (matrix, names,
+# report): one row per template or kept sample, named by identity, and counts of
+# identities, samples and pruned samples.
+def build_identities(matrix, names, template='mean', max_samples=4, outlier_distance=0.6,
+                     min_samples_to_prune=3):
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(-1, 128)
+    groups = {}
+    for row, name in enumerate(names):
+        groups.setdefault(identity_name(name), []).append(row)
+
+    rows, row_names = [], []
+    pruned = 0
+    for identity, members in groups.items():
+        samples = matrix[members]
+        if len(samples) >= min_samples_to_prune:
+            # Measured from the medoid, which a bad photo cannot drag along like the mean
+            inliers = _distances(samples, _center(samples, 'medoid')) <= outlier_distance
+            if inliers.any() and not inliers.all():
+                pruned += int((~inliers).sum())
+                samples = samples[inliers]
+        center = _center(samples, template)
+
+        if len(samples) == 1:
+            rows.append(samples[0])
+            row_names.append(identity)
+            continue
+        rows.append(center)
+        row_names.append(identity)
+        for index in _spread(samples, center, max_samples):
+            rows.append(samples[index])
+            row_names.append(identity)
+
+    templates = np.vstack(rows).astype(np.float32) if rows else np.empty((0, 128), dtype=np.float32)
+    report = {'identities': len(groups), 'samples': len(names), 'pruned': pruned, 'templates': len(row_names)}
+    return templates, row_names, report
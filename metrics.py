@@ -0,0 +1,234 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus-style instrumentation. Components record into the
+# module-level registry; /metrics renders it in the text exposition format
+# together with the registries of the camera and recognition processes, which
+# send registry.collect() to the Flask process with their stats. Every sample
+# carries a process label ("web", "camera-<id>", "recognition_service").
+
+# Seconds; covers everything from a thumbnail diff to a slow DB flush
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    # Read the value from a callback at collection time (queue sizes and the like)
+    def set_function(self, function, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return values
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+
+class Registry:
+
+    def __init__(self, process='web'):
+        self.const_labels = {'process': process}
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered differently")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    # Drop recorded values, e.g. in a forked worker that inherited the parent's
+    def reset(self, process):
+        self.const_labels = {'process': process}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    # Picklable snapshot: {name: family}, with const_labels folded into every sample
+    def collect(self):
+        const_names = tuple(self.const_labels)
+        const_values = tuple(str(value) for value in self.const_labels.values())
+        with self._lock:
+            metrics = list(self._metrics.values())
+        families = {}
+        for metric in metrics:
+            families[metric.name] = {
+                'kind': metric.kind,
+                'documentation': metric.documentation,
+                'labelnames': metric.labelnames + const_names,
+                'buckets': getattr(metric, 'buckets', None),
+                'samples': {key + const_values: value for key, value in metric.samples().items()},
+            }
+        return families
+
+    # Text exposition of this registry plus families collected elsewhere
+    def render(self, others=()):
+        merged = self.collect()
+        for families in others:
+            for name, family in families.items():
+                if name in merged:
+                    # Samples differ by their process label, so they never collide
+                    merged[name]['samples'].update(family['samples'])
+                else:
+                    merged[name] = family
+
+        lines = []
+        for name in sorted(merged):
+            family = merged[name]
+            lines.append(f"# HELP {name} {family['documentation']}")
+            lines.append(f"# TYPE {name} {family['kind']}")
+            lines.extend(_sample_lines(name, family))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _sample_lines(name, family):
+    lines = []
+    names = family['labelnames']
+    for key, value in sorted(family['samples'].items()):
+        if family['kind'] != 'histogram':
+            lines.append(f"{name}{_label_text(names, key)} {_format(value)}")
+            continue
+        counts, total, count = value
+        for bound, bucket_count in zip(family['buckets'], counts):
+            lines.append(f"{name}_bucket{_label_text(names, key, [('le', _format(float(bound)))])} {bucket_count}")
+        lines.append(f"{name}_bucket{_label_text(names, key, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_label_text(names, key)} {_format(float(total))}")
+        lines.append(f"{name}_count{_label_text(names, key)} {count}")
+    return lines
+
+
+registry = Registry()
+
+# Shared metric families; components record into these directly
+stage_seconds = registry.histogram(
+    'attendance_stage_seconds', "Time spent per pipeline stage", ['stage'])
+faces_total = registry.counter(
+    'attendance_faces_total', "Faces by outcome: detected, matched or unknown", ['outcome'])
+attendance_total = registry.counter(
+    'attendance_events_total', "Attendance results from the database writer", ['result'])
+faces_rejected_total = registry.counter(
+    'attendance_faces_rejected_total', "Faces not encoded because of poor quality", ['reason'])
+deduped_total = registry.counter(
+    'attendance_deduped_total', "Sightings not sent to the database", ['reason'])
+db_errors_total = registry.counter(
+    'attendance_db_errors_total', "Failed database operations", ['operation'])
+gallery_size = registry.gauge(
+    'attendance_gallery_size', "Identities in the live gallery")
+queue_depth = registry.gauge(
+    'attendance_queue_depth', "Items waiting in a queue", ['queue'])
@@ -0,0 +1,233 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from broadcast import BroadcastHub
+from metrics import queue_depth, stage_seconds
+from stream_encoder import StreamEncoder
+
+logger = logging.getLogger(__name__)
+
+
+# Per-stage counters: processed/dropped frames, queue depth and latency
+class StageStats:
+
+    def __init__(self, name, window=100):
+        self.name = name
+        self.processed = 0
+        self.dropped = 0
+        self.queue_depth = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self.processed += 1
+            self._latencies.append(latency)
+
+    def drop(self, count=1):
+        with self._lock:
+            self.dropped += count
+
+    def snapshot(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            return {
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'queue_depth': self.queue_depth,
+                'avg_latency_ms': round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                'max_latency_ms': round(1000 * max(latencies), 2) if latencies else 0.0,
+            }
+
+
+# Always holds the most recent frame read from the capture device
+class FrameGrabber(threading.Thread):
+
+    def __init__(self, cap):
+        super().__init__(name='frame-grabber', daemon=True)
+        self.cap = cap
+        self.stats = StageStats('capture')
+        self.running = True
+        self._frame = None
+        self._seq = 0
+        self._timestamp = 0.0
+        self._cond = threading.Condition()
+
+    def run(self):
+        while self.running and self.cap.isOpened():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                logger.error("Failed to capture frame from camera.")
+                break
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._timestamp = time.time()
+                self._cond.notify_all()
+            self.stats.record(time.perf_counter() - start)
+            stage_seconds.observe(time.perf_counter() - start, stage='capture')
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+
+    # Latest (seq, timestamp, frame); blocks until a frame newer than after_seq arrives
+    def latest(self, after_seq=0, timeout=1.0):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or not self.running, timeout)
+            return self._seq, self._timestamp, self._frame
+
+    def stop(self):
+        self.running = False
+
+
+# Bounded pool of recognition workers. Only the newest frames are kept: when the
+# queue is full the oldest waiting frame is dropped, and frames older than
+# max_age seconds are skipped by the workers.
+class RecognitionPool:
+
+    def __init__(self, recognize, workers=2, max_queue=2, max_age=0.5):
+        self.recognize = recognize
+        self.max_age = max_age
+        self.stats = StageStats('recognition')
+        self.running = True
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._annotations = []
+        self._annotations_seq = 0
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'recognition-{i}', daemon=True)
+                         for i in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, seq, timestamp, frame):
+        while True:
+            try:
+                self._queue.put_nowait((seq, timestamp, frame))
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.stats.drop()
+                except queue.Empty:
+                    pass
+        self.stats.queue_depth = self._queue.qsize()
+        queue_depth.set(self.stats.queue_depth, queue='recognition')
+
+    def _work(self):
+        while self.running:
+            try:
+                seq, timestamp, frame = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.stats.queue_depth = self._queue.qsize()
+            if time.time() - timestamp > self.max_age:
+                self.stats.drop()
+                continue
+
+            start = time.perf_counter()
+            try:
+                annotations = self.recognize(frame)
+            except Exception:
+                logger.exception("Error during recognition")
+                continue
+            self.stats.record(time.perf_counter() - start)
+
+            with self._lock:
+                # A slower worker must not overwrite results from a newer frame
+                if seq > self._annotations_seq:
+                    self._annotations_seq = seq
+                    self._annotations = annotations
+
+    def annotations(self):
+        with self._lock:
+            return self._annotations
+
+    def stop(self):
+        self.running = False
+
+
+# Draw the latest recognition results on a preview frame.
+# Each annotation is (label, (top, right, bottom, left)) in full-frame pixels.
+def draw_annotations(frame, annotations):
+    for label, (top, right, bottom, left) in annotations:
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(frame, label, (left + 6, top - 20), cv2.FONT_HERSHEY_TRIPLEX,
+                    0.75, (255, 0, 0), 1)
+    return frame
+
+
+# Wires the stages together: the grabber runs at camera rate, every new frame is
+# offered to the recognition pool, and the encoder thread overlays the latest
+# annotations and publishes the stream chunk once to the broadcast hub.
+class FramePipeline:
+
+    def __init__(self, cap, recognize, workers=2, max_queue=2, max_age=0.5, encoder=None):
+        self.grabber = FrameGrabber(cap)
+        self.recognizer = RecognitionPool(recognize, workers, max_queue, max_age)
+        self.encoder = encoder or StreamEncoder()
+        self.hub = BroadcastHub()
+        self.encoder_stats = StageStats('encode')
+        self.running = False
+        self._start_lock = threading.Lock()
+        self._encoder = threading.Thread(target=self._encode_loop, name='stream-encoder', daemon=True)
+
+    def start(self):
+        with self._start_lock:
+            if self.running:
+                return
+            self.running = True
+        self.grabber.start()
+        self.recognizer.start()
+        self._encoder.start()
+
+    def _encode_loop(self):
+        seq = 0
+        while self.running and self.grabber.running:
+            new_seq, timestamp, frame = self.grabber.latest(seq)
+            if frame is None or new_seq == seq:
+                continue
+            seq = new_seq
+            # Recognition keeps marking attendance even when nobody is watching
+            self.recognizer.submit(seq, timestamp, frame)
+            if not self.hub.has_subscribers():
+                continue
+
+            start = time.perf_counter()
+            preview = draw_annotations(frame.copy(), self.recognizer.annotations())
+            chunk = self.encoder.encode(preview)
+            if chunk is None:
+                continue
+            self.encoder_stats.record(time.perf_counter() - start)
+            stage_seconds.observe(time.perf_counter() - start, stage='stream_encode')
+            self.hub.publish(chunk)
+        self.hub.close()
+
+    # Multipart stream chunks for one client, shared with every other client
+    def frames(self):
+        return self.hub.subscribe()
+
+    def latest_frame(self):
+        return self.grabber.latest()[2]
+
+    def stats(self):
+        return {
+            'capture': self.grabber.stats.snapshot(),
+            'recognition': self.recognizer.stats.snapshot(),
+            'encode': self.encoder_stats.snapshot(),
+            'stream': self.encoder.stats(),
+            'broadcast': self.hub.stats(),
+        }
+
+    def stop(self):
+        self.running = False
+        self.grabber.stop()
+        self.recognizer.stop()
+        self.hub.close()
@@ -0,0 +1,216 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from face_backends import encoder_config, face_encodings
+from face_crops import crop_face
+from metrics import queue_depth, registry, stage_seconds
+from shared_gallery import SharedGalleryReader
+
+logger = logging.getLogger(__name__)
+
+# Cross-camera micro-batching. Camera processes send face crops to one service
+# process, which waits at most max_wait for more faces (up to max_batch) and
+# then encodes and matches them all at once. A larger max_wait fills batches
+# better (throughput) at the cost of added latency per face.
+batching_config = {
+    'enabled': True,
+    'max_batch': 16,      # faces per batch
+    'max_wait': 0.02,     # seconds the first face of a batch may wait for company
+    'margin': 0.3,        # context kept around each face box in the crop, as a fraction of its size
+    'max_crop': 300,      # crops are downscaled to at most this many pixels per side
+    'timeout': 2.0,       # camera side: give up on a reply after this many seconds
+}
+
+
+# Encode a list of (rgb crop, box) in as few model calls as possible: landmarks
+# and face chips per face, then one batched pass of the descriptor network. Falls
+# back to one face_encodings call per face when the dlib build has no batch API.
+# Landmark model and jitters follow face_backends.encoder_config.
+def encode_faces(items):
+    if not items:
+        return []
+    try:
+        import dlib
+        from face_recognition.api import face_encoder, pose_predictor_5_point, pose_predictor_68_point
+        predictor = pose_predictor_68_point if encoder_config['model'] == 'large' else pose_predictor_5_point
+        chips = []
+        for crop, (top, right, bottom, left) in items:
+            shape = predictor(crop, dlib.rectangle(left, top, right, bottom))
+            chips.append(dlib.get_face_chip(crop, shape))
+        return [np.array(descriptor)
+                for descriptor in face_encoder.compute_face_descriptor(chips, encoder_config['num_jitters'])]
+    except (ImportError, AttributeError, TypeError):
+        return [face_encodings(crop, [box])[0] for crop, box in items]
+
+
+class BatchStats:
+
+    def __init__(self, max_batch, window=200):
+        self.max_batch = max_batch
+        self.batches = 0
+        self.faces = 0
+        self.started = time.time()
+        self._window = deque(maxlen=window)  # (faces, wait seconds, batch seconds)
+
+    def record(self, faces, wait, seconds):
+        self.batches += 1
+        self.faces += faces
+        self._window.append((faces, wait, seconds))
+
+    def snapshot(self, queue_depth=None):
+        window = list(self._window)
+        count = len(window) or 1
+        elapsed = time.time() - self.started
+        return {
+            'batches': self.batches,
+            'faces': self.faces,
+            'max_batch': self.max_batch,
+            'avg_batch_size': round(sum(w[0] for w in window) / count, 2),
+            'fill_ratio': round(sum(w[0] for w in window) / (count * self.max_batch), 3),
+            'avg_wait_ms': round(1000 * sum(w[1] for w in window) / count, 2),
+            'avg_batch_ms': round(1000 * sum(w[2] for w in window) / count, 2),
+            'faces_per_sec': round(self.faces / elapsed, 2) if elapsed else 0.0,
+            'queue_depth': queue_depth,
+        }
+
+
+# Body of the recognition service process. Requests are
+# (camera_id, request_id, sent_at, [(crop, box), ...]); each one is answered on
+# replies[camera_id] with (request_id, [(employee name or None, distance), ...]).
+def recognition_service(descriptor, options, requests, control, replies, events, stats_interval=1.0):
+    registry.reset('recognition_service')
+    gallery = SharedGalleryReader()
+    gallery.attach(descriptor)
+    max_batch, max_wait = options['max_batch'], options['max_wait']
+    stats = BatchStats(max_batch)
+    last_report = time.perf_counter()
+    stopping = False
+    try:
+        while not stopping:
+            while True:
+                try:
+                    message = control.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == 'gallery':
+                    try:
+                        gallery.attach(message[1])
+                    except FileNotFoundError:
+                        pass
+                elif message[0] == 'stop':
+                    stopping = True
+
+            if time.perf_counter() - last_report >= stats_interval:
+                try:
+                    depth = requests.qsize()
+                except NotImplementedError:
+                    depth = None
+                queue_depth.set(depth or 0, queue='batch_requests')
+                events.put(('service', None, stats.snapshot(depth)))
+                events.put(('metrics', None, registry.collect()))
+                last_report = time.perf_counter()
+
+            try:
+                batch = [requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            faces = len(batch[0][3])
+            deadline = time.perf_counter() + max_wait
+            while faces < max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                faces += len(batch[-1][3])
+
+            start = time.perf_counter()
+            wait = time.time() - batch[0][2]
+            items = [item for request in batch for item in request[3]]
+            try:
+                snapshot = gallery.snapshot
+                with stage_seconds.time(stage='encode'):
+                    encodings = encode_faces(items)
+                with stage_seconds.time(stage='match'):
+                    matches = snapshot.match(encodings)
+                results = [(snapshot.names[index] if index is not None else None, distance)
+                           for index, distance in matches]
+            except Exception:
+                logger.exception("Error in recognition batch")
+                results = [(None, float('inf'))] * len(items)
+
+            offset = 0
+            for camera_id, request_id, _, request_items in batch:
+                replies[camera_id].put((request_id, results[offset:offset + len(request_items)]))
+                offset += len(request_items)
+            stats.record(len(items), wait, time.perf_counter() - start)
+    finally:
+        gallery.close()
+
+
+# Camera side of the service: identify() ships the crops and blocks the calling
+# recognition thread until the batch containing them has been answered
+class BatchClient:
+
+    def __init__(self, camera_id, requests, replies, margin=0.3, timeout=2.0, max_crop=300):
+        self.camera_id = camera_id
+        self.requests = requests
+        self.replies = replies
+        self.margin = margin
+        self.max_crop = max_crop
+        self.timeout = timeout
+        self.sent = 0
+        self.timeouts = 0
+        self._round_trips = deque(maxlen=100)
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._receive, name='batch-replies', daemon=True).start()
+
+    def _receive(self):
+        while True:
+            request_id, results = self.replies.get()
+            with self._lock:
+                waiter = self._pending.pop(request_id, None)
+            if waiter is not None:
+                waiter[1] = results
+                waiter[0].set()
+
+    # [(employee name or None, distance)] for the boxes of an RGB frame
+    def identify(self, frame, boxes):
+        return self.identify_crops([crop_face(frame, box, self.margin, self.max_crop) for box in boxes])
+
+    # Same for face crops [(rgb crop, box in crop)]
+    def identify_crops(self, items):
+        if not items:
+            return []
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._pending[request_id] = waiter
+        start = time.time()
+        self.requests.put((self.camera_id, request_id, start, items))
+        self.sent += 1
+        if not waiter[0].wait(self.timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            self.timeouts += 1
+            return [(None, float('inf'))] * len(items)
+        self._round_trips.append(time.time() - start)
+        return waiter[1]
+
+    def stats(self):
+        round_trips = list(self._round_trips)
+        return {
+            'requests': self.sent,
+            'timeouts': self.timeouts,
+            'avg_round_trip_ms': round(1000 * sum(round_trips) / len(round_trips), 2) if round_trips else 0.0,
+        }
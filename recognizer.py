@@ -0,0 +1,130 @@
+import threading
+
+import cv2
+
+from adaptive_detector import AdaptiveDetector, detection_config
+from face_backends import face_encodings
+from face_tracker import FaceTracker, tracking_config
+from metrics import faces_total, stage_seconds
+from recognition_service import encode_faces
+
+
+# Encodes and matches faces in the calling thread. gallery is any object with a
+# .snapshot (GalleryManager in process, SharedGalleryReader in a camera worker).
+class LocalMatcher:
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    # [(employee name or None, distance)] for the boxes of an RGB frame
+    def identify(self, frame, boxes):
+        if not boxes:
+            return []
+        with stage_seconds.time(stage='encode'):
+            encodings = face_encodings(frame, boxes)
+        return self._match(encodings)
+
+    # Same for face crops [(rgb crop, box in crop)], e.g. held by a QualityGate
+    def identify_crops(self, items):
+        if not items:
+            return []
+        with stage_seconds.time(stage='encode'):
+            encodings = encode_faces(items)
+        return self._match(encodings)
+
+    def _match(self, encodings):
+        # The snapshot stays the same for the whole frame even if it is swapped
+        snapshot = self.gallery.snapshot
+        with stage_seconds.time(stage='match'):
+            matches = snapshot.match(encodings)
+        return [(snapshot.names[index] if index is not None else None, distance)
+                for index, distance in matches]
+
+
+# Detection, tracking and identification for one video stream. matcher is a
+# LocalMatcher or a recognition_service.BatchClient; on_identified(employee_name,
+# frame, distance) is called once per track when it is first recognized.
+# Tracking runs on a frame downscaled by `scale`; the detector picks its own
+# scale and faces are encoded from the full-resolution frame. With a quality
+# gate, poor faces are not encoded and each track is encoded from its best face.
+class FrameRecognizer:
+
+    def __init__(self, matcher, on_identified, tracker=None, scale=0.25, detector=None, quality=None):
+        self.matcher = matcher
+        self.on_identified = on_identified
+        self.tracker = tracker or FaceTracker(**tracking_config)
+        self.detector = detector or AdaptiveDetector(**detection_config)
+        self.quality = quality if quality is not None and quality.enabled else None
+        self.scale = scale
+        self._lock = threading.Lock()
+
+    # Label and full-frame box for every identified track
+    def track_annotations(self):
+        annotations = []
+        for track in self.tracker.identified():
+            top, right, bottom, left = (int(v / self.scale) for v in track.box)
+            annotations.append((track.identity, (top, right, bottom, left)))
+        return annotations
+
+    # Runs on the recognition workers of a FramePipeline and returns the boxes
+    # to draw. Between detection rounds the tracker only moves the existing boxes.
+    def __call__(self, frame):
+        frameS = cv2.resize(frame, (0, 0), None, self.scale, self.scale)
+        frameS = cv2.cvtColor(frameS, cv2.COLOR_BGR2RGB)
+
+        with self._lock:
+            if not self.tracker.should_detect():
+                self.tracker.propagate(frameS)
+                return self.track_annotations()
+
+        # Detect faces in the current frame (None: nothing moved, keep tracking)
+        faceBoxes = self.detector.detect(frame)
+        if faceBoxes is None:
+            with self._lock:
+                self.tracker.propagate(frameS)
+                return self.track_annotations()
+
+        # Only new, unidentified or due-for-verification tracks get encoded, and
+        # all of them are matched against the gallery in one lookup. Their full-frame boxes are
+        # taken under the lock: another worker's update() may move the same
+        # tracks as soon as it is released.
+        faceCurrFrame = [tuple(int(v * self.scale) for v in box) for box in faceBoxes]
+        fullBoxes = dict(zip(faceCurrFrame, faceBoxes))
+        with self._lock:
+            pendingTracks = self.tracker.update(frameS, faceCurrFrame)
+            pendingBoxes = [fullBoxes[track.box] for track in pendingTracks]
+        if not pendingTracks:
+            faceMatches = []
+        elif self.quality is None:
+            frameRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            faceMatches = self.matcher.identify(frameRGB, pendingBoxes)
+        else:
+            frameRGB = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            with stage_seconds.time(stage='quality'):
+                # The checks run unlocked; only the per-track bookkeeping is locked
+                assessed = [(track, box) + self.quality.assess(frameRGB, box)
+                            for track, box in zip(pendingTracks, pendingBoxes)]
+                with self._lock:
+                    ready = self.quality.select(frameRGB, assessed)
+            pendingTracks = [track for track, _ in ready]
+            faceMatches = self.matcher.identify_crops([face for _, face in ready])
+
+        for (employee_name, faceDis), track in zip(faceMatches, pendingTracks):
+            faces_total.inc(outcome='unknown' if employee_name is None else 'matched')
+            with self._lock:
+                newly_identified = self.tracker.identify(track, employee_name, faceDis)
+            if newly_identified:
+                self.on_identified(employee_name, frame, faceDis)
+
+        with self._lock:
+            return self.track_annotations()
+
+    def stats(self):
+        with self._lock:
+            stats = self.tracker.stats()
+        stats['detection'] = self.detector.stats()
+        if self.quality is not None:
+            stats['quality'] = self.quality.stats()
+        if hasattr(self.matcher, 'stats'):
+            stats['matcher'] = self.matcher.stats()
+        return stats
@@ -0,0 +1,225 @@
+import logging
+import pickle
+import sys
+from datetime import datetime
+
+import mysql.connector
+
+from snapshot_store import add_snapshot_columns
+
+logger = logging.getLogger(__name__)
+
+# Versioned schema changes applied on top of the tables create_table() makes.
+# Each migration runs once, in order, and is recorded in schema_version.
+#
+# MySQL commits every DDL statement on its own, so a failed migration cannot be
+# rolled back half way. Each step checks whether it is already done
+# (information_schema), so a re-run picks up where the failed one stopped.
+
+
+# Raised by a migration that cannot run yet, before it changes anything; it is
+# retried on the next run and does not hold back the migrations after it
+class MigrationDeferred(Exception):
+    pass
+
+
+def _dialect(connection):
+    return getattr(connection, 'dialect', 'mysql')
+
+
+def _index_exists(connection, cursor, table, index):
+    if _dialect(connection) == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = %s", (index,))
+    else:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def _create_index(connection, cursor, index, table, columns):
+    if not _index_exists(connection, cursor, table, index):
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+
+def _constraint_exists(cursor, table, constraint):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.table_constraints
+        WHERE constraint_schema = DATABASE() AND table_name = %s AND constraint_name = %s
+    """, (table, constraint))
+    return cursor.fetchone()[0] > 0
+
+
+def _snapshot_columns(connection, cursor):
+    add_snapshot_columns(connection)
+
+
+def _attendance_indexes(connection, cursor):
+    _create_index(connection, cursor, 'idx_employee_images_emp_time', 'employee_images', 'emp_id, capture_datetime')
+    _create_index(connection, cursor, 'idx_employee_images_name_time', 'employee_images',
+                  'employee_name, capture_datetime')
+    _create_index(connection, cursor, 'idx_employee_images_time', 'employee_images', 'capture_datetime')
+    _create_index(connection, cursor, 'idx_employee_name', 'employee', 'employee_name')
+
+
+# One row per employee per day; the primary key is the uniqueness guarantee the
+# per-day attendance check relies on
+def _attendance_summary(connection, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_summary
+        (
+            emp_id INT NOT NULL,
+            attendance_date DATE NOT NULL,
+            first_capture DATETIME NOT NULL,
+            PRIMARY KEY (emp_id, attendance_date)
+        )
+    """)
+    cursor.execute("""
+        INSERT IGNORE INTO attendance_summary (emp_id, attendance_date, first_capture)
+        SELECT emp_id, DATE(capture_datetime), MIN(capture_datetime)
+        FROM employee_images
+        GROUP BY emp_id, DATE(capture_datetime)
+    """)
+
+
+# SQLite cannot add constraints to existing tables, so the stand-in backend skips this.
+# Orphaned rows defer it instead of blocking the migrations after it.
+def _foreign_keys(connection, cursor):
+    if _dialect(connection) == 'sqlite':
+        logger.info("Skipping foreign keys on the SQLite backend.")
+        return
+    cursor.execute("""
+        SELECT COUNT(*) FROM employee_images i
+        LEFT JOIN employee e ON e.id = i.emp_id
+        WHERE e.id IS NULL
+    """)
+    orphans = cursor.fetchone()[0]
+    if orphans:
+        raise MigrationDeferred(f"{orphans} employee_images rows reference a missing employee; "
+                                f"fix them and restart to add the foreign keys")
+    if not _constraint_exists(cursor, 'employee_images', 'fk_employee_images_employee'):
+        cursor.execute("""
+            ALTER TABLE employee_images
+            ADD CONSTRAINT fk_employee_images_employee FOREIGN KEY (emp_id) REFERENCES employee (id)
+        """)
+    if not _constraint_exists(cursor, 'attendance_summary', 'fk_attendance_summary_employee'):
+        cursor.execute("""
+            ALTER TABLE attendance_summary
+            ADD CONSTRAINT fk_attendance_summary_employee FOREIGN KEY (emp_id) REFERENCES employee (id)
+        """)
+
+
+# One row per enrollment photo with its encoding as raw float32 bytes; the
+# pickled employee.faceEncoding values are carried over and no longer read
+def _employee_encodings(connection, cursor):
+    import numpy as np
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS employee_encoding
+        (
+            sample_name VARCHAR(150) PRIMARY KEY,
+            emp_id INT NOT NULL,
+            encoding BLOB NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+    """)
+    _create_index(connection, cursor, 'idx_employee_encoding_emp', 'employee_encoding', 'emp_id')
+    cursor.execute("SELECT id, employee_name, faceEncoding FROM employee WHERE faceEncoding IS NOT NULL")
+    rows = []
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for emp_id, employee_name, faceEncoding in cursor.fetchall():
+        try:
+            encoding = np.asarray(pickle.loads(faceEncoding), dtype='<f4').reshape(128)
+        except Exception:
+            logger.warning("Skipping unreadable encoding of employee %s", employee_name)
+            continue
+        rows.append((employee_name, emp_id, encoding.tobytes(), now))
+    cursor.executemany("""
+        INSERT IGNORE INTO employee_encoding (sample_name, emp_id, encoding, updated_at) VALUES (%s, %s, %s, %s)
+    """, rows)
+
+
+# One-row counter bumped by every gallery write in the same transaction, so
+# other processes notice a change even when it keeps the row count and lands
+# within the same second as the last one
+def _gallery_revision(connection, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS gallery_revision
+        (
+            id INT PRIMARY KEY,
+            revision BIGINT NOT NULL
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO gallery_revision (id, revision) VALUES (1, 0)")
+
+
+MIGRATIONS = [
+    (1, 'snapshot columns', _snapshot_columns),
+    (2, 'attendance indexes', _attendance_indexes),
+    (3, 'attendance summary', _attendance_summary),
+    (4, 'foreign keys', _foreign_keys),
+    (5, 'employee encodings', _employee_encodings),
+    (6, 'gallery revision', _gallery_revision),
+]
+
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version
+        (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_version")
+    versions = {row[0] for row in cursor.fetchall()}
+    connection.commit()
+    cursor.close()
+    return versions
+
+
+# Apply every pending migration; stops at the first failure so later ones never
+# run against a half-migrated schema. A deferred migration is skipped for now and
+# retried on the next start.
+def apply_migrations(connection, target=None):
+    done = applied_versions(connection)
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        cursor = connection.cursor()
+        try:
+            logger.info("Applying migration %s: %s", version, name)
+            migration(connection, cursor)
+            cursor.execute("""
+                INSERT INTO schema_version (version, name, applied_at) VALUES (%s, %s, %s)
+            """, (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            connection.commit()
+            applied.append(version)
+        except MigrationDeferred as reason:
+            connection.rollback()
+            logger.warning("Migration %s deferred: %s", version, reason)
+        except mysql.connector.Error as err:
+            connection.rollback()
+            logger.error("Migration %s failed: %s", version, err)
+            raise
+        finally:
+            cursor.close()
+    return applied
+
+
+if __name__ == "__main__":
+    from db_connection import create_pool, create_table
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+    try:
+        with create_pool().connection() as connection:
+            create_table(connection, migrate=False)
+            applied = apply_migrations(connection)
+            print(f"Applied migrations: {applied or 'none pending'}")
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+        sys.exit(1)
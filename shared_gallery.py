@@ -0,0 +1,80 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gallery_index import GalleryIndex
+from gallery_manager import GallerySnapshot
+
+
+# Publishes gallery snapshots into shared memory so every camera worker process
+# matches against one copy of the encodings. Each publish creates a new block;
+# the previous `keep` blocks stay around for workers that have not switched yet.
+class SharedGalleryWriter:
+
+    def __init__(self, keep=2):
+        self.keep = keep
+        self._blocks = []
+
+    # Copy a snapshot into a new block; returns the descriptor workers attach to
+    def publish(self, snapshot):
+        matrix = np.ascontiguousarray(snapshot.index.matrix, dtype=np.float32)
+        block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(matrix.shape, dtype=np.float32, buffer=block.buf)[:] = matrix
+        self._blocks.append(block)
+        while len(self._blocks) > self.keep:
+            self._release(self._blocks.pop(0))
+        return {
+            'name': block.name,
+            'rows': matrix.shape[0],
+            'names': list(snapshot.names),
+            'version': snapshot.version,
+        }
+
+    @staticmethod
+    def _release(block):
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        while self._blocks:
+            self._release(self._blocks.pop())
+
+
+# Worker side: maps the published block read-only and exposes it as .snapshot,
+# the same interface GalleryManager offers in process
+class SharedGalleryReader:
+
+    def __init__(self):
+        self.snapshot = GallerySnapshot(GalleryIndex(), 0)
+        self._block = None
+        self._retired = []
+
+    # Unmap old blocks once no frame in flight still uses their snapshot
+    def _close_retired(self):
+        still_used = []
+        for block in self._retired:
+            try:
+                block.close()
+            except BufferError:
+                still_used.append(block)
+        self._retired = still_used
+
+    def attach(self, descriptor):
+        block = shared_memory.SharedMemory(name=descriptor['name'])
+        matrix = np.ndarray((descriptor['rows'], 128), dtype=np.float32, buffer=block.buf)
+        matrix.flags.writeable = False
+        self.snapshot = GallerySnapshot(GalleryIndex(matrix, descriptor['names']), descriptor['version'])
+        if self._block is not None:
+            self._retired.append(self._block)
+        self._block = block
+        self._close_retired()
+
+    def close(self):
+        self.snapshot = GallerySnapshot(GalleryIndex(), 0)
+        if self._block is not None:
+            self._retired.append(self._block)
+            self._block = None
+        self._close_retired()
@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+
+import cv2
+import mysql.connector
+
+logger = logging.getLogger(__name__)
+
+# Attendance snapshots: downscaled JPEGs written either to a content-addressed
+# folder (only the reference goes in the row) or straight into a BLOB column
+snapshot_config = {
+    'mode': 'file',          # 'file' or 'blob'
+    'root': 'Snapshots',
+    'max_width': 480,
+    'quality': 75,
+}
+
+
+# Downscale and JPEG-encode a frame in memory
+def encode_snapshot(frame, max_width=snapshot_config['max_width'], quality=snapshot_config['quality']):
+    height, width = frame.shape[:2]
+    if max_width and width > max_width:
+        frame = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ret:
+        return None
+    return buffer.tobytes()
+
+
+class SnapshotStore:
+
+    def __init__(self, mode='file', root='Snapshots', max_width=480, quality=75):
+        self.mode = mode
+        self.root = root
+        self.max_width = max_width
+        self.quality = quality
+
+    def encode(self, frame):
+        return encode_snapshot(frame, self.max_width, self.quality)
+
+    # Files are named by the SHA-256 of their content, fanned out by prefix
+    def _path(self, ref):
+        return os.path.join(self.root, ref[:2], ref + '.jpg')
+
+    def save(self, jpeg_bytes):
+        ref = hashlib.sha256(jpeg_bytes).hexdigest()
+        path = self._path(ref)
+        if os.path.exists(path):
+            return ref
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so a crash never leaves a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(jpeg_bytes)
+        os.replace(tmp_path, path)
+        return ref
+
+    def load(self, ref):
+        with open(self._path(ref), 'rb') as image_file:
+            return image_file.read()
+
+    # Column values for a snapshot: a file reference or the bytes themselves
+    def persist(self, jpeg_bytes):
+        if jpeg_bytes is None:
+            return {'image_ref': None, 'image_blob': None}
+        if self.mode == 'file':
+            return {'image_ref': self.save(jpeg_bytes), 'image_blob': None}
+        return {'image_ref': None, 'image_blob': jpeg_bytes}
+
+    # JPEG bytes for an employee_images row, whichever way it was stored
+    def read(self, record):
+        if record.get('image_blob'):
+            return bytes(record['image_blob'])
+        if record.get('image_ref'):
+            try:
+                return self.load(record['image_ref'])
+            except OSError as e:
+                logger.warning("Missing snapshot %s: %s", record['image_ref'], e)
+                return None
+        if record.get('employee_image'):
+            return base64.b64decode(record['employee_image'])
+        return None
+
+
+store = SnapshotStore(**snapshot_config)
+
+
+# Add the snapshot columns to an employee_images table created before they existed
+def add_snapshot_columns(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM employee_images LIMIT 0")
+    cursor.fetchall()
+    columns = {column[0] for column in cursor.description}
+    if 'image_ref' not in columns:
+        cursor.execute("ALTER TABLE employee_images ADD COLUMN image_ref CHAR(64)")
+    if 'image_blob' not in columns:
+        cursor.execute("ALTER TABLE employee_images ADD COLUMN image_blob MEDIUMBLOB")
+    connection.commit()
+    cursor.close()
+
+
+# Move base64 LONGTEXT snapshots into the store, batch by batch, clearing the
+# old column as it goes so the migration can be stopped and resumed
+def migrate_base64_snapshots(connection, snapshot_store=store, batch_size=200):
+    add_snapshot_columns(connection)
+    migrated = 0
+    while True:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT id, employee_image FROM employee_images
+            WHERE employee_image IS NOT NULL
+            LIMIT %s
+        """, (batch_size,))
+        rows = cursor.fetchall()
+        if not rows:
+            cursor.close()
+            break
+
+        updates = []
+        for row_id, image_data_base64 in rows:
+            columns = snapshot_store.persist(base64.b64decode(image_data_base64))
+            updates.append((columns['image_ref'], columns['image_blob'], row_id))
+        cursor.executemany("""
+            UPDATE employee_images SET image_ref = %s, image_blob = %s, employee_image = NULL
+            WHERE id = %s
+        """, updates)
+        connection.commit()
+        cursor.close()
+        migrated += len(updates)
+        print(f"Migrated {migrated} snapshots...")
+    print(f"Snapshot migration finished: {migrated} rows moved.")
+    return migrated
+
+
+if __name__ == "__main__":
+    from db_connection import create_pool
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python snapshot_store.py migrate")
+        sys.exit(1)
+    try:
+        with create_pool().connection() as connection:
+            migrate_base64_snapshots(connection)
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
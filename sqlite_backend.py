@@ -0,0 +1,158 @@
+import re
+import sqlite3
+from datetime import date, datetime
+
+import mysql.connector
+
+# Local stand-in for the MySQL database. Connections and cursors mimic the parts
+# of mysql.connector that db_connection.py uses: %s placeholders, dictionary
+# cursors, DATE_FORMAT, INSERT IGNORE and mysql.connector.Error on failures, so the same
+# queries run unchanged against a SQLite file.
+
+_mysql_date_format = {
+    '%Y': '%Y', '%y': '%y', '%m': '%m', '%d': '%d', '%H': '%H', '%h': '%I',
+    '%I': '%I', '%i': '%M', '%S': '%S', '%s': '%S', '%p': '%p',
+}
+
+
+# sqlite3 errors as the mysql.connector classes the callers tell apart: a
+# locked or unopenable file is operational (worth retrying), bad data is not
+_error_classes = (
+    (sqlite3.IntegrityError, mysql.connector.errors.IntegrityError),
+    (sqlite3.DataError, mysql.connector.errors.DataError),
+    (sqlite3.OperationalError, mysql.connector.errors.OperationalError),
+    (sqlite3.ProgrammingError, mysql.connector.errors.ProgrammingError),
+)
+
+
+def _mysql_error(err):
+    for sqlite_class, mysql_class in _error_classes:
+        if isinstance(err, sqlite_class):
+            return mysql_class(msg=str(err))
+    return mysql.connector.errors.DatabaseError(msg=str(err))
+
+
+def _date_format(value, fmt):
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(str(value))
+    return re.sub(r'%[A-Za-z]', lambda m: moment.strftime(_mysql_date_format.get(m.group(0), m.group(0))), fmt)
+
+
+def _translate(query):
+    # MySQL '#' comment lines and AUTO_INCREMENT keys have no SQLite equivalent
+    query = '\n'.join(line for line in query.splitlines() if not line.strip().startswith('#'))
+    query = re.sub(r'INT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT', query, flags=re.I)
+    query = re.sub(r'INSERT\s+IGNORE', 'INSERT OR IGNORE', query, flags=re.I)
+    return query.replace('%s', '?')
+
+
+def _param(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+class SQLiteCursor:
+
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        self.dictionary = dictionary
+
+    def _wrap(self, call, *args):
+        try:
+            return call(*args)
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+
+    def execute(self, query, params=()):
+        self._wrap(self._cursor.execute, _translate(query), [_param(p) for p in params or ()])
+        return self
+
+    def executemany(self, query, seq_of_params):
+        rows = [[_param(p) for p in params] for params in seq_of_params]
+        self._wrap(self._cursor.executemany, _translate(query), rows)
+        return self
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._wrap(self._cursor.fetchone))
+
+    def fetchmany(self, size=1):
+        return [self._row(row) for row in self._wrap(self._cursor.fetchmany, size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._wrap(self._cursor.fetchall)]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+
+    dialect = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = self._open()
+
+    def _open(self):
+        try:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA foreign_keys=ON')
+        except sqlite3.Error as err:
+            raise _mysql_error(err) from err
+        connection.create_function('DATE_FORMAT', 2, _date_format)
+        return connection
+
+    # prepared/buffered are accepted for compatibility; sqlite3 caches statements itself
+    def cursor(self, dictionary=False, prepared=False, buffered=False):
+        return SQLiteCursor(self._connection, dictionary)
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def is_connected(self):
+        try:
+            self._connection.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self.is_connected():
+            if not reconnect:
+                raise mysql.connector.errors.InterfaceError(msg="SQLite connection is closed")
+            self._connection = self._open()
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Defaults for the /video_feed preview
+stream_config = {
+    'quality': 80,            # JPEG quality 1-100
+    'max_width': 960,         # downscale wider frames to this width, 0 keeps full size
+    'max_fps': 15,            # cap on output frames per second, 0 for no cap
+    'skip_unchanged': True,   # don't resend frames that look the same as the last one
+    'change_threshold': 2.0,  # mean abs difference (0-255) on a thumbnail that counts as a change
+    'keepalive': 2.0,         # resend an unchanged frame at least this often (seconds)
+}
+
+
+# Encodes preview frames to multipart JPEG chunks, applying the resolution, rate
+# and change caps from stream_config, and keeps bytes/sec and encode time counters
+class StreamEncoder:
+
+    def __init__(self, quality=80, max_width=960, max_fps=15, skip_unchanged=True,
+                 change_threshold=2.0, keepalive=2.0):
+        self.quality = int(quality)
+        self.max_width = int(max_width)
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.skip_unchanged = skip_unchanged
+        self.change_threshold = change_threshold
+        self.keepalive = keepalive
+
+        self.encoded = 0
+        self.skipped_rate = 0
+        self.skipped_unchanged = 0
+        self.total_bytes = 0
+        self._last_sent = 0.0
+        self._last_thumb = None
+        self._window = deque(maxlen=100)  # (timestamp, bytes, encode seconds)
+        self._lock = threading.Lock()
+
+    # Chunk for this frame, or None when it is held back by the fps cap or unchanged
+    def encode(self, frame):
+        now = time.monotonic()
+        if now - self._last_sent < self.min_interval:
+            self.skipped_rate += 1
+            return None
+
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+        if self.max_width and width > self.max_width:
+            scale = self.max_width / width
+            frame = cv2.resize(frame, (self.max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        if self.skip_unchanged:
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 24),
+                               interpolation=cv2.INTER_AREA).astype(np.int16)
+            unchanged = (self._last_thumb is not None
+                         and np.abs(thumb - self._last_thumb).mean() < self.change_threshold
+                         and now - self._last_sent < self.keepalive)
+            if unchanged:
+                self.skipped_unchanged += 1
+                return None
+            self._last_thumb = thumb
+
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            return None
+        frame_bytes = buffer.tobytes()
+        elapsed = time.perf_counter() - start
+
+        self._last_sent = now
+        with self._lock:
+            self.encoded += 1
+            self.total_bytes += len(frame_bytes)
+            self._window.append((now, len(frame_bytes), elapsed))
+
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n'
+                b'Content-Length: ' + str(len(frame_bytes)).encode() + b'\r\n\r\n'
+                + frame_bytes + b'\r\n')
+
+    def stats(self):
+        with self._lock:
+            window = list(self._window)
+        bytes_per_sec = 0.0
+        fps = 0.0
+        if len(window) > 1:
+            span = max(time.monotonic(), window[-1][0]) - window[0][0]
+            if span > 0:
+                bytes_per_sec = sum(entry[1] for entry in window) / span
+                fps = len(window) / span
+        return {
+            'encoded': self.encoded,
+            'skipped_rate': self.skipped_rate,
+            'skipped_unchanged': self.skipped_unchanged,
+            'total_bytes': self.total_bytes,
+            'bytes_per_sec': round(bytes_per_sec),
+            'fps': round(fps, 2),
+            'avg_encode_ms': round(1000 * sum(entry[2] for entry in window) / len(window), 2) if window else 0.0,
+        }
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The modules are top-level scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import ConnectionPool, create_table  # noqa: E402
+
+
+# A SQLite stand-in for the MySQL database (sqlite_backend) with two employees
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(backend='sqlite', pool_size=2, checkout_timeout=0.2,
+                          sqlite_path=str(tmp_path / 'attendance.sqlite3'))
+    with pool.connection() as connection:
+        create_table(connection)
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO employee (employee_name) VALUES (%s)", [('Varun',), ('Asha',)])
+        connection.commit()
+        cursor.close()
+    yield pool
+    pool.close()
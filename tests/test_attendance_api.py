@@ -0,0 +1,81 @@
+import importlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import db_connection
+from attendance_cache import AttendanceCache
+from event_bus import EventBus
+
+# POST /mark_attendance: retried events are marked once
+
+
+class Writer:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, employee_name, snapshot, capture_datetime=None):
+        self.submitted.append((employee_name, capture_datetime))
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    pytest.importorskip('face_recognition')
+    # webcam8 starts its services on import; keep them on SQLite in tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(db_connection.pool_config, 'backend', 'sqlite')
+    webcam8 = importlib.import_module('webcam8')
+    writer = Writer()
+    monkeypatch.setattr(webcam8, 'attendanceWriter', writer)
+    monkeypatch.setattr(webcam8, 'attendanceCache', AttendanceCache())
+    monkeypatch.setattr(webcam8, 'attendanceEvents', EventBus())
+    monkeypatch.setattr(webcam8, 'galleryRepository', SimpleNamespace(employee_ids=lambda: {'Varun': 1, 'Asha': 2}))
+    monkeypatch.setattr(webcam8, '_api_results', OrderedDict())
+    return webcam8.app.test_client(), writer
+
+
+def test_a_retried_event_id_is_marked_once(api):
+    client, writer = api
+    event = {'employee_name': 'Varun_2', 'event_id': 'cam1-42'}
+    first = client.post('/mark_attendance', json=event).get_json()
+    assert first == {'status': 'queued', 'employee_name': 'Varun', 'event_id': 'cam1-42'}
+    assert client.post('/mark_attendance', json=event).get_json() == first
+    assert len(writer.submitted) == 1
+
+    # Without an event_id the employee is simply already marked today
+    assert client.post('/mark_attendance', json={'employee_name': 'Varun'}).get_json()['status'] == 'already_marked'
+    assert len(writer.submitted) == 1
+
+
+def test_a_batch_gets_one_result_per_event(api):
+    client, writer = api
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    response = client.post('/mark_attendance', json={'events': [
+        {'employee_name': 'Asha', 'capture_datetime': yesterday, 'event_id': 7},
+        {'employee_name': 'Asha', 'capture_datetime': yesterday, 'event_id': 7},
+        {'employee_name': 'Nobody', 'event_id': 8},
+        {'employee_name': 'Asha', 'capture_datetime': 'yesterday'},
+    ]})
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['queued', 'queued', 'error', 'error']
+    assert writer.submitted == [('Asha', yesterday)]
+
+
+def test_failed_events_are_not_remembered(api):
+    client, writer = api
+    event = {'employee_name': 'Asha', 'image': 'not base64!', 'event_id': 'a'}
+    assert client.post('/mark_attendance', json=event).get_json()['status'] == 'error'
+    del event['image']
+    assert client.post('/mark_attendance', json=event).get_json()['status'] == 'queued'
+    assert [name for name, _ in writer.submitted] == ['Asha']
+
+
+def test_rejects_bad_requests(api, monkeypatch):
+    client, _ = api
+    assert client.post('/mark_attendance', data='[]', content_type='application/json').status_code == 400
+    assert client.post('/mark_attendance', json={'events': []}).status_code == 400
+    monkeypatch.setitem(importlib.import_module('webcam8').api_config, 'max_batch', 1)
+    assert client.post('/mark_attendance', json={'events': [{}, {}]}).status_code == 413
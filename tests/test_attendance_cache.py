@@ -0,0 +1,74 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import attendance_cache
+from attendance_cache import AttendanceCache
+from db_connection import insert_attendance_batch
+
+# Who is already marked today, kept in process
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+        self.day = date.today()
+
+    def monotonic(self):
+        return self.now
+
+    def today(self):
+        return self.day
+
+
+def test_cooldown_between_attempts_that_did_not_mark(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(attendance_cache, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    cache = AttendanceCache(cooldown=30)
+
+    assert cache.should_mark('Varun')
+    cache.record('Varun', {'status': 'unknown_employee'})
+    clock.now += 10
+    assert not cache.should_mark('Varun')
+    clock.now += 25
+    assert cache.should_mark('Varun')
+    assert (cache.stats()['cooldown_skips'], cache.stats()['misses']) == (1, 2)
+
+
+def test_marked_today_skips_until_the_day_changes(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(attendance_cache, 'date', clock)
+    cache = AttendanceCache()
+    cache._day = clock.day
+
+    assert cache.should_mark('Varun')
+    cache.record('Varun', {'status': 'marked'})
+    assert cache.is_marked('Varun') and not cache.should_mark('Varun')
+
+    clock.day += timedelta(days=1)
+    assert not cache.is_marked('Varun')
+    assert cache.should_mark('Varun')
+
+
+def test_results_for_other_days_do_not_count_as_today():
+    cache = AttendanceCache()
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    cache.record('Varun', {'status': 'marked', 'capture_datetime': yesterday})
+    assert not cache.is_marked('Varun')
+
+    today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cache.record('Varun', {'status': 'already_marked', 'capture_datetime': today})
+    assert cache.is_marked('Varun')
+
+
+def test_warm_loads_todays_marks_from_the_database(pool):
+    now = datetime.now()
+    with pool.connection() as connection:
+        insert_attendance_batch(connection, [
+            {'employee_name': 'Varun', 'capture_datetime': now.strftime("%Y-%m-%d %H:%M:%S")},
+            {'employee_name': 'Asha', 'capture_datetime': (now - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")},
+        ])
+        cache = AttendanceCache()
+        cache.warm(connection)
+    assert cache.is_marked('Varun')
+    assert not cache.is_marked('Asha')
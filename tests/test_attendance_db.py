@@ -0,0 +1,142 @@
+import json
+import threading
+
+import mysql.connector
+import pytest
+
+from attendance_writer import AttendanceWriter
+from db_connection import ConnectionPool, insert_attendance_batch
+
+# Attendance storage against the SQLite stand-in for MySQL (sqlite_backend)
+
+
+def event(name, capture_datetime, image=b'jpeg'):
+    return {'employee_name': name, 'capture_datetime': capture_datetime, 'image_ref': None, 'image_blob': image}
+
+
+def attendance_rows(pool):
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT employee_name, capture_datetime FROM employee_images ORDER BY id")
+        rows = [(name, str(moment)) for name, moment in cursor.fetchall()]
+        cursor.close()
+    return rows
+
+
+def test_insert_attendance_batch_marks_each_person_once_per_day(pool):
+    events = [
+        event('Varun', '2026-10-10 09:00:00'),
+        event('Varun', '2026-10-10 09:05:00'),
+        event('Varun', '2026-10-11 09:00:00'),
+        event('Asha', '2026-10-10 10:00:00'),
+        event('Nobody', '2026-10-10 10:00:00'),
+    ]
+    with pool.connection() as connection:
+        results = insert_attendance_batch(connection, events)
+    assert [status for _, status in results] == ['marked', 'already_marked', 'marked', 'marked',
+                                                 'unknown_employee']
+
+    # A repeat (e.g. a replayed spool) marks nobody twice
+    with pool.connection() as connection:
+        results = insert_attendance_batch(connection, events[:1])
+    assert [status for _, status in results] == ['already_marked']
+    assert attendance_rows(pool) == [('Varun', '2026-10-10 09:00:00'), ('Varun', '2026-10-11 09:00:00'),
+                                     ('Asha', '2026-10-10 10:00:00')]
+
+
+def test_insert_attendance_batch_uses_known_ids(pool):
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM employee WHERE employee_name = %s", ('Asha',))
+        asha = cursor.fetchone()[0]
+        cursor.close()
+        results = insert_attendance_batch(connection, [event('Asha', '2026-10-10 10:00:00'),
+                                                       event('Varun', '2026-10-10 10:00:00')],
+                                          known_ids={'Asha': asha})
+    assert [status for _, status in results] == ['marked', 'marked']
+
+
+def test_pool_times_out_when_all_connections_are_checked_out(pool):
+    with pool.connection(), pool.connection():
+        with pytest.raises(mysql.connector.errors.PoolError):
+            with pool.connection():
+                pass
+    stats = pool.stats()
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 0
+
+    # Released connections are handed out again
+    with pool.connection() as connection:
+        assert connection.is_connected()
+
+
+def test_pool_waiter_gets_a_released_connection(pool):
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.connection(), pool.connection():
+            held.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait(5)
+    threading.Timer(0.05, release.set).start()
+    with pool.connection() as connection:
+        assert connection.is_connected()
+    holder.join()
+    assert pool.stats()['waits'] == 1
+    assert pool.stats()['timeouts'] == 0
+
+
+def test_writer_spools_while_the_database_is_down_and_replays_once_it_is_back(pool, tmp_path):
+    spool_path = str(tmp_path / 'attendance_spool.jsonl')
+    down = ConnectionPool(backend='sqlite', sqlite_path=str(tmp_path / 'missing' / 'db.sqlite3'))
+    results = []
+    writer = AttendanceWriter(down, spool_path=spool_path, min_backoff=0.0,
+                              on_result=lambda name, result: results.append((name, result['status'])))
+
+    writer._flush([event('Varun', '2026-10-10 09:00:00'), event('Asha', '2026-10-10 10:00:00', None)])
+    assert writer.errors == 1
+    with open(spool_path, encoding='utf-8') as spool:
+        assert [json.loads(line)['employee_name'] for line in spool] == ['Varun', 'Asha']
+
+    # Back up: the spool goes first, then the new batch; the duplicate is skipped
+    writer.pool = pool
+    writer._flush([event('Varun', '2026-10-10 09:30:00')])
+    assert results == [('Varun', 'marked'), ('Asha', 'marked'), ('Varun', 'already_marked')]
+    assert writer.replayed == 2
+    assert not writer.has_spool()
+    assert attendance_rows(pool) == [('Varun', '2026-10-10 09:00:00'), ('Asha', '2026-10-10 10:00:00')]
+
+
+def test_writer_moves_events_that_always_fail_to_the_dead_letter_file(pool, tmp_path):
+    # Stands in for MySQL rejecting a snapshot too large for the image_blob column
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            CREATE TRIGGER image_blob_limit BEFORE INSERT ON employee_images
+            WHEN length(NEW.image_blob) > 16
+            BEGIN SELECT RAISE(ABORT, 'Data too long for column image_blob'); END
+        """)
+        connection.commit()
+        cursor.close()
+    spool_path = str(tmp_path / 'attendance_spool.jsonl')
+    dead_letter_path = str(tmp_path / 'attendance_dead_letter.jsonl')
+    results = []
+    writer = AttendanceWriter(pool, spool_path=spool_path, dead_letter_path=dead_letter_path,
+                              on_result=lambda name, result: results.append((name, result['status'])))
+
+    writer._flush([event('Varun', '2026-10-10 09:00:00', b'x' * 100), event('Asha', '2026-10-10 10:00:00')])
+    assert sorted(results) == [('Asha', 'marked'), ('Varun', 'failed')]
+    assert not writer.has_spool()
+    with open(dead_letter_path, encoding='utf-8') as dead_letters:
+        [failed] = [json.loads(line) for line in dead_letters]
+    assert failed['employee_name'] == 'Varun' and 'Data too long' in failed['error']
+
+    # Later events are not held up by it
+    writer._flush([event('Varun', '2026-10-10 09:05:00')])
+    assert results[-1] == ('Varun', 'marked')
+    assert writer.stats()['dead_letters'] == 1
+    assert attendance_rows(pool) == [('Asha', '2026-10-10 10:00:00'), ('Varun', '2026-10-10 09:05:00')]
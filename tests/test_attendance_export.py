@@ -0,0 +1,83 @@
+import csv
+import io
+import zipfile
+
+import pytest
+
+from attendance_export import export_name, stream_export
+from db_connection import insert_attendance_batch
+
+# Exports streamed chunk by chunk instead of built in memory
+
+
+@pytest.fixture
+def records(pool):
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO employee (employee_name) VALUES ('Varunx')")
+        connection.commit()
+        cursor.close()
+        insert_attendance_batch(connection, [
+            {'employee_name': 'Varun', 'capture_datetime': '2024-03-01 09:00:00', 'image_blob': b'jpeg-1'},
+            {'employee_name': 'Asha', 'capture_datetime': '2024-03-01 09:05:00'},
+            {'employee_name': 'Varunx', 'capture_datetime': '2024-03-01 09:10:00'},
+            {'employee_name': 'Varun', 'capture_datetime': '2024-03-02 08:55:00', 'image_blob': b'jpeg-2'},
+            {'employee_name': 'Varun', 'capture_datetime': '2024-03-04 09:00:00'},
+        ])
+    return pool
+
+
+def sheet_rows(data):
+    return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+
+def test_export_name():
+    assert export_name('2024-03-01') == 'attendance_report_2024-03-01'
+    assert export_name('2024-03-01', '2024-03-01') == 'attendance_report_2024-03-01'
+    assert export_name('2024-03-01', '2024-03-02') == 'attendance_report_2024-03-01_to_2024-03-02'
+
+
+def test_csv_is_streamed_one_chunk_at_a_time(records):
+    with records.connection() as connection:
+        chunks = list(stream_export(connection, '2024-03-01', '2024-03-02', chunk_size=2))
+    assert len(chunks) == 2
+    rows = sheet_rows(b''.join(chunks))
+    assert rows[0] == ['employee_name', 'emp_id', 'capture_datetime', 'image']
+    assert [(row[0], row[2]) for row in rows[1:]] == [
+        ('Varun', '2024-03-01 09:00:00'), ('Asha', '2024-03-01 09:05:00'),
+        ('Varunx', '2024-03-01 09:10:00'), ('Varun', '2024-03-02 08:55:00')]
+
+
+def test_employee_filter_matches_photo_names_but_not_prefixes(records):
+    with records.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("UPDATE employee_images SET employee_name = 'Varun_2' WHERE capture_datetime = '2024-03-02 08:55:00'")
+        connection.commit()
+        cursor.close()
+        rows = sheet_rows(b''.join(stream_export(connection, '2024-03-01', '2024-03-04', ['Varun'])))
+    assert [row[0] for row in rows[1:]] == ['Varun', 'Varun_2', 'Varun']
+
+
+def test_zip_holds_the_sheet_and_the_snapshots(records):
+    with records.connection() as connection:
+        data = b''.join(stream_export(connection, '2024-03-01', '2024-03-02', ['Varun', 'Asha'], images=True,
+                                      chunk_size=1))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert sorted(archive.namelist()) == [
+            'attendance_report_2024-03-01_to_2024-03-02.csv',
+            'images/Varun_2024-03-01_09-00-00.jpg',
+            'images/Varun_2024-03-02_08-55-00.jpg']
+        assert archive.read('images/Varun_2024-03-02_08-55-00.jpg') == b'jpeg-2'
+        rows = sheet_rows(archive.read('attendance_report_2024-03-01_to_2024-03-02.csv'))
+    assert [(row[0], row[3]) for row in rows[1:]] == [
+        ('Varun', 'images/Varun_2024-03-01_09-00-00.jpg'), ('Asha', ''),
+        ('Varun', 'images/Varun_2024-03-02_08-55-00.jpg')]
+
+
+def test_xlsx_export(records):
+    openpyxl = pytest.importorskip('openpyxl')
+    with records.connection() as connection:
+        data = b''.join(stream_export(connection, '2024-03-04', fmt='xlsx'))
+    sheet = openpyxl.load_workbook(io.BytesIO(data)).active
+    assert [cell.value for cell in sheet[2]][:3] == ['Varun', 1, '2024-03-04 09:00:00']
+    assert sheet.max_row == 2
@@ -0,0 +1,86 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from encoding_store import DIMENSIONS, HEADER, EncodingStore
+
+# The append-only binary gallery that replaced EncodeFile.p
+
+
+def row(value):
+    return np.full(DIMENSIONS, value, dtype=np.float32)
+
+
+def as_dict(store):
+    matrix, names = store.load()
+    return {name: float(matrix[i][0]) for i, name in enumerate(names)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EncodingStore(str(tmp_path / 'Encodings'), compact_ratio=0.9)
+
+
+def test_an_empty_store_loads_nothing(store):
+    matrix, names = store.load()
+    assert matrix.shape == (0, DIMENSIONS) and names == []
+    assert store.signature() is None
+
+
+def test_sync_replaces_updates_and_drops_deletions(store):
+    store.replace_all([row(1), row(2), row(3)], ['Asha_1', 'Varun_1', 'Ravi_1'])
+    first = store.signature()
+
+    store.sync({'Varun_1': row(20), 'Mary_Ann_1': row(4)}, ['Ravi_1'])
+    assert as_dict(store) == {'Asha_1': 1.0, 'Varun_1': 20.0, 'Mary_Ann_1': 4.0}
+    assert store.signature() != first
+
+    # A name both updated and deleted is kept with its new encoding
+    store.sync({'Asha_1': row(10)}, ['Asha_1'])
+    assert as_dict(store)['Asha_1'] == 10.0
+
+
+def test_replace_all_starts_a_new_generation(store):
+    store.append([row(1)], ['Asha_1'])
+    generation = store.generation()
+    store.replace_all([row(5)], ['Ravi_1'])
+    assert store.generation() == generation + 1
+    assert as_dict(store) == {'Ravi_1': 5.0}
+    assert not os.path.exists(store._paths(generation)[0])
+    with pytest.raises(ValueError):
+        store.replace_all([row(1), row(2)], ['only one'])
+
+
+def test_compaction_keeps_the_live_rows(tmp_path):
+    store = EncodingStore(str(tmp_path / 'Encodings'), compact_ratio=0.5)
+    store.replace_all([row(1), row(2), row(3)], ['a', 'b', 'c'])
+    generation = store.generation()
+    store.remove(['a', 'b'])
+    assert store.generation() == generation + 1
+    assert as_dict(store) == {'c': 3.0}
+    assert os.path.getsize(store._paths(store.generation())[0]) == HEADER.size + 4 * DIMENSIONS
+
+
+def test_a_crash_mid_append_loses_only_the_torn_write(store):
+    store.replace_all([row(1)], ['Asha_1'])
+    matrix_path, names_path = store._paths(store.generation())
+    with open(matrix_path, 'ab') as matrix_file:
+        matrix_file.write(b'\0' * 100)
+    with open(names_path, 'a', encoding='utf-8') as names_file:
+        names_file.write('{"row": 1, "na')
+
+    assert as_dict(store) == {'Asha_1': 1.0}
+    store.append([row(2)], ['Varun_1'])
+    assert as_dict(store) == {'Asha_1': 1.0, 'Varun_1': 2.0}
+
+
+def test_migrates_the_pickled_gallery_once(store, tmp_path):
+    pickle_path = str(tmp_path / 'EncodeFile.p')
+    with open(pickle_path, 'wb') as pickle_file:
+        pickle.dump([[row(7)], ['Varun']], pickle_file)
+
+    assert store.migrate_from_pickle(pickle_path)
+    assert as_dict(store) == {'Varun': 7.0}
+    assert not store.migrate_from_pickle(pickle_path)
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+import enrollment  # noqa: E402
+from encoding_store import EncodingStore  # noqa: E402
+from gallery_repository import GalleryRepository  # noqa: E402
+
+# Directory enrollment into the shared gallery database. Encodings come from the
+# photo bytes instead of dlib, and the pool runs in threads so the stub applies.
+
+
+def fake_encode(path):
+    with open(path, 'rb') as image_file:
+        data = image_file.read()
+    return path, np.full(128, len(data) / 1000.0, dtype=np.float32), None
+
+
+@pytest.fixture
+def repository(pool, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(enrollment, 'encode_image_file', fake_encode)
+    monkeypatch.setattr(enrollment, 'ProcessPoolExecutor',
+                        lambda max_workers=None, mp_context=None: ThreadPoolExecutor(max_workers))
+    return GalleryRepository(pool, cache=EncodingStore(str(tmp_path / 'Encodings')))
+
+
+def add_photos(folder, *names):
+    folder.mkdir(parents=True, exist_ok=True)
+    for index, name in enumerate(names):
+        (folder / f'{name}.jpg').write_bytes(b'x' * (100 + index))
+
+
+def db_samples(pool):
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT sample_name FROM employee_encoding ORDER BY sample_name")
+        names = [name for name, in cursor.fetchall()]
+        cursor.close()
+    return names
+
+
+def test_enrolling_two_folders_keeps_both(repository, pool, tmp_path):
+    add_photos(tmp_path / 'Employee_Images', 'Asha_1', 'Varun_1')
+    add_photos(tmp_path / 'hr_batch', 'Ravi_1')
+
+    report = enrollment.enroll_folder(str(tmp_path / 'Employee_Images'), progress=False, store=repository)
+    assert report['encoded'] == 2
+    report = enrollment.enroll_folder(str(tmp_path / 'hr_batch'), progress=False, store=repository)
+    assert (report['encoded'], report['removed'], report['gallery_size']) == (1, 0, 3)
+    assert db_samples(pool) == ['Asha_1', 'Ravi_1', 'Varun_1']
+
+    # A photo removed from one folder drops only its own sample
+    (tmp_path / 'Employee_Images' / 'Varun_1.jpg').unlink()
+    report = enrollment.enroll_folder(str(tmp_path / 'Employee_Images'), progress=False, store=repository)
+    assert report['removed'] == 1
+    assert db_samples(pool) == ['Asha_1', 'Ravi_1']
+
+
+def test_fresh_manifest_never_wipes_the_database(repository, pool, tmp_path):
+    add_photos(tmp_path / 'Employee_Images', 'Asha_1', 'Varun_1')
+    enrollment.enroll_folder(str(tmp_path / 'Employee_Images'), progress=False, store=repository)
+
+    # Another host, with its own empty cache and no manifest, enrolls its folder
+    other_host = tmp_path / 'other_host'
+    add_photos(other_host / 'Employee_Images', 'Ravi_1')
+    other = GalleryRepository(pool, cache=EncodingStore(str(other_host / 'Encodings')))
+    enrollment.enroll_folder(str(other_host / 'Employee_Images'), progress=False, store=other)
+    assert db_samples(pool) == ['Asha_1', 'Ravi_1', 'Varun_1']
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from event_bus import EventBus
+
+# Attendance updates fanned out to the /events streams
+
+
+def test_a_new_listener_gets_only_what_comes_next():
+    bus = EventBus()
+    bus.publish('attendance', {'employee_name': 'Asha'})
+    events = bus.subscribe(timeout=0.01)
+    assert next(events) is None
+    bus.publish('attendance', {'employee_name': 'Varun', 'status': 'queued'})
+    event_id, kind, data = next(events)
+    assert (event_id, kind) == (2, 'attendance')
+    assert data['employee_name'] == 'Varun' and data['status'] == 'queued' and 'time' in data
+
+
+def test_reconnecting_with_the_last_event_id_replays_the_missed_events():
+    bus = EventBus()
+    for name in ('Asha', 'Varun', 'Ravi'):
+        bus.publish('attendance', {'employee_name': name})
+    events = bus.subscribe(last_id=1, timeout=0.01)
+    assert [next(events)[2]['employee_name'] for _ in range(2)] == ['Varun', 'Ravi']
+    assert next(events) is None
+    # An id from before a restart is not in the future
+    assert next(bus.subscribe(last_id=99, timeout=0.01)) is None
+
+
+def test_only_the_history_is_replayed():
+    bus = EventBus(history=2)
+    for i in range(5):
+        bus.publish('attendance', {'n': i})
+    events = bus.subscribe(last_id=0, timeout=0.01)
+    assert [next(events)[0] for _ in range(2)] == [4, 5]
+
+
+def test_every_listener_gets_every_event_and_close_ends_them():
+    bus = EventBus()
+    received = [[], []]
+    ready = threading.Barrier(3)
+
+    def listen(seen):
+        events = bus.subscribe(last_id=0, timeout=1.0)
+        ready.wait()
+        for event in events:
+            if event is not None:
+                seen.append(event[2]['n'])
+
+    threads = [threading.Thread(target=listen, args=(seen,)) for seen in received]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for i in range(3):
+        bus.publish('attendance', {'n': i})
+    deadline = time.monotonic() + 2
+    while any(len(seen) < 3 for seen in received) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert bus.stats()['subscribers'] == 2
+    bus.close()
+    for thread in threads:
+        thread.join(1.0)
+    assert received == [[0, 1, 2], [0, 1, 2]]
+    assert bus.stats()['subscribers'] == 0
@@ -0,0 +1,42 @@
+import numpy as np
+
+from face_tracker import FaceTracker
+
+# Identities carried by tracks between detection rounds
+
+BOX = (20, 60, 60, 20)
+
+
+def frame():
+    return np.random.default_rng(0).integers(0, 255, (120, 160), dtype=np.uint8)
+
+
+def test_identified_tracks_are_verified_again_every_few_rounds():
+    tracker = FaceTracker(reverify_rounds=3)
+    [track] = tracker.update(frame(), [BOX])
+    assert tracker.identify(track, 'Varun', 0.3)
+
+    assert tracker.update(frame(), [BOX]) == []
+    assert tracker.update(frame(), [BOX]) == []
+    assert tracker.update(frame(), [BOX]) == [track]
+    assert tracker.stats()['reverifications'] == 1
+
+    # Still the same person: nothing new to report, and the count starts over
+    assert not tracker.identify(track, 'Varun', 0.35)
+    assert tracker.update(frame(), [BOX]) == []
+
+
+def test_a_different_face_in_the_same_spot_does_not_keep_the_identity():
+    tracker = FaceTracker(reverify_rounds=1)
+    [track] = tracker.update(frame(), [BOX])
+    tracker.identify(track, 'Varun', 0.3)
+
+    # Someone unknown took the spot: the identity is cleared
+    assert tracker.update(frame(), [BOX]) == [track]
+    assert not tracker.identify(track, None, 0.8)
+    assert track.identity is None and tracker.identified() == []
+
+    # Someone else known: reported as newly identified
+    assert tracker.update(frame(), [BOX]) == [track]
+    assert tracker.identify(track, 'Asha', 0.3)
+    assert tracker.stats()['identities_cleared'] == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from gallery_index import GalleryIndex
+
+# Batched matching against the gallery matrix
+
+
+def gallery(count, seed=0):
+    return np.random.default_rng(seed).normal(0, 0.2, (count, 128)).astype(np.float32)
+
+
+def brute_force(encodings, queries, k):
+    distances = np.linalg.norm(queries[:, None, :] - encodings[None, :, :], axis=2)
+    order = np.argsort(distances, axis=1)[:, :k]
+    return order, np.take_along_axis(distances, order, axis=1)
+
+
+def test_search_returns_the_exact_top_k_in_order():
+    encodings = gallery(200)
+    queries = encodings[[3, 50, 199]] + 0.01
+    index = GalleryIndex(encodings, [f'p{i}' for i in range(200)])
+
+    indices, distances = index.search(queries, k=5)
+    expected_indices, expected_distances = brute_force(encodings, queries, 5)
+    assert np.array_equal(indices, expected_indices)
+    assert np.allclose(distances, expected_distances, atol=1e-4)
+
+
+def test_search_pads_when_the_gallery_is_smaller_than_k():
+    index = GalleryIndex(gallery(2), ['a', 'b'])
+    indices, distances = index.search(gallery(1, seed=1), k=4)
+    assert list(indices[0, 2:]) == [-1, -1]
+    assert np.isinf(distances[0, 2:]).all()
+
+    indices, distances = GalleryIndex().search(gallery(3), k=1)
+    assert (indices == -1).all()
+
+
+def test_match_applies_the_threshold():
+    encodings = gallery(10)
+    index = GalleryIndex(encodings, list('abcdefghij'))
+    far = np.full(128, 5.0, dtype=np.float32)
+    [(found, distance), (missing, far_distance)] = index.match([encodings[4] + 0.001, far])
+    assert found == 4 and distance < 0.05
+    assert missing is None and far_distance > 0.5
+
+
+def test_partitioned_search_finds_near_duplicates():
+    encodings = gallery(900)
+    index = GalleryIndex(encodings, [str(i) for i in range(900)], partition_threshold=500, n_probe=4)
+    assert index.partitions is not None
+    assert sorted(np.concatenate(index.partitions)) == list(range(900))
+
+    rows = [0, 123, 456, 899]
+    indices, distances = index.search(encodings[rows] + 0.001, k=1)
+    assert list(indices[:, 0]) == rows
+    assert (distances[:, 0] < 0.05).all()
+
+
+def test_add_appends_and_checks_lengths():
+    index = GalleryIndex(gallery(3), ['a', 'b', 'c'])
+    index.add(gallery(2, seed=1), ['d', 'e'])
+    assert len(index) == 5 and index.names[-1] == 'e'
+    assert index.matrix.shape == (5, 128) and index.norms.shape == (5,)
+    with pytest.raises(ValueError):
+        index.add(gallery(2), ['only one'])
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from encoding_store import EncodingStore
+from gallery_manager import GalleryManager
+
+# Copy-on-write gallery snapshots
+
+
+def row(value):
+    return np.full(128, value, dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Keeps the repository's EncodeFile.p out of the test gallery
+    monkeypatch.chdir(tmp_path)
+    store = EncodingStore(str(tmp_path / 'Encodings'))
+    store.replace_all([row(0.1), row(0.5)], ['Asha_1', 'Varun_1'])
+    return store
+
+
+def test_apply_changes_swaps_in_a_new_snapshot(store):
+    gallery = GalleryManager(encoding_store=store)
+    published = []
+    gallery.add_listener(published.append)
+    before = gallery.snapshot
+    assert before.identities == ('Asha', 'Varun')
+
+    gallery.apply_changes({'Ravi_1': row(0.9), 'Varun_1': row(0.6)}, ['Asha_1'])
+    after = gallery.snapshot
+    assert sorted(after.identities) == ['Ravi', 'Varun']
+    assert after.version == before.version + 1
+    assert published == [after]
+    # Frames still holding the old snapshot see it unchanged
+    assert before.identities == ('Asha', 'Varun')
+
+    [(index, distance)] = after.match([row(0.6)])
+    assert after.names[index] == 'Varun' and distance < 1e-4
+
+
+def test_apply_changes_does_not_reload_what_it_wrote(store):
+    gallery = GalleryManager(encoding_store=store)
+    updates = {'Ravi_1': row(0.9)}
+    store.sync(updates)
+    gallery.apply_changes(updates)
+    assert gallery._signature == store.signature()
+    assert gallery.stats()['reloads'] == 1 and gallery.stats()['updates'] == 1
+
+
+def test_reload_picks_up_another_process_writing_the_store(store):
+    gallery = GalleryManager(encoding_store=store)
+    EncodingStore(store.root).sync({'Ravi_1': row(0.9)}, ['Asha_1'])
+    assert store.signature() != gallery._signature
+
+    gallery.reload()
+    assert sorted(gallery.snapshot.identities) == ['Ravi', 'Varun']
+    assert gallery._signature == store.signature()
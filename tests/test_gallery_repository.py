@@ -0,0 +1,39 @@
+import numpy as np
+
+from encoding_store import EncodingStore
+from gallery_repository import GalleryRepository
+
+# The gallery in the database, as seen by two processes with their own caches
+
+
+def test_signature_changes_on_every_write_even_within_a_second(pool, tmp_path):
+    writer = GalleryRepository(pool, cache=EncodingStore(str(tmp_path / 'writer')))
+    reader = GalleryRepository(pool, cache=EncodingStore(str(tmp_path / 'reader')))
+
+    writer.sync({'Varun_1': np.full(128, 0.1)})
+    seen = reader.signature()
+    # Re-enrolled at once: same row count, same updated_at second
+    writer.sync({'Varun_1': np.full(128, 0.2)})
+    assert reader.signature() != seen
+    seen = reader.signature()
+    writer.sync({'Asha_1': np.full(128, 0.3)}, ['Varun_1'])
+    assert reader.signature() != seen
+
+    matrix, names = reader.load()
+    assert names == ['Asha_1']
+    assert np.allclose(matrix[0], 0.3)
+
+
+def test_load_keeps_cached_samples_the_database_never_saw(pool, tmp_path):
+    cache = EncodingStore(str(tmp_path / 'Encodings'))
+    cache.replace_all(np.full((1, 128), 0.5), ['Ravi_1'])
+    repository = GalleryRepository(pool, cache=cache)
+
+    _, names = repository.load()
+    assert names == ['Ravi_1']
+    assert 'Ravi' in repository.employee_ids()
+
+    # Removed by another process once the database held it: dropped here too
+    GalleryRepository(pool, cache=EncodingStore(str(tmp_path / 'other'))).remove(['Ravi_1'])
+    _, names = repository.load()
+    assert names == []
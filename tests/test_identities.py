@@ -0,0 +1,42 @@
+import numpy as np
+
+from identities import build_identities, identity_name
+
+# Per-photo samples grouped into one identity per employee
+
+
+def test_identity_name_strips_only_the_photo_counter():
+    assert identity_name('Varun_2') == 'Varun'
+    assert identity_name('Mary_Ann_12') == 'Mary_Ann'
+    assert identity_name('Mary_Ann') == 'Mary_Ann'
+    assert identity_name('Varun') == 'Varun'
+    assert identity_name('Agent_007_x') == 'Agent_007_x'
+
+
+def test_one_sample_is_its_own_template():
+    encoding = np.full(128, 0.2, dtype=np.float32)
+    templates, names, report = build_identities([encoding], ['Asha_1'])
+    assert names == ['Asha'] and np.array_equal(templates[0], encoding)
+    assert report == {'identities': 1, 'samples': 1, 'pruned': 0, 'templates': 1}
+
+
+def test_template_plus_spread_out_samples():
+    rng = np.random.default_rng(0)
+    samples = 0.3 + rng.normal(0, 0.01, (6, 128)).astype(np.float32)
+    names = [f'Varun_{i}' for i in range(1, 7)] + ['Asha_1']
+    templates, template_names, report = build_identities(np.vstack([samples, np.zeros((1, 128))]), names,
+                                                         max_samples=3)
+    assert template_names == ['Varun'] * 4 + ['Asha']
+    assert np.allclose(templates[0], samples.mean(axis=0), atol=1e-6)
+    assert report['identities'] == 2 and report['templates'] == 5
+
+
+def test_an_outlier_photo_is_pruned():
+    close = 0.3 + np.random.default_rng(1).normal(0, 0.005, (3, 128))
+    wrong_person = np.full((1, 128), 0.9)
+    templates, names, report = build_identities(np.vstack([close, wrong_person]),
+                                                ['Varun_1', 'Varun_2', 'Varun_3', 'Varun_4'])
+    assert report['pruned'] == 1
+    assert not any(np.allclose(row, wrong_person[0]) for row in templates)
+    # The template is not dragged towards the outlier
+    assert np.abs(templates[0] - 0.3).max() < 0.05
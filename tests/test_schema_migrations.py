@@ -0,0 +1,43 @@
+import schema_migrations
+from schema_migrations import MIGRATIONS, MigrationDeferred, apply_migrations, applied_versions
+
+# Versioned schema changes on the SQLite stand-in (the pool fixture has them all applied)
+
+
+def test_every_migration_is_recorded_once(pool):
+    with pool.connection() as connection:
+        assert applied_versions(connection) == {version for version, _, _ in MIGRATIONS}
+        assert apply_migrations(connection) == []
+
+
+def test_migrations_can_run_again_over_their_own_changes(pool):
+    # As if MySQL auto-committed the DDL of these migrations but not their
+    # schema_version rows before the process died
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM schema_version WHERE version >= 2")
+        connection.commit()
+        cursor.close()
+        assert apply_migrations(connection) == [version for version, _, _ in MIGRATIONS if version >= 2]
+        assert apply_migrations(connection) == []
+
+
+def test_a_deferred_migration_does_not_block_later_ones(pool, monkeypatch):
+    def deferred(connection, cursor):
+        raise MigrationDeferred("orphaned rows")
+
+    last = MIGRATIONS[-1][0]
+    monkeypatch.setattr(schema_migrations, 'MIGRATIONS', [(version, name, deferred if version == 4 else step)
+                                                          for version, name, step in MIGRATIONS])
+    with pool.connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM schema_version WHERE version >= 4")
+        connection.commit()
+        cursor.close()
+        assert apply_migrations(connection) == list(range(5, last + 1))
+        assert 4 not in applied_versions(connection)
+
+    # Retried on the next start once it can go through
+    monkeypatch.undo()
+    with pool.connection() as connection:
+        assert apply_migrations(connection) == [4]
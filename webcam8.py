@@ -1,21 +1,53 @@
-from flask import Flask, render_template, Response, request, redirect, url_for,jsonify
+from flask import Flask, render_template, Response, request, redirect, url_for,jsonify, stream_with_context
+import base64
+import binascii
+import io
 import cv2
+import json
+import logging
 import os
+import queue
 import re
-import pickle
-import face_recognition
-import numpy as np
+import threading
+from collections import OrderedDict
 from EncodeGenrator import EG
+from gallery_manager import GalleryManager
+from gallery_repository import GalleryRepository
+from identities import identity_name
+from camera_manager import CameraManager, camera_config
+from attendance_cache import AttendanceCache
+from attendance_export import export_name, stream_export
+from attendance_writer import AttendanceWriter
+from batch_recognition import recognize_images
+from enrollment import enroll_folder, save_images, zip_images
+from event_bus import EventBus
+from face_backends import create_detector, face_encodings
+from metrics import registry
+from snapshot_store import store as snapshot_store
 from datetime import datetime
-from db_connection import connect_to_database, create_table, insert_image_data, close_connection
+from db_connection import create_pool, create_table
+
+logging.basicConfig(level=os.environ.get('ATTENDANCE_LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 # Initialize the Flask app
 app = Flask(__name__)
 
 
-# Global variables for VideoCapture and database connection
-cap = cv2.VideoCapture(0)
-connection = None
+def publish_attendance(employee_name, status, camera_id=None):
+    attendanceEvents.publish('attendance', {
+        'employee_name': employee_name,
+        'status': status,
+        'camera_id': camera_id,
+    })
+
+# Results of the background writer: remembered by the cache and, for today's
+# attendance, announced (replays and backfills of older days are not)
+def attendance_result(employee_name, result):
+    attendanceCache.record(employee_name, result)
+    if str(result.get('capture_datetime', ''))[:10] == datetime.now().strftime("%Y-%m-%d"):
+        publish_attendance(employee_name, result.get('status'))
 
 @app.route('/')
 def index():
@@ -23,40 +55,122 @@ def index():
     return render_template('main2.html',mode=mode)
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(process_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=None):
+    camera_id = camera_id or cameras.default_camera()
+    if camera_id not in cameras.cameras:
+        return f"Unknown camera {camera_id}", 404
+    return Response(cameras.frames(camera_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+# Server-Sent Events stream of attendance updates. Browsers reconnect on their
+# own and send Last-Event-ID, so updates missed in between are replayed.
+@app.route('/events')
+def events():
+    last_id = request.headers.get('Last-Event-ID', type=int)
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        for event in attendanceEvents.subscribe(last_id):
+            if event is None:
+                # Keeps proxies from closing the stream and notices gone clients
+                yield ': keepalive\n\n'
+                continue
+            event_id, kind, data = event
+            yield f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Attendance API for external clients. The body is one event or
+# {"events": [...]} with up to api_config['max_batch'] of them; each names the
+# employee (employee_name, or matchIndex into gallery.snapshot.identities) and
+# may carry a capture_datetime, a base64 JPEG "image" and an "event_id".
+# Retries are safe: a day is marked at most once per employee and a repeated
+# event_id gets the result it got the first time.
+api_config = {
+    'max_batch': 500,
+    'remembered_ids': 10000,
+}
+_api_results = OrderedDict()
+_api_lock = threading.Lock()
+
+def _mark_event(event):
+    employee_name = event.get('employee_name')
+    matchIndex = event.get('matchIndex')
+    if not employee_name and isinstance(matchIndex, int):
+        empNames = gallery.snapshot.identities
+        if 0 <= matchIndex < len(empNames):
+            employee_name = empNames[matchIndex]  # Get the employee name using the index
+    if not isinstance(employee_name, str) or not employee_name:
+        return {'status': 'error', 'message': 'Unknown employee'}
+    # Photo names like "Varun_2" are accepted for the employee they belong to
+    employee_name = identity_name(employee_name)
+    if employee_name not in galleryRepository.employee_ids() and employee_name not in gallery.snapshot.identities:
+        return {'status': 'error', 'message': f'Unknown employee {employee_name}'}
+
+    capture_datetime = event.get('capture_datetime') or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        datetime.strptime(capture_datetime, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return {'status': 'error', 'message': 'capture_datetime must be yyyy-mm-dd HH:MM:SS'}
+    try:
+        snapshot = base64.b64decode(event['image'], validate=True) if event.get('image') else None
+    except (binascii.Error, TypeError):
+        return {'status': 'error', 'message': 'image must be base64 encoded'}
+
+    today = capture_datetime[:10] == datetime.now().strftime("%Y-%m-%d")
+    if today and attendanceCache.is_marked(employee_name):
+        status = 'already_marked'
+    else:
+        # Older days are checked by the database; the writer reports the outcome on /events
+        attendanceWriter.submit(employee_name, snapshot, capture_datetime)
+        if today:
+            attendanceCache.record(employee_name, {'status': 'queued'})
+        status = 'queued'
+    logger.info("Attendance API: %s %s %s", employee_name, capture_datetime, status)
+    if today:
+        publish_attendance(employee_name, status)
+    return {'status': status, 'employee_name': employee_name}
+
+def mark_event(event):
+    if not isinstance(event, dict):
+        return {'status': 'error', 'message': 'Each event must be a JSON object'}
+    event_id = event.get('event_id')
+    if event_id is not None:
+        with _api_lock:
+            if str(event_id) in _api_results:
+                return _api_results[str(event_id)]
+    result = _mark_event(event)
+    if event_id is not None and result['status'] != 'error':
+        result['event_id'] = event_id
+        with _api_lock:
+            _api_results[str(event_id)] = result
+            while len(_api_results) > api_config['remembered_ids']:
+                _api_results.popitem(last=False)
+    return result
 
 @app.route('/mark_attendance', methods=['POST'])
 def mark_attendance():
-    data = request.json
-    matchIndex = data.get('matchIndex')
-    print(matchIndex)
-    realtime_image_path = data.get('realtime_image_path')
-    face_detected = data.get('face_detected')
-
-    if matchIndex is not None and 0 <= matchIndex < len(empNames):
-        employee_name = empNames[matchIndex]  # Get the employee name using the index
-        print(f"Marking attendance for: {employee_name}")
-
-        # Assuming connection is your database connection
-        result = insert_image_data(connection, employee_name, realtime_image_path, face_detected)
-        print(result)
-        print(jsonify(result))
-        return jsonify(result)
-
-
-
-# Load the encoding file if it exists
-encodeListKnown, empNames = [], []
-if os.path.exists('EncodeFile.p'):
-    with open('EncodeFile.p', 'rb') as file:
-        encodeListKnownWithNames = pickle.load(file)
-        encodeListKnown, empNames = encodeListKnownWithNames
-
-if connection is None:
-    connection = connect_to_database()
-    if connection:
-        create_table(connection)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Expected a JSON object'}), 400
+    batch = data.get('events') if 'events' in data else None
+    if batch is None:
+        return jsonify(mark_event(data))
+    if not isinstance(batch, list) or not batch:
+        return jsonify({'status': 'error', 'message': 'events must be a non-empty list'}), 400
+    if len(batch) > api_config['max_batch']:
+        return jsonify({'status': 'error', 'message': f"At most {api_config['max_batch']} events per request"}), 413
+    return jsonify({'results': [mark_event(event) for event in batch]})
+
+
+# Hand an attendance event to the background writer; never waits on the database
+def queue_attendance(employee_name, frame):
+    attendanceWriter.submit(employee_name, snapshot_store.encode(frame))
+    result = {'status': 'queued'}
+    attendanceCache.record(employee_name, result)
+    publish_attendance(employee_name, 'queued')
+    return result
 
 def get_image_counter(employee_name):
     image_counter = 1
@@ -72,80 +186,139 @@ def get_image_counter(employee_name):
 
     return image_counter
 
-def process_frame():
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-
-        if not ret:
-            print("Error: Failed to capture frame from camera.")
-            break
-
-        # Detect faces and encodings in the current frame
-        frameS = cv2.resize(frame, (0, 0), None, 0.25, 0.25)
-        frameS = cv2.cvtColor(frameS, cv2.COLOR_BGR2RGB)
-
-        faceCurrFrame = face_recognition.face_locations(frameS)
-        encodeCurrFrame = face_recognition.face_encodings(frameS, faceCurrFrame)
-
-        face_detected = False
-        for encodeFace, faceLoc in zip(encodeCurrFrame, faceCurrFrame):
-            matches = face_recognition.compare_faces(encodeListKnown, encodeFace)
-            faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
-
-            if faceDis.size > 0:
-                matchIndex = np.argmin(faceDis)
-
-                # Define a custom threshold for strict matching
-                threshold = 0.5
-
-                if matches[matchIndex] and faceDis[matchIndex] <= threshold:
-                    face_detected = True
-                    print("Known Face Detected.")
-                    capture_date = datetime.now().strftime("%d-%m-%y")
-                    capture_time = datetime.now().strftime("%I:%M:%S%p")
-                    print(f"Detected: {empNames[matchIndex]} at {capture_time} on {capture_date}")
-
-                    realtime_image_path = f'Employee_Images/{empNames[matchIndex]}_realtime.jpg'
-                    cv2.imwrite(realtime_image_path, frame)
-                    dict_value = insert_image_data(connection, empNames[matchIndex], realtime_image_path, face_detected)
-                    print(f'status value==  {dict_value}')
-                    os.remove(realtime_image_path)
-
-                if face_detected:
-                    top, right, bottom, left = faceLoc
-                    top, right, bottom, left = top * 4, right * 4, bottom * 4, left * 4
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    # Split empNames[matchIndex] at underscore and take the first part
-                    empName = empNames[matchIndex].split('_')[0]
-                    cv2.putText(frame, empName, (left + 6, top - 20), cv2.FONT_HERSHEY_TRIPLEX,
-                                0.75, (255, 0, 0), 1)
-
-        #For Debug
-        #cv2.imshow('FaceAttendance', frame)
-
-        # Encode the frame to PNG format
-        ret, buffer = cv2.imencode('.png', frame)
-        frame_bytes = buffer.tobytes()
-
-        # Yield the output frame in byte format
-        yield (b'--frame\r\n'
-               b'Content-Type: image/.png\r\n\r\n' + frame_bytes + b'\r\n')
+# Detections reported by the camera processes
+def handle_detection(camera_id, employee_name, capture_datetime, snapshot):
+    # Already marked today or tried moments ago: no disk write, no DB round trip
+    if not attendanceCache.should_mark(employee_name):
+        if attendanceCache.is_marked(employee_name):
+            publish_attendance(employee_name, 'already_marked', camera_id)
+        return
+    logger.info("Detected: %s on camera %s at %s", employee_name, camera_id, capture_datetime)
+    attendanceWriter.submit(employee_name, snapshot, capture_datetime)
+    attendanceCache.record(employee_name, {'status': 'queued'})
+    publish_attendance(employee_name, 'queued', camera_id)
+
+# /capture_image detects with the camera's own backend; created on first use
+_capture_detectors = {}
+
+def capture_detector(camera_id):
+    if camera_id not in _capture_detectors:
+        options = cameras.detection[camera_id]
+        _capture_detectors[camera_id] = create_detector(options['backend'], **options['backend_options'])
+    return _capture_detectors[camera_id]
+
+@app.route('/pipeline_stats')
+def pipeline_stats():
+    stats = {'cameras': cameras.stats(), 'recognition_service': cameras.batching_stats()}
+    stats['attendance_cache'] = attendanceCache.stats()
+    stats['attendance_writer'] = attendanceWriter.stats()
+    stats['db_pool'] = db_pool.stats()
+    stats['gallery'] = gallery.stats()
+    stats['gallery']['repository'] = galleryRepository.stats()
+    stats['events'] = attendanceEvents.stats()
+    return jsonify(stats)
+
+# Prometheus scrape target: this process plus what the camera and recognition
+# service processes last reported
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(list(cameras.remote_metrics.values())), mimetype='text/plain; version=0.0.4')
+
+# Streamed attendance download:
+#   /export_attendance?start=2024-05-01&end=2024-05-31&employee=Varun&format=xlsx&images=1
+# The rows are read chunk by chunk while the response is being sent
+@app.route('/export_attendance')
+def export_attendance():
+    start = request.args.get('start') or datetime.now().strftime("%Y-%m-%d")
+    end = request.args.get('end') or None
+    employees = request.args.getlist('employee')
+    fmt = request.args.get('format', 'csv')
+    images = request.args.get('images') in ('1', 'true', 'yes')
+    try:
+        for day in filter(None, (start, end)):
+            datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        return "Dates must be in yyyy-mm-dd format.", 400
+    if fmt not in ('csv', 'xlsx'):
+        return f"Unknown export format {fmt}", 400
+
+    def generate():
+        with db_pool.connection() as connection:
+            yield from stream_export(connection, start, end, employees, fmt, images)
+
+    filename = export_name(start, end) + ('.zip' if images else '.' + fmt)
+    mimetype = 'application/zip' if images else ('text/csv' if fmt == 'csv' else
+                                                 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Offline batch processing. Photos are posted as multipart "images" files (zip
+# archives are unpacked) and one JSON line per image is streamed back as soon as
+# it is done; the work runs in a process pool, not in the camera processes.
+def _uploaded_images():
+    for upload in request.files.getlist('images'):
+        data = upload.read()
+        if (upload.filename or '').lower().endswith('.zip'):
+            yield from zip_images(io.BytesIO(data))
+        else:
+            yield upload.filename or 'upload.jpg', data
+
+# {"image": ..., "faces": [{"box", "employee_name", "distance"}]} per photo
+@app.route('/batch/recognize', methods=['POST'])
+def batch_recognize():
+    # Read before streaming: the uploads are closed once the view returns
+    images = list(_uploaded_images())
+    if not images:
+        return "Post the photos as multipart 'images' files.", 400
+
+    def generate():
+        for result in recognize_images(images, gallery):
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Photos named like capture_image's ("Varun_3.jpg") are saved to Employee_Images
+# and enrolled; {"image", "status", "error"} per photo, then {"report": ...}
+@app.route('/batch/enroll', methods=['POST'])
+def batch_enroll():
+    saved = save_images(_uploaded_images(), 'Employee_Images')
+    if not saved:
+        return "Post the photos (or a zip of them) as multipart 'images' files.", 400
+
+    results = queue.Queue()
+
+    def run():
+        try:
+            report = enroll_folder('Employee_Images', progress=False, on_change=gallery.apply_changes,
+                                   store=galleryRepository,
+                                   on_result=lambda image, status, error: results.put(
+                                       {'image': image, 'status': status, 'error': error}))
+            results.put({'report': report})
+        except Exception as e:
+            logger.exception("Batch enrollment failed")
+            results.put({'error': str(e)})
+        results.put(None)
+
+    threading.Thread(target=run, name='batch-enroll', daemon=True).start()
+
+    def generate():
+        while True:
+            result = results.get()
+            if result is None:
+                return
+            yield json.dumps(result) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
 
 @app.route('/capture_image', methods=['POST'])
 def capture_image():
-    global cap
-    global connection
-
-    # Load the encoding file if it exists
-    if os.path.exists('EncodeFile.p'):
-        with open('EncodeFile.p', 'rb') as file:
-            encodeListKnownWithNames = pickle.load(file)
-            encodeListKnown, empNames = encodeListKnownWithNames
+    # The camera process owns the device; ask it for its latest frame
+    camera_id = request.form.get('camera_id') or cameras.default_camera()
+    if camera_id not in cameras.cameras:
+        return f"Unknown camera {camera_id}", 404
+    frame = cameras.latest_frame(camera_id)
 
-    ret, frame = cap.read()
-
-    if not ret:
+    if frame is None:
         return "Error: Failed to capture frame from camera.", 500
 
     employee_name = request.form.get('employee_name')
@@ -156,59 +329,73 @@ def capture_image():
 
         realtime_image_path = f'Employee_Images/{employee_name}_{image_counter}.jpg'
         cv2.imwrite(realtime_image_path, frame)
-        print(f"Image saved as {realtime_image_path}")
+        logger.info("Image saved as %s", realtime_image_path)
         image_counter += 1
 
-        # Generate encodings and save the encoding file
-        EG(realtime_image_path)
-
-        # Reload the encoding file
-        if os.path.exists('EncodeFile.p'):
-            with open('EncodeFile.p', 'rb') as file:
-                encodeListKnownWithNames = pickle.load(file)
-                encodeListKnown, empNames = encodeListKnownWithNames
-
-        # Debugging prints
-        print(f"Loaded encodings: {encodeListKnown}")
-        print(f"Employee names: {empNames}")
+        # Generate encodings, save them and swap them into the live gallery
+        EG(realtime_image_path, on_change=gallery.apply_changes, store=galleryRepository)
+        snapshot = gallery.snapshot
+        logger.info("Gallery now has %d identities.", len(snapshot.identities))
 
         # Directly perform face detection on the captured frame
         frameS = cv2.resize(frame, (0, 0), None, 0.25, 0.25)
+        faceCurrFrame = capture_detector(camera_id).detect(frameS)
         frameS = cv2.cvtColor(frameS, cv2.COLOR_BGR2RGB)
+        encodeCurrFrame = face_encodings(frameS, faceCurrFrame)
 
-        faceCurrFrame = face_recognition.face_locations(frameS)
-        encodeCurrFrame = face_recognition.face_encodings(frameS, faceCurrFrame)
+        for (matchIndex, faceDis), faceLoc in zip(snapshot.match(encodeCurrFrame), faceCurrFrame):
+            if matchIndex is not None and attendanceCache.should_mark(snapshot.names[matchIndex]):
+                capture_date = datetime.now().strftime("%d-%m-%y")
+                capture_time = datetime.now().strftime("%I:%M:%S%p")
+                logger.info("Detected: %s at %s on %s", snapshot.names[matchIndex], capture_time, capture_date)
 
-        face_detected = False
-        for encodeFace, faceLoc in zip(encodeCurrFrame, faceCurrFrame):
-            matches = face_recognition.compare_faces(encodeListKnown, encodeFace)
-            faceDis = face_recognition.face_distance(encodeListKnown, encodeFace)
-
-            if faceDis.size > 0:
-                matchIndex = np.argmin(faceDis)
-
-                # Define a custom threshold for strict matching
-                threshold = 0.5
-
-                if matches[matchIndex] and faceDis[matchIndex] <= threshold:
-                    face_detected = True
-                    print("Known Face Detected.")
-                    capture_date = datetime.now().strftime("%d-%m-%y")
-                    capture_time = datetime.now().strftime("%I:%M:%S%p")
-                    print(f"Detected: {empNames[matchIndex]} at {capture_time} on {capture_date}")
-
-                    realtime_image_path = f'Employee_Images/{empNames[matchIndex]}_realtime.jpg'
-                    cv2.imwrite(realtime_image_path, frame)
-                    insert_image_data(connection, empNames[matchIndex], realtime_image_path, face_detected)
-                    os.remove(realtime_image_path)
+                queue_attendance(snapshot.names[matchIndex], frame)
 
     return redirect(url_for('index'))
 
+# Global variables for the database connection pool, attendance bookkeeping and
+# cameras. The camera and worker processes are started with forkserver, which
+# imports this script again (as __mp_main__) in each of them, so only the web
+# process sets these up.
+def start_services():
+    global db_pool, galleryRepository, attendanceCache, attendanceEvents, attendanceWriter, gallery, cameras
+    db_pool = create_pool()
+    # The employee table and encodings in the database; the Encodings folder caches them
+    galleryRepository = GalleryRepository(db_pool)
+    attendanceCache = AttendanceCache()
+    # Attendance updates pushed to the browsers over /events
+    attendanceEvents = EventBus()
+
+    attendanceWriter = AttendanceWriter(db_pool, on_result=attendance_result,
+                                        employee_ids=galleryRepository.employee_ids)
+    attendanceWriter.start()
+
+    try:
+        with db_pool.connection() as connection:
+            create_table(connection)
+            attendanceCache.warm(connection)
+    except Exception as e:
+        logger.error("Database setup failed: %s", e)
+
+    # Load the gallery once from the database (bulk, with the employee ids);
+    # enrollments and changes from other processes are swapped in without
+    # reloading it per request
+    gallery = GalleryManager(encoding_store=galleryRepository)
+    gallery.start_watching()
+
+    # Every camera runs capture and recognition in its own process; the processes
+    # are started by the first request that needs them
+    cameras = CameraManager(gallery=gallery, on_detection=handle_detection, **camera_config)
+
+if __name__ != '__mp_main__':
+    start_services()
+
 if __name__ == "__main__":
     app.run(debug=True)
 
-    if cap.isOpened():
-        cap.release()
+    attendanceEvents.close()
+    cameras.stop()
+    gallery.stop()
+    attendanceWriter.stop()
 
-    if connection:
-        close_connection(connection)
+    db_pool.close()